@@ -12,6 +12,7 @@ from app.models.conversation import Conversation
 from app.models.user import User
 from app.models.character import Character
 from app.models.document import Document
+from app.models.ingestion_job import IngestionJob
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
 config = context.config
@@ -0,0 +1,39 @@
+"""Add character_id to documents
+
+Revision ID: 4b7d2e9a1c36
+Revises: c10944dd73a2
+Create Date: 2026-10-16 23:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4b7d2e9a1c36'
+down_revision: Union[str, None] = 'c10944dd73a2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Existing documents stay shared; their already-embedded chunks are tagged
+    # with the shared scope by the startup backfill (SCOPE_BACKFILL_ON_STARTUP)
+    # Batch mode so the foreign key can be added on SQLite
+    with op.batch_alter_table('documents') as batch_op:
+        batch_op.add_column(sa.Column('character_id', sa.Integer(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_documents_character_id'), ['character_id'], unique=False)
+        batch_op.create_foreign_key(
+            'fk_documents_character_id_characters', 'characters', ['character_id'], ['id'], ondelete='SET NULL'
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('documents') as batch_op:
+        batch_op.drop_constraint('fk_documents_character_id_characters', type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_documents_character_id'))
+        batch_op.drop_column('character_id')
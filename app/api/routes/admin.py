@@ -1,5 +1,5 @@
 from pathlib import Path
-from typing import Any, List
+from typing import Any, List, Optional
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
 from sqlalchemy.orm import Session
 import os
@@ -9,8 +9,19 @@ import asyncio
 from app import crud, models, schemas
 from app.dependencies import get_current_admin_user, get_current_active_user,get_current_super_admin_user
 from app.db.session import get_db
-from app.models.document import DocumentType
+from app.models.document import DocumentType, UNASSIGNED_STATUS
 from app.services.scheduler import update_refresh_interval, document_scheduler
+from app.services.embedding_cache import query_embedding_cache
+from app.services.response_cache import response_cache
+from app.services.character_cache import character_cache
+from app.services.chroma_utils import (
+    backfill_document_scopes, delete_from_chroma, invalidate_answers, rebuild_lexical_index, set_document_scope
+)
+from app.services.ingestion_queue import ingestion_queue
+from app.services.text_extraction import extraction_pool
+from app.services.lexical_index import lexical_index
+from app.services.retrieval_cache import retrieval_cache
+from app.services.vector_store import vector_store
 from pydantic import BaseModel
 
 router = APIRouter()
@@ -20,6 +31,11 @@ class RefreshIntervalUpdate(BaseModel):
     enabled: bool = True
 
 
+class DocumentCharacterUpdate(BaseModel):
+    # Character.id to scope the document to; None shares it with every character
+    character_id: Optional[int] = None
+
+
 @router.get("/characters", response_model=List[schemas.CharacterWithDocuments])
 def get_characters(
     db: Session = Depends(get_db),
@@ -90,7 +106,11 @@ def update_character(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Character not found",
         )
+    previous_character_id = character.character_id
     character = crud.characters.update(db, db_obj=character, obj_in=character_in)
+    for character_id in {previous_character_id, character.character_id}:
+        character_cache.invalidate(character_id)
+        response_cache.invalidate_character(character_id)
     return character
 
 @router.post("/characters/{id}/image")
@@ -128,6 +148,7 @@ def upload_character_image(
     image_url = f"/static/uploads/characters/{filename}"
     character_update = schemas.CharacterUpdate(image_url=image_url)
     character = crud.characters.update(db=db, db_obj=character, obj_in=character_update)
+    character_cache.invalidate(character.character_id)
     
     return {"filename": filename, "image_url": image_url}
 
@@ -147,6 +168,19 @@ def delete_character(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Character not found",
         )
+    character_cache.invalidate(character.character_id)
+    response_cache.invalidate_character(character.character_id)
+    # The character's private documents must not become shared: their chunks are
+    # deleted and the rows are left unassigned (ON DELETE SET NULL) and unembedded
+    # until an admin assigns them to another character and embeds them again
+    for document in crud.documents.get_by_character(db, character_id=id):
+        if document.is_embedded:
+            delete_from_chroma(document.id, character.character_id)
+        crud.documents.update(
+            db,
+            db_obj=document,
+            obj_in={"character_id": None, "is_embedded": False, "embedding_status": UNASSIGNED_STATUS},
+        )
     character = crud.characters.delete(db, id=id)
     return character
 
@@ -199,7 +233,7 @@ async def create_document(
     """
     # Validate character exists if character_id is provided
     if character_id:
-        character = crud.characters.get(db, id=character_id)
+        character = crud.characters.get_character(db, id=character_id)
         if not character:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -263,7 +297,8 @@ async def create_document(
         )
     
     
-    # TODO: Trigger embedding process asynchronously
+    # Embed in the background; the job can be followed under /embed/documents/jobs
+    ingestion_queue.enqueue(db, document_id=document.id)
     
     return document
 
@@ -286,6 +321,53 @@ def get_document(
         )
     return document
 
+@router.put("/documents/{id}/character", response_model=schemas.DocumentInfo)
+def update_document_character(
+    *,
+    db: Session = Depends(get_db),
+    id: int,
+    update_in: DocumentCharacterUpdate,
+    current_user: User = Depends(get_current_admin_user),
+) -> Any:
+    """
+    Assign a document to a character, or share it with all characters.
+    Embedded chunks are re-tagged in place; no re-embedding is needed.
+    """
+    document = crud.documents.get(db, id=id)
+    if not document:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Document not found",
+        )
+    character = None
+    if update_in.character_id:
+        character = crud.characters.get_character(db, id=update_in.character_id)
+        if not character:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Character not found",
+            )
+    previous_key = document.character.character_id if document.character else None
+    document = crud.documents.update(
+        db, db_obj=document, obj_in={"character_id": character.id if character else None}
+    )
+    if document.is_embedded:
+        set_document_scope(document.id, document.character_id)
+        invalidate_answers(previous_key)
+        invalidate_answers(character.character_id if character else None)
+    return document
+
+@router.post("/documents/sync-scopes")
+def sync_document_scopes(
+    current_user: User = Depends(get_current_admin_user),
+) -> Any:
+    """
+    Tag every embedded chunk with its document's character scope.
+    Also run at startup (SCOPE_BACKFILL_ON_STARTUP) for documents embedded
+    before character scoping existed.
+    """
+    return backfill_document_scopes()
+
 # Add this new route to your existing documents.py file
 
 @router.get("/documents/{document_id}/content", response_model=str)
@@ -615,6 +697,69 @@ async def get_document_refresh_status(
         "total": total,
         "last_refresh": document_scheduler.last_refresh_time.isoformat() if document_scheduler.last_refresh_time else None
     }
+@router.get("/cache/stats", response_model=dict)
+def get_cache_stats(
+    current_user: User = Depends(get_current_admin_user),
+) -> Any:
+    """
+    Get hit/miss statistics for the chat path caches
+    """
+    return {
+        "query_embeddings": query_embedding_cache.stats(),
+        "responses": response_cache.stats(),
+        "characters": character_cache.stats(),
+        "retrievals": retrieval_cache.stats(),
+    }
+
+@router.get("/ingestion/stats", response_model=dict)
+def get_ingestion_stats(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user),
+) -> Any:
+    """
+    Get ingestion job counts by status, worker outcome counters and
+    text extraction pool counters
+    """
+    return {**ingestion_queue.stats(db), "extraction": extraction_pool.stats()}
+
+@router.post("/vector-store/migrate")
+def migrate_vector_store(
+    source_backend: str = "chroma",
+    current_user: User = Depends(get_current_admin_user),
+) -> Any:
+    """
+    Copy existing embeddings into the configured retrieval index.
+    Run once after changing RETRIEVAL_BACKEND or EMBEDDING_DIMENSIONS;
+    vectors are truncated to the new size without re-embedding.
+    """
+    try:
+        migrated = vector_store.migrate(source_backend=source_backend)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e),
+        )
+    # Cached answers were retrieved from the previous index
+    response_cache.invalidate_all()
+    retrieval_cache.clear()
+    return {
+        "migrated": migrated,
+        "backend": vector_store.backend,
+        "collection": vector_store.collection_name,
+        "count": vector_store.count(),
+    }
+
+@router.post("/lexical-index/rebuild")
+def rebuild_lexical_index_endpoint(
+    current_user: User = Depends(get_current_admin_user),
+) -> Any:
+    """
+    Rebuild the BM25 keyword index from the chunks in the vector store.
+    An empty index is rebuilt automatically at startup.
+    """
+    indexed = rebuild_lexical_index()
+    return {"indexed": indexed, **lexical_index.stats()}
+
 @router.delete("/documents/{id}", response_model=schemas.DocumentInfo)
 def delete_document(
     *,
@@ -6,8 +6,11 @@ from app.db.session import get_db
 from app.models.user import User
 from app.dependencies import get_current_active_user
 from app.schemas.document import DocumentCreate, DocumentResponse, EmbedRequest
+from app.schemas.ingestion_job import IngestionJob
 from app.services.embedding import process_document
+from app.services.ingestion_queue import ingestion_queue
 from app.crud.documents import create, get_multi, get, delete,get_by_user, update_document_status
+from app.crud import ingestion_jobs
 import app.models.document as models
 import app.crud.documents as crud
 router = APIRouter(prefix="/documents", tags=["documents"])
@@ -62,6 +65,47 @@ async def read_documents(
     documents = get_documents(db, skip=skip, limit=limit, character_id=character_id)
     return documents
 
+@router.get("/jobs", response_model=List[IngestionJob])
+async def read_ingestion_jobs(
+    status: Optional[str] = None,
+    document_id: Optional[int] = None,
+    skip: int = 0,
+    limit: int = 100,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """List ingestion jobs, newest first, optionally filtered by status or document."""
+    # Non-admins only see jobs for documents they uploaded
+    uploaded_by = None
+    if not current_user.is_admin and not current_user.is_superuser:
+        uploaded_by = current_user.id
+    return ingestion_jobs.get_multi(
+        db, status=status, document_id=document_id, uploaded_by=uploaded_by, skip=skip, limit=limit
+    )
+
+@router.get("/jobs/{job_id}", response_model=IngestionJob)
+async def read_ingestion_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Get the status and progress of one ingestion job."""
+    job = ingestion_jobs.get(db, id=job_id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    # Check permissions
+    if not current_user.is_admin and not current_user.is_superuser:
+        document = get(db, id=job.document_id)
+        if not document or document.uploaded_by != current_user.id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Not enough permissions to view this job"
+            )
+    return job
+
 @router.get("/{document_id}", response_model=DocumentResponse)
 async def read_document(
     document_id: int,
@@ -156,7 +200,7 @@ def get_document_content(
             status_code=422,
             detail="Content preview not available for file type documents",
         )
-@router.post("/{document_id}/embed", response_model=Dict[str, Any])
+@router.post("/{document_id}/embed", response_model=Dict[str, Any], status_code=status.HTTP_202_ACCEPTED)
 async def embed_document(
     # document_id: int,
     # reembed: bool = False,
@@ -169,7 +213,7 @@ async def embed_document(
 
 
 ):
-    """Start the embedding process for a document and wait for completion."""
+    """Queue the embedding process for a document and return its job id right away."""
     # Check permissions
     if not current_user.is_admin and not current_user.is_superuser:
         # Get the document to check ownership
@@ -195,25 +239,11 @@ async def embed_document(
             "document_id": document.id
         }
     
-    # Update status to processing
-    update_document_status(db, id=document_id, is_embedded=False, status="processing")
-    
-    # Process document synchronously - wait for completion
-    await process_document(document_id, db, reembed)
-    
-    # Get updated document status
-    updated_document = get(db, id=document_id)
-    
-    # Return final result
-    if updated_document.is_embedded:
-        return {
-            "message": "Document embedding completed successfully",
-            "status": "embedded",
-            "document_id": document.id
-        }
-    else:
-        return {
-            "message": "Document embedding failed",
-            "status": "failed",
-            "document_id": document.id
-        }
\ No newline at end of file
+    # Run in the ingestion workers; poll GET /jobs/{job_id} for progress
+    job = ingestion_queue.enqueue(db, document_id=document_id, reembed=reembed)
+    return {
+        "message": "Document embedding queued",
+        "status": job.status,
+        "document_id": document.id,
+        "job_id": job.id
+    }
\ No newline at end of file
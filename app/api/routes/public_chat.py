@@ -1,17 +1,41 @@
-from typing import Any, Dict, List
-from fastapi import APIRouter, Depends, HTTPException, status
+import asyncio
+import json
+import logging
+import time
+from dataclasses import dataclass
+from collections import deque
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Response, WebSocket, WebSocketDisconnect, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
-# from app.services.embedding import hybrid_query_documents 
-from app.db.session import get_db
-from app.dependencies import get_api_key
-from app.crud import characters, conversation
-from app.services.embedding import query_documents # Add this line
+from app.services.embedding import hybrid_query_documents
+from app.db.session import get_db, SessionLocal
+from app.dependencies import API_KEY_NAME, admit_chat_request, is_valid_api_key, too_many_requests
+from app.crud import conversation
+from app.core.config import settings
+from app.services.conversation_writer import conversation_writer
+from app.services.embedding import query_documents, query_documents_batch # Add this line
+from app.services.embedding_client import embed_queries, embed_query
+from app.services.response_cache import USER_ID_PLACEHOLDER, personalize, response_cache
+from app.services.embedding_cache import normalize_query
+from app.services.single_flight import SingleFlight
+from app.services.character_cache import character_cache
 # from app.services.rag import query_documents
-from app.services.llm import generate_response
+from app.services.llm import generate_response, stream_response
+from app.services.timing import StageTimings
+from app.services.metrics import character_label, count_request, observe_stages
+from app.services.admission import AdmissionRejected, AdmissionTicket, admission_controller
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# In-flight answers for /chat, keyed on (character_id, normalized message)
+chat_flights = SingleFlight()
+
 
 class PublicChatRequest(BaseModel):
     user_id: str
@@ -23,49 +47,29 @@ class PublicChatResponse(BaseModel):
     response: str
 
 
-@router.post("/chat", response_model=PublicChatResponse)
-async def public_chat(
-    *,
-    db: Session = Depends(get_db),
-    chat_request: PublicChatRequest,
-    api_key: Any = Depends(get_api_key)
-) -> Any:
+class PublicChatBatchRequest(BaseModel):
+    items: List[PublicChatRequest]
+
+
+class PublicChatBatchItemResult(BaseModel):
+    index: int
+    user_id: str
+    character_id: Any
+    response: Optional[str] = None
+    error: Optional[str] = None
+
+
+class PublicChatBatchResponse(BaseModel):
+    results: List[PublicChatBatchItemResult]
+    # Set when the answered turns could not be saved to conversation history
+    persistence_error: Optional[str] = None
+
+
+def format_context(relevant_docs: List[Dict[str, Any]]) -> List[str]:
     """
-    Public chat endpoint that requires an API key.
-    Maintains conversation history for each user-character pair.
+    Format retrieved document chunks with their source metadata, keeping
+    relevance order; the LLM prompt assembler fits them into its token budget.
     """
-    # Validate character exists
-    character = characters.get_by_character_id(db, character_id=chat_request.character_id)
-    if not character:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Character not found"
-        )
-    
-    # Get conversation history
-    conversation_history = conversation.get_user_character_history(
-        db, 
-        user_id=chat_request.user_id, 
-        character_id=chat_request.character_id
-    )
-    
-    # Format conversation history for the LLM
-    formatted_history = []
-    for conv in reversed(conversation_history):  # Oldest first
-        formatted_history.append({"role": "user", "content": conv.message})
-        formatted_history.append({"role": "assistant", "content": conv.response})
-    
-    # Retrieve relevant documents using RAG
-    relevant_docs = await query_documents(
-        character_id=character.character_id,
-        query_text=chat_request.message, # Changed 'query' to 'query_text'
-        top_k=7                         # Changed 'limit' to 'top_k'
-    )
-    # relevant_docs = await hybrid_query_documents(
-    # character_id=character.character_id,
-    # query_text=chat_request.message,
-    # top_k=7)
-    # Extract context from relevant docs with metadata
     formatted_docs = []
     for doc in relevant_docs:
         # Format each document with its metadata
@@ -83,26 +87,545 @@ async def public_chat(
         
         formatted_docs.append(doc_text)
 
-    # Join all formatted documents
-    context = "\n\n---\n\n".join(formatted_docs)
-    print ('Documents retrieved >>', context)
-
-    # Generate response using LLM
-    response = await generate_response(
-        character=character,
-        message=chat_request.message,
-        user_id=chat_request.user_id,
-        context=context,
-        conversation_history=formatted_history
+    return formatted_docs
+
+
+@dataclass
+class ChatAnswer:
+    """Result of the shared answer stage; response is a user-neutral template."""
+    character: Any
+    query_embedding: List[float]
+    response_template: str
+
+
+def _load_character(chat_request: PublicChatRequest, timings: StageTimings) -> Any:
+    """
+    Resolve the character snapshot. Uses a dedicated session because the
+    shared answer stage can outlive the request that started it.
+    """
+    with timings.stage("character_lookup"):
+        db = SessionLocal()
+        try:
+            return character_cache.get(db, chat_request.character_id)
+        finally:
+            db.close()
+
+
+def _load_history(
+    db: Session, chat_request: PublicChatRequest, timings: StageTimings
+) -> List[Dict[str, str]]:
+    """DB stage: load this user's recent history with the character."""
+    # Get conversation history
+    with timings.stage("history_load"):
+        conversation_history = conversation.get_user_character_history(
+            db, 
+            user_id=chat_request.user_id, 
+            character_id=chat_request.character_id
+        )
+    
+    # Format conversation history for the LLM
+    formatted_history = []
+    for conv in reversed(conversation_history):  # Oldest first
+        formatted_history.append({"role": "user", "content": conv.message})
+        formatted_history.append({"role": "assistant", "content": conv.response})
+    return formatted_history
+
+
+async def _embed_and_check_cache(
+    chat_request: PublicChatRequest, timings: StageTimings
+) -> Tuple[List[float], Optional[str]]:
+    """
+    Embed the message and check the response cache.
+    Returns (query_embedding, cached_template); the template is None on a miss.
+    """
+    # Embed the message once; it is shared by the response cache and retrieval
+    with timings.stage("query_embedding"):
+        query_embedding = await embed_query(chat_request.message)
+    
+    # Serve near-duplicate questions from the per-character response cache
+    return query_embedding, response_cache.lookup_template(chat_request.character_id, query_embedding)
+
+
+async def _retrieve_context(
+    chat_request: PublicChatRequest, character: Any, query_embedding: List[float], timings: StageTimings
+) -> List[str]:
+    """Retrieval stage: fetch the RAG context from the character's and the shared documents."""
+    with timings.stage("vector_query"):
+        relevant_docs = await hybrid_query_documents(
+            character_id=character.id,
+            query_text=chat_request.message,
+            top_k=settings.RETRIEVAL_TOP_K,
+            query_embedding=query_embedding
+        )
+    context = format_context(relevant_docs)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Documents retrieved >>\n" + "\n\n---\n\n".join(context))
+    return context
+
+
+async def _resolve_and_retrieve(
+    chat_request: PublicChatRequest, timings: StageTimings
+) -> Tuple[Any, List[float], Optional[str], List[str]]:
+    """
+    Run the character lookup in the threadpool while the message is embedded on
+    the event loop, then run the vector query scoped to the character.
+    Raises 404 for unknown characters.
+    """
+    character, (query_embedding, cached_template) = await asyncio.gather(
+        run_in_threadpool(_load_character, chat_request, timings),
+        _embed_and_check_cache(chat_request, timings),
     )
+    if not character:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Character not found"
+        )
+    if cached_template is not None:
+        return character, query_embedding, cached_template, []
+    context = await _retrieve_context(chat_request, character, query_embedding, timings)
+    return character, query_embedding, None, context
+
+
+async def _answer(chat_request: PublicChatRequest, timings: StageTimings) -> ChatAnswer:
+    """
+    Shared answer stage: retrieval plus the LLM call, run once per in-flight
+    (character, message) key. Per-user history is not part of the prompt (see
+    generate_response), and the prompt is given the user id placeholder rather
+    than the leader's id, so the answer is a template every coalesced caller
+    can personalize.
+    """
+    character, query_embedding, template, context = await _resolve_and_retrieve(chat_request, timings)
     
-    # Save the conversation
-    conversation.create_conversation(
-        db,
-        user_id=chat_request.user_id,
-        character_id=chat_request.character_id,
-        message=chat_request.message,
-        response=response
+    if template is None:
+        # Generate response using LLM, failing fast if every LLM slot is taken
+        try:
+            with admission_controller.llm_slot(), timings.stage("llm"):
+                template = await generate_response(
+                    character=character,
+                    message=chat_request.message,
+                    user_id=USER_ID_PLACEHOLDER,
+                    context=context,
+                    conversation_history=[]
+                )
+        except AdmissionRejected as rejection:
+            raise too_many_requests(rejection)
+        
+        response_cache.store_template(character.character_id, query_embedding, template)
+    return ChatAnswer(character, query_embedding, template)
+
+
+def _sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Encode one Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.post("/chat", response_model=PublicChatResponse)
+async def public_chat(
+    *,
+    chat_request: PublicChatRequest,
+    http_response: Response,
+    admission: AdmissionTicket = Depends(admit_chat_request)
+) -> Any:
+    """
+    Public chat endpoint that requires an API key.
+    Maintains conversation history for each user-character pair.
+    Stage durations are returned in the Server-Timing header.
+    """
+    timings = StageTimings()
+    
+    # Identical concurrent messages to the same character share one answer
+    key = (str(chat_request.character_id), normalize_query(chat_request.message))
+    with timings.stage("answer"):
+        answer, shared = await chat_flights.run(key, lambda: _answer(chat_request, timings))
+    if shared:
+        logger.info(f"Coalesced chat request for character {chat_request.character_id}")
+    response = personalize(answer.response_template, chat_request.user_id)
+    timings.log("chat")
+    # The leader's timings cover the shared stages; joiners only record their wait
+    observe_stages(timings, chat_request.character_id)
+    count_request(
+        "chat",
+        chat_request.character_id,
+        "shared" if shared else ("llm" if "llm" in timings.durations else "cache")
     )
+    http_response.headers["Server-Timing"] = timings.server_timing()
+    
+    # Queue the conversation write; it is persisted after the response is sent
+    await conversation_writer.enqueue(
+        chat_request.user_id,
+        chat_request.character_id,
+        chat_request.message,
+        response
+    )
+    
+    return {"response": response}
+
+
+@router.post("/chat/batch", response_model=PublicChatBatchResponse)
+async def public_chat_batch(
+    *,
+    db: Session = Depends(get_db),
+    batch_request: PublicChatBatchRequest,
+    http_response: Response,
+    admission: AdmissionTicket = Depends(admit_chat_request)
+) -> Any:
+    """
+    Batch chat endpoint for server-side integrations.
+    Embeds every message in one call, runs one vector query per character,
+    generates responses with bounded concurrency and saves all conversations
+    in a single transaction. Failures are reported per item; a failure to
+    save the conversations is reported in persistence_error.
+    """
+    items = batch_request.items
+    if len(items) > settings.BATCH_CHAT_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"A batch may contain at most {settings.BATCH_CHAT_MAX_ITEMS} items"
+        )
+    timings = StageTimings()
+    results = [
+        PublicChatBatchItemResult(index=i, user_id=item.user_id, character_id=item.character_id)
+        for i, item in enumerate(items)
+    ]
+    
+    # Resolve each distinct character once
+    def load_characters() -> Dict[str, Any]:
+        return {
+            character_id: character_cache.get(db, character_id)
+            for character_id in {str(item.character_id) for item in items}
+        }
+    
+    with timings.stage("character_lookup"):
+        found_characters = await run_in_threadpool(load_characters)
+    
+    # Embed every message in a single embeddings call
+    try:
+        with timings.stage("query_embedding"):
+            embeddings = await embed_queries([item.message for item in items])
+    except Exception as e:
+        logger.error(f"Error embedding chat batch: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail="Embedding request failed"
+        )
+    
+    # Answer from the response cache where possible; group the rest by character
+    pending: Dict[str, List[int]] = {}
+    for i, item in enumerate(items):
+        character_key = str(item.character_id)
+        if found_characters.get(character_key) is None:
+            results[i].error = "Character not found"
+            continue
+        template = response_cache.lookup_template(character_key, embeddings[i])
+        if template is not None:
+            results[i].response = personalize(template, item.user_id)
+            count_request("chat_batch", character_key, "cache")
+        else:
+            pending.setdefault(character_key, []).append(i)
+    
+    # One vector query per character covering all of its messages
+    contexts: Dict[int, List[str]] = {}
+    with timings.stage("vector_query"):
+        grouped_docs = await asyncio.gather(*[
+            query_documents_batch(
+                [embeddings[i] for i in indices],
+                top_k=settings.RETRIEVAL_TOP_K,
+                character_id=found_characters[character_key].id,
+                query_texts=[items[i].message for i in indices]
+            )
+            for character_key, indices in pending.items()
+        ])
+    for indices, docs_per_query in zip(pending.values(), grouped_docs):
+        for i, relevant_docs in zip(indices, docs_per_query):
+            contexts[i] = format_context(relevant_docs)
+    
+    # Generate responses with bounded concurrency
+    semaphore = asyncio.Semaphore(settings.BATCH_CHAT_MAX_CONCURRENCY)
+    
+    async def generate(i: int) -> None:
+        item = items[i]
+        character = found_characters[str(item.character_id)]
+        async with semaphore:
+            try:
+                with admission_controller.llm_slot():
+                    response = await generate_response(
+                        character=character,
+                        message=item.message,
+                        user_id=item.user_id,
+                        context=contexts[i],
+                        conversation_history=[]
+                    )
+            except AdmissionRejected as rejection:
+                results[i].error = rejection.reason
+                return
+            except Exception as e:
+                logger.error(f"Error generating batch item {i}: {str(e)}")
+                results[i].error = "Response generation failed"
+                return
+        results[i].response = response
+        response_cache.store(character.character_id, embeddings[i], item.user_id, response)
+        count_request("chat_batch", item.character_id, "llm")
+    
+    with timings.stage("llm"):
+        await asyncio.gather(*[generate(i) for i in contexts])
     
-    return {"response": response}
\ No newline at end of file
+    # Persist every successful turn in one transaction
+    entries = [
+        {
+            "user_id": items[result.index].user_id,
+            "character_id": items[result.index].character_id,
+            "message": items[result.index].message,
+            "response": result.response,
+        }
+        for result in results if result.response is not None
+    ]
+    persistence_error = None
+    if entries:
+        try:
+            with timings.stage("conversation_write"):
+                await run_in_threadpool(conversation.create_conversations_bulk, db, entries=entries)
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error saving chat batch conversations: {str(e)}")
+            persistence_error = f"Conversation history for {len(entries)} answered items was not saved"
+    timings.log(f"chat batch ({len(items)} items)")
+    observe_stages(timings, character_label(item.character_id for item in items))
+    http_response.headers["Server-Timing"] = timings.server_timing()
+    
+    return {"results": results, "persistence_error": persistence_error}
+
+
+@router.post("/chat/stream")
+async def public_chat_stream(
+    *,
+    db: Session = Depends(get_db),
+    chat_request: PublicChatRequest,
+    admission: AdmissionTicket = Depends(admit_chat_request)
+) -> Any:
+    """
+    Streaming variant of the public chat endpoint.
+    Sends the response as Server-Sent Events: one "token" event per generated
+    chunk, then a "done" event carrying the full text once it has been queued
+    for persistence. The Server-Timing header covers the stages before the
+    first token.
+    """
+    timings = StageTimings()
+    formatted_history, (character, query_embedding, cached_template, context) = await asyncio.gather(
+        run_in_threadpool(_load_history, db, chat_request, timings),
+        _resolve_and_retrieve(chat_request, timings),
+    )
+    cached_response = (
+        personalize(cached_template, chat_request.user_id) if cached_template is not None else None
+    )
+    
+    # Claim the LLM slot before any bytes are sent so rejection can still be a 429
+    if cached_response is None:
+        try:
+            admission_controller.acquire_llm_slot()
+        except AdmissionRejected as rejection:
+            raise too_many_requests(rejection)
+    
+    # Both slots are held until the stream finishes, not just until this returns
+    admission.hold()
+    released = False
+    
+    def release_slots() -> None:
+        nonlocal released
+        if not released:
+            released = True
+            if cached_response is None:
+                admission_controller.release_llm_slot()
+            admission.release()
+    
+    async def event_stream() -> AsyncIterator[str]:
+        try:
+            if cached_response is not None:
+                response = cached_response
+                yield _sse_event("token", {"content": response})
+            else:
+                parts = []
+                try:
+                    llm_start = time.perf_counter()
+                    with timings.stage("llm"):
+                        async for chunk in stream_response(
+                            character=character,
+                            message=chat_request.message,
+                            user_id=chat_request.user_id,
+                            context=context,
+                            conversation_history=formatted_history
+                        ):
+                            if not parts:
+                                timings.record("llm_first_token", (time.perf_counter() - llm_start) * 1000)
+                            parts.append(chunk)
+                            yield _sse_event("token", {"content": chunk})
+                except Exception as e:
+                    logger.error(f"Error streaming chat response: {str(e)}")
+                    yield _sse_event("error", {"detail": "Response generation failed"})
+                    return
+                response = "".join(parts)
+                response_cache.store(
+                    character.character_id, query_embedding, chat_request.user_id, response
+                )
+            timings.log("chat stream")
+            observe_stages(timings, chat_request.character_id)
+            count_request(
+                "chat_stream", chat_request.character_id, "cache" if cached_response is not None else "llm"
+            )
+        
+            await conversation_writer.enqueue(
+                chat_request.user_id,
+                chat_request.character_id,
+                chat_request.message,
+                response
+            )
+        
+            yield _sse_event("done", {"response": response})
+        finally:
+            release_slots()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+            "Server-Timing": timings.server_timing()
+        },
+        # Covers clients that disconnect before the stream is iterated
+        background=BackgroundTask(release_slots)
+    )
+
+
+
+def _load_session_history(chat_request: PublicChatRequest) -> List[Dict[str, str]]:
+    """Load the stored history for a WebSocket session with a dedicated session."""
+    db = SessionLocal()
+    try:
+        return _load_history(db, chat_request, StageTimings())
+    finally:
+        db.close()
+
+
+@router.websocket("/chat/ws")
+async def public_chat_ws(websocket: WebSocket, user_id: str, character_id: str):
+    """
+    WebSocket chat session bound to one (user_id, character_id) pair.
+    The API key is read from the X-API-Key header or the api_key query
+    parameter. The character and recent history are loaded once when the
+    session opens; each incoming {"message": ...} is answered with "token"
+    messages followed by a "done" message, and history is written behind.
+    """
+    api_key = websocket.headers.get(API_KEY_NAME) or websocket.query_params.get("api_key")
+    if not is_valid_api_key(api_key):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Invalid API Key")
+        return
+    
+    session_request = PublicChatRequest(user_id=user_id, character_id=character_id, message="")
+    character = await run_in_threadpool(_load_character, session_request, StageTimings())
+    if not character:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Character not found")
+        return
+    history = deque(
+        await run_in_threadpool(_load_session_history, session_request),
+        maxlen=settings.WEBSOCKET_HISTORY_TURNS * 2
+    )
+    
+    await websocket.accept()
+    await websocket.send_json({"type": "session", "user_id": user_id, "character_id": character.character_id})
+    
+    try:
+        while True:
+            try:
+                data = await websocket.receive_json()
+            except ValueError:
+                await websocket.send_json({"type": "error", "detail": "Messages must be JSON"})
+                continue
+            message = data.get("message") if isinstance(data, dict) else None
+            if not message or not isinstance(message, str):
+                await websocket.send_json({"type": "error", "detail": "Expected {\"message\": \"...\"}"})
+                continue
+            
+            # Rate-limit per message; idle connections hold no admission slot
+            try:
+                ticket = admission_controller.admit(api_key)
+            except AdmissionRejected as rejection:
+                await websocket.send_json({
+                    "type": "error",
+                    "detail": rejection.reason,
+                    "retry_after": rejection.retry_after_header
+                })
+                continue
+            
+            try:
+                response = await _answer_ws_message(
+                    websocket, character, user_id, character_id, message, list(history)
+                )
+            except AdmissionRejected as rejection:
+                await websocket.send_json({
+                    "type": "error",
+                    "detail": rejection.reason,
+                    "retry_after": rejection.retry_after_header
+                })
+                continue
+            except WebSocketDisconnect:
+                raise
+            except Exception as e:
+                # A failed message is reported on the socket; the session stays open
+                logger.error(f"Error answering WebSocket chat message: {str(e)}")
+                await websocket.send_json({"type": "error", "detail": "Response generation failed"})
+                continue
+            finally:
+                ticket.release()
+            
+            history.append({"role": "user", "content": message})
+            history.append({"role": "assistant", "content": response})
+            await conversation_writer.enqueue(user_id, character_id, message, response)
+            await websocket.send_json({"type": "done", "response": response})
+    except WebSocketDisconnect:
+        logger.info(f"WebSocket chat session closed for user {user_id} and character {character_id}")
+    except Exception as e:
+        logger.error(f"Error in WebSocket chat session: {str(e)}")
+        await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
+
+
+async def _answer_ws_message(
+    websocket: WebSocket,
+    character: Any,
+    user_id: str,
+    character_id: str,
+    message: str,
+    history: List[Dict[str, str]]
+) -> str:
+    """
+    Answer one WebSocket message, sending "token" messages as the response is
+    generated. Returns the full response; raises AdmissionRejected when no
+    LLM slot is free.
+    """
+    chat_request = PublicChatRequest(user_id=user_id, character_id=character_id, message=message)
+    timings = StageTimings()
+    query_embedding, cached_template = await _embed_and_check_cache(chat_request, timings)
+    if cached_template is not None:
+        response = personalize(cached_template, user_id)
+        await websocket.send_json({"type": "token", "content": response})
+    else:
+        context = await _retrieve_context(chat_request, character, query_embedding, timings)
+        parts = []
+        llm_start = time.perf_counter()
+        with admission_controller.llm_slot(), timings.stage("llm"):
+            async for chunk in stream_response(
+                character=character,
+                message=message,
+                user_id=user_id,
+                context=context,
+                conversation_history=history
+            ):
+                if not parts:
+                    timings.record("llm_first_token", (time.perf_counter() - llm_start) * 1000)
+                parts.append(chunk)
+                await websocket.send_json({"type": "token", "content": chunk})
+        response = "".join(parts)
+        response_cache.store(character.character_id, query_embedding, user_id, response)
+    timings.log("chat websocket")
+    observe_stages(timings, character_id)
+    count_request("chat_ws", character_id, "cache" if cached_template is not None else "llm")
+    return response
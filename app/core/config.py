@@ -35,7 +35,92 @@ class Settings(BaseSettings):
 
     # OpenAI
     OPENAI_API_KEY: str = ""
-    
+    # Point at an OpenAI-compatible server, e.g. the local stand-in in loadtest/
+    OPENAI_BASE_URL: Optional[str] = None
+    CHAT_MODEL: str = "gpt-4o"
+    # Prompt budget for character responses
+    LLM_MAX_INPUT_TOKENS: int = 3000
+    RESPONSE_MAX_CHARACTERS: int = 50
+    LLM_MAX_OUTPUT_TOKENS: int = 0  # 0 derives the cap from RESPONSE_MAX_CHARACTERS
+    EMBEDDING_MODEL: str = "text-embedding-3-large"
+    # Shared async HTTP pool used for OpenAI embedding requests
+    OPENAI_TIMEOUT_SECONDS: float = 30.0
+    OPENAI_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    OPENAI_MAX_CONNECTIONS: int = 100
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    OPENAI_MAX_RETRIES: int = 2
+    # Query embedding cache (set the path to "" to keep it in memory only)
+    QUERY_EMBEDDING_CACHE_SIZE: int = 10000
+    QUERY_EMBEDDING_CACHE_PATH: str = "./storage/cache/query_embeddings.sqlite3"
+    QUERY_EMBEDDING_CACHE_MAX_DISK_ROWS: int = 100000
+    # Semantic response cache for near-duplicate player questions
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_SIMILARITY_THRESHOLD: float = 0.95
+    RESPONSE_CACHE_MAX_ENTRIES_PER_CHARACTER: int = 500
+    RESPONSE_CACHE_TTL_SECONDS: int = 3600
+    # In-process character cache (safety-net TTL; admin writes invalidate explicitly)
+    CHARACTER_CACHE_TTL_SECONDS: int = 300
+    # Write-behind conversation persistence
+    CONVERSATION_WRITER_BATCH_SIZE: int = 100
+    CONVERSATION_WRITER_FLUSH_INTERVAL_SECONDS: float = 0.5
+    CONVERSATION_WRITER_MAX_QUEUE_SIZE: int = 10000
+    # Admission control for the public chat endpoints
+    ADMISSION_RATE_PER_SECOND: float = 10.0
+    ADMISSION_BURST: int = 30
+    ADMISSION_MAX_CONCURRENT_PER_KEY: int = 20
+    MAX_INFLIGHT_LLM_REQUESTS: int = 50
+    ADMISSION_LLM_RETRY_AFTER_SECONDS: float = 1.0
+    # Batch chat endpoint
+    BATCH_CHAT_MAX_ITEMS: int = 100
+    BATCH_CHAT_MAX_CONCURRENCY: int = 8
+    # Retrieval backend: "chroma" (HNSW) or "numpy" (exact search over a memory-mapped matrix)
+    RETRIEVAL_BACKEND: str = "chroma"
+    NUMPY_INDEX_PATH: str = "./storage/vector_index"
+    # Reduced embedding size via the API's dimensions parameter (text-embedding-3 models); None keeps native size
+    EMBEDDING_DIMENSIONS: Optional[int] = None
+    # numpy backend: coarse search over an int8 copy, then rescore this many times top_k in float32
+    VECTOR_INDEX_QUANTIZE: bool = False
+    VECTOR_INDEX_RESCORE_FACTOR: int = 4
+    # Tag chunks embedded before character scoping with their scope at startup
+    SCOPE_BACKFILL_ON_STARTUP: bool = True
+    # Chunks retrieved per chat message
+    RETRIEVAL_TOP_K: int = 7
+    # Hybrid retrieval: fuse vector results with a BM25 keyword index by reciprocal rank
+    RETRIEVAL_HYBRID: bool = True
+    RETRIEVAL_RRF_K: int = 60
+    LEXICAL_INDEX_PATH: str = "./storage/lexical_index.sqlite3"
+    # Chunks scored per query term; bounds the cost of very common terms
+    LEXICAL_MAX_POSTINGS_PER_TERM: int = 5000
+    # Retrieval result cache (invalidated per character scope when documents change)
+    RETRIEVAL_CACHE_ENABLED: bool = True
+    RETRIEVAL_CACHE_MAX_ENTRIES: int = 5000
+    RETRIEVAL_CACHE_TTL_SECONDS: int = 600
+    # Background ingestion job queue
+    INGESTION_WORKERS: int = 2
+    INGESTION_MAX_ATTEMPTS: int = 3
+    INGESTION_RETRY_BACKOFF_SECONDS: float = 30.0  # doubled after each failed attempt
+    INGESTION_POLL_INTERVAL_SECONDS: float = 2.0
+    INGESTION_JOB_LEASE_SECONDS: int = 900
+    # Process pool for CPU-bound text extraction (0 workers extracts in a thread instead)
+    EXTRACTION_WORKERS: int = 2
+    EXTRACTION_TIMEOUT_SECONDS: float = 300.0
+    EXTRACTION_MEMORY_LIMIT_MB: int = 2048  # per worker process; 0 for no limit
+    EXTRACTION_MAX_TASKS_PER_WORKER: int = 50
+    # Chunking: "tokens" packs sentences into chunks sized in embedding tokens,
+    # "characters" is the original fixed-width character splitter
+    CHUNKING_STRATEGY: str = "tokens"
+    CHUNK_MAX_TOKENS: int = 400
+    CHUNK_OVERLAP_TOKENS: int = 50
+    CHUNK_SIZE_CHARS: int = 1500
+    CHUNK_OVERLAP_CHARS: int = 200
+    # Re-embed only new or changed chunks, matched by a hash of their text
+    INCREMENTAL_REEMBED: bool = True
+    # Stream PDFs page by page into the chunker instead of extracting the whole text first
+    PDF_STREAMING_EXTRACTION: bool = True
+    PDF_PAGES_PER_EXTRACTION_JOB: int = 4
+    # Rolling history kept in memory per WebSocket chat session
+    WEBSOCKET_HISTORY_TURNS: int = 5
+
     # Document Storage
     DOCUMENT_STORAGE_PATH: str = "./storage/documents"
     VECTOR_DB_PATH: str = "./storage/vectordb"
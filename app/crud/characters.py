@@ -26,14 +26,20 @@ def get_multi_with_document_count(
     db: Session, *, skip: int = 0, limit: int = 100
 ) -> List[Dict]:
     characters = db.query(Character).offset(skip).limit(limit).all()
+    document_counts = dict(
+        db.query(Document.character_id, func.count(Document.id))
+        .filter(Document.character_id.in_([character.id for character in characters]))
+        .group_by(Document.character_id)
+        .all()
+    )
     result = []
     
     for character in characters:
-        # Since we're dissociating characters and documents, set document_count to 0
         char_dict = {**character.__dict__}
         if '_sa_instance_state' in char_dict:
             del char_dict['_sa_instance_state']
-        char_dict['document_count'] = 0  # No relationship, so always 0
+        # Documents assigned to this character; shared documents are not counted
+        char_dict['document_count'] = document_counts.get(character.id, 0)
         result.append(char_dict)
     
     return result
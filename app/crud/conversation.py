@@ -1,6 +1,6 @@
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
+from sqlalchemy import desc, select
 
 from app.models.conversation import Conversation
 from app.schemas.conversation import ConversationCreate
@@ -16,7 +16,7 @@ def get_user_character_history(
             Conversation.user_id == user_id,
             Conversation.character_id == character_id
         )
-        .order_by(desc(Conversation.created_at))
+        .order_by(desc(Conversation.created_at), desc(Conversation.id))
         .limit(limit)
         .all()
     )
@@ -42,23 +42,57 @@ def create_conversation(
     return db_obj
 
 
+def create_conversations_bulk(
+    db: Session, *, entries: List[Dict[str, Any]], max_count: int = 5
+) -> None:
+    """
+    Insert many conversation entries in a single transaction, then prune
+    each affected user-character pair with one set-based DELETE.
+    """
+    db.add_all([
+        Conversation(
+            user_id=entry["user_id"],
+            character_id=entry["character_id"],
+            message=entry["message"],
+            response=entry["response"]
+        )
+        for entry in entries
+    ])
+    db.flush()
+    
+    pairs = {(entry["user_id"], entry["character_id"]) for entry in entries}
+    for user_id, character_id in pairs:
+        _delete_old_conversations(db, user_id=user_id, character_id=character_id, max_count=max_count)
+    db.commit()
+
+
 def prune_old_conversations(
     db: Session, *, user_id: str, character_id: int, max_count: int = 5
 ) -> None:
     """Remove old conversations to maintain only max_count recent ones."""
-    # Get all conversations for this user-character pair
-    conversations = (
+    _delete_old_conversations(db, user_id=user_id, character_id=character_id, max_count=max_count)
+    db.commit()
+
+
+def _delete_old_conversations(
+    db: Session, *, user_id: str, character_id: int, max_count: int
+) -> None:
+    """Delete everything but the max_count newest rows for a pair, without loading them."""
+    keep_ids = (
+        select(Conversation.id)
+        .where(
+            Conversation.user_id == user_id,
+            Conversation.character_id == character_id
+        )
+        .order_by(desc(Conversation.created_at), desc(Conversation.id))
+        .limit(max_count)
+    )
+    (
         db.query(Conversation)
         .filter(
             Conversation.user_id == user_id,
-            Conversation.character_id == character_id
+            Conversation.character_id == character_id,
+            Conversation.id.not_in(keep_ids)
         )
-        .order_by(desc(Conversation.created_at))
-        .all()
+        .delete(synchronize_session=False)
     )
-    
-    # If we have more than max_count, delete the oldest ones
-    if len(conversations) > max_count:
-        for conv in conversations[max_count:]:
-            db.delete(conv)
-        db.commit()
\ No newline at end of file
@@ -5,7 +5,7 @@ from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 from app.services.chroma_utils import delete_from_chroma
 
-from app.models.document import Document, DocumentType, ContentType
+from app.models.document import Document, DocumentType, ContentType, UNASSIGNED_STATUS
 from app.schemas.document import DocumentCreate, DocumentUpdate
 from app.core.config import settings
 
@@ -86,6 +86,7 @@ def create(
         description=obj_in.description,
         document_type=obj_in.document_type,
         content_type=content_type,
+        character_id=obj_in.character_id,
         file_path=file_path,
         original_filename=original_filename or "untitled",
         is_embedded=False,
@@ -123,7 +124,7 @@ def update_document_status(db: Session, *, document=None, id=None, is_embedded:
     
     if document:
         document.is_embedded = is_embedded
-        document.status = status
+        document.embedding_status = status
         db.add(document)
         db.commit()
         db.refresh(document)  # Refresh the document, not the db
@@ -137,7 +138,7 @@ def delete(db: Session, *, id: int) -> Document:
     if obj:
         # Delete from ChromaDB if the document was embedded
         if obj.is_embedded:
-            delete_from_chroma(id)
+            delete_from_chroma(id, obj.character.character_id if obj.character else None)
         
         # Delete the file from disk if it exists and is a file (not a link)
         if obj.content_type == ContentType.FILE and os.path.exists(obj.file_path):
@@ -157,6 +158,14 @@ def get_by_user(db: Session, *, user_id: int) -> List[Document]:
     """Get all documents uploaded by a specific user."""
     return db.query(Document).filter(Document.uploaded_by == user_id).all()
 
+def get_by_character(db: Session, *, character_id: int) -> List[Document]:
+    """Get all documents assigned to a character (by Character.id)."""
+    return db.query(Document).filter(Document.character_id == character_id).all()
+
+def get_embedded(db: Session) -> List[Document]:
+    """Get all documents that have embeddings in ChromaDB."""
+    return db.query(Document).filter(Document.is_embedded.is_(True)).all()
+
 def get_url_documents_for_refresh(db: Session, max_age_hours: Optional[int] = None):
     """
     Get all URL documents that need refreshing.
@@ -169,7 +178,11 @@ def get_url_documents_for_refresh(db: Session, max_age_hours: Optional[int] = No
     Returns:
         List of Document objects that are URLs and need refreshing
     """
-    query = db.query(Document).filter(Document.content_type == ContentType.LINK)
+    query = db.query(Document).filter(
+        Document.content_type == ContentType.LINK,
+        # Documents of a deleted character stay out of retrieval until reassigned
+        Document.embedding_status != UNASSIGNED_STATUS,
+    )
     
     if max_age_hours is not None:
         cutoff_time = datetime.utcnow() - timedelta(hours=max_age_hours)
@@ -0,0 +1,212 @@
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import exists, update
+from sqlalchemy.orm import Session, aliased
+
+from app.models.document import Document
+from app.models.ingestion_job import IngestionJob, JobStatus
+
+ACTIVE_STATUSES = (JobStatus.QUEUED.value, JobStatus.RUNNING.value)
+
+
+def get(db: Session, id: int) -> Optional[IngestionJob]:
+    return db.query(IngestionJob).filter(IngestionJob.id == id).first()
+
+
+def get_multi(
+    db: Session,
+    *,
+    status: Optional[str] = None,
+    document_id: Optional[int] = None,
+    uploaded_by: Optional[int] = None,
+    skip: int = 0,
+    limit: int = 100
+) -> List[IngestionJob]:
+    """Get jobs, newest first, optionally filtered by status, document or document uploader."""
+    query = db.query(IngestionJob)
+    if uploaded_by is not None:
+        query = query.join(Document, Document.id == IngestionJob.document_id).filter(
+            Document.uploaded_by == uploaded_by
+        )
+    if status is not None:
+        query = query.filter(IngestionJob.status == status)
+    if document_id is not None:
+        query = query.filter(IngestionJob.document_id == document_id)
+    return query.order_by(IngestionJob.id.desc()).offset(skip).limit(limit).all()
+
+
+def get_active_for_document(db: Session, *, document_id: int) -> Optional[IngestionJob]:
+    """Get the queued or running job for a document, if there is one."""
+    return (
+        db.query(IngestionJob)
+        .filter(IngestionJob.document_id == document_id, IngestionJob.status.in_(ACTIVE_STATUSES))
+        .order_by(IngestionJob.id.desc())
+        .first()
+    )
+
+
+def create(db: Session, *, document_id: int, reembed: bool = False, max_attempts: int = 3) -> IngestionJob:
+    """Queue a job that may run immediately."""
+    db_obj = IngestionJob(
+        document_id=document_id,
+        reembed=reembed,
+        status=JobStatus.QUEUED.value,
+        max_attempts=max_attempts,
+        run_after=datetime.utcnow(),
+    )
+    db.add(db_obj)
+    db.commit()
+    db.refresh(db_obj)
+    return db_obj
+
+
+def _document_busy():
+    """True when another job for the same document is running; such jobs wait for it."""
+    other = aliased(IngestionJob)
+    return exists().where(
+        other.document_id == IngestionJob.document_id,
+        other.status == JobStatus.RUNNING.value,
+        other.id != IngestionJob.id,
+    )
+
+
+def request_reembed(db: Session, *, id: int) -> bool:
+    """Make a queued job re-embed its document. Returns False if it is no longer queued."""
+    updated = db.execute(
+        update(IngestionJob)
+        .where(IngestionJob.id == id, IngestionJob.status == JobStatus.QUEUED.value)
+        .values(reembed=True)
+    ).rowcount
+    db.commit()
+    return bool(updated)
+
+
+def claim_next(db: Session, *, lease_seconds: int) -> Optional[IngestionJob]:
+    """
+    Claim the oldest due job for this worker.
+    The conditional UPDATE makes the claim atomic across worker processes:
+    if another worker took the job first, no row matches and the next one is tried.
+    Jobs whose document already has a running job are left until it finishes.
+    """
+    now = datetime.utcnow()
+    candidates = (
+        db.query(IngestionJob.id)
+        .filter(IngestionJob.status == JobStatus.QUEUED.value, IngestionJob.run_after <= now, ~_document_busy())
+        .order_by(IngestionJob.run_after, IngestionJob.id)
+        .limit(10)
+        .all()
+    )
+    for (job_id,) in candidates:
+        claimed = db.execute(
+            update(IngestionJob)
+            .where(IngestionJob.id == job_id, IngestionJob.status == JobStatus.QUEUED.value, ~_document_busy())
+            .values(
+                status=JobStatus.RUNNING.value,
+                attempts=IngestionJob.attempts + 1,
+                started_at=now,
+                lease_expires_at=now + timedelta(seconds=lease_seconds),
+                stage=None,
+                progress=0.0,
+                error=None,
+            )
+        ).rowcount
+        db.commit()
+        if claimed:
+            return get(db, id=job_id)
+    return None
+
+
+def update_progress(db: Session, *, id: int, stage: str, progress: float, lease_seconds: int) -> None:
+    """Record a job's stage and progress, extending its lease."""
+    db.execute(
+        update(IngestionJob)
+        .where(IngestionJob.id == id)
+        .values(
+            stage=stage,
+            progress=progress,
+            lease_expires_at=datetime.utcnow() + timedelta(seconds=lease_seconds),
+        )
+    )
+    db.commit()
+
+
+def mark_succeeded(db: Session, *, id: int) -> None:
+    db.execute(
+        update(IngestionJob)
+        .where(IngestionJob.id == id)
+        .values(
+            status=JobStatus.SUCCEEDED.value,
+            progress=100.0,
+            error=None,
+            lease_expires_at=None,
+            finished_at=datetime.utcnow(),
+        )
+    )
+    db.commit()
+
+
+def mark_failed(
+    db: Session, *, job: IngestionJob, error: str, retry_delay_seconds: float, retry: bool = True
+) -> bool:
+    """
+    Record a failed attempt. The job is queued again after retry_delay_seconds
+    while attempts remain and retry is set, otherwise it fails for good.
+    Returns True if it will retry.
+    """
+    retry = retry and job.attempts < job.max_attempts
+    now = datetime.utcnow()
+    db.execute(
+        update(IngestionJob)
+        .where(IngestionJob.id == job.id)
+        .values(
+            status=JobStatus.QUEUED.value if retry else JobStatus.FAILED.value,
+            error=error,
+            lease_expires_at=None,
+            run_after=now + timedelta(seconds=retry_delay_seconds) if retry else job.run_after,
+            finished_at=None if retry else now,
+        )
+    )
+    db.commit()
+    return retry
+
+
+def release(db: Session, *, id: int) -> None:
+    """Put a job interrupted by shutdown back on the queue without counting the attempt."""
+    db.execute(
+        update(IngestionJob)
+        .where(IngestionJob.id == id, IngestionJob.status == JobStatus.RUNNING.value)
+        .values(
+            status=JobStatus.QUEUED.value,
+            attempts=IngestionJob.attempts - 1,
+            lease_expires_at=None,
+            run_after=datetime.utcnow(),
+        )
+    )
+    db.commit()
+
+
+def requeue_expired(db: Session) -> int:
+    """
+    Return running jobs whose lease lapsed (their worker died) to the queue,
+    or fail them if that was their last attempt. Returns the number requeued.
+    """
+    now = datetime.utcnow()
+    expired = (IngestionJob.status == JobStatus.RUNNING.value, IngestionJob.lease_expires_at < now)
+    db.execute(
+        update(IngestionJob)
+        .where(*expired, IngestionJob.attempts >= IngestionJob.max_attempts)
+        .values(
+            status=JobStatus.FAILED.value,
+            error="Worker stopped while running the job",
+            lease_expires_at=None,
+            finished_at=now,
+        )
+    )
+    requeued = db.execute(
+        update(IngestionJob)
+        .where(*expired)
+        .values(status=JobStatus.QUEUED.value, lease_expires_at=None, run_after=now)
+    ).rowcount
+    db.commit()
+    return requeued
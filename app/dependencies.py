@@ -1,4 +1,4 @@
-from typing import Generator, Optional, Any
+from typing import AsyncIterator, Generator, Optional, Any
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
@@ -10,6 +10,7 @@ from app.core import security
 from app.core.config import settings
 from app.db.session import get_db
 from fastapi.security.api_key import APIKeyHeader 
+from app.services.admission import AdmissionRejected, AdmissionTicket, admission_controller
 
 oauth2_scheme = OAuth2PasswordBearer(
     tokenUrl=f"{settings.API_V1_STR}/auth/login"
@@ -17,6 +18,12 @@ oauth2_scheme = OAuth2PasswordBearer(
 # API Key authentication for public endpoints
 API_KEY_NAME = "X-API-Key"
 api_key_header = APIKeyHeader(name=API_KEY_NAME, auto_error=False)
+
+
+def is_valid_api_key(api_key: Optional[str]) -> bool:
+    return bool(api_key) and api_key == settings.PUBLIC_API_KEY
+
+
 async def get_api_key(
     api_key: str = Depends(api_key_header),
     db: Session = Depends(get_db)
@@ -28,14 +35,41 @@ async def get_api_key(
         )
     
     # Check if the API key matches the environment variable
-    if api_key == settings.PUBLIC_API_KEY:
-        return True
+    if is_valid_api_key(api_key):
+        return api_key
     
     raise HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Invalid API Key"
     )
 
+
+def too_many_requests(rejection: AdmissionRejected) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=rejection.reason,
+        headers={"Retry-After": rejection.retry_after_header},
+    )
+
+
+async def admit_chat_request(
+    api_key: str = Depends(get_api_key),
+) -> AsyncIterator[AdmissionTicket]:
+    """
+    Apply per-API-key rate and concurrency limits, rejecting with 429 and
+    Retry-After instead of queueing. The slot is released when the request
+    finishes unless the endpoint calls ticket.hold() to release it itself.
+    """
+    try:
+        ticket = admission_controller.admit(api_key)
+    except AdmissionRejected as rejection:
+        raise too_many_requests(rejection)
+    try:
+        yield ticket
+    finally:
+        if not ticket.held:
+            ticket.release()
+
 def get_current_user(
     db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)
 ) -> User:
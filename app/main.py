@@ -1,9 +1,10 @@
 from fastapi import FastAPI, Depends, HTTPException, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
+import asyncio
 import logging
 from app.api.routes import auth, admin, characters, chat, document
 from app.db.session import engine, SessionLocal
@@ -69,12 +70,49 @@ async def startup_event():
     # Initialize the document refresh scheduler without auto-starting
     from app.services.scheduler import initialize_scheduler_without_autostart
     await initialize_scheduler_without_autostart()
+    # Start the write-behind conversation writer
+    from app.services.conversation_writer import conversation_writer
+    await conversation_writer.start()
+    # Start the ingestion workers; jobs queued before a restart resume here
+    from app.services.ingestion_queue import ingestion_queue
+    await ingestion_queue.start()
+    # Bring indexes built before character scoping and hybrid retrieval up to
+    # date in the background: untagged chunks match no character, and an empty
+    # keyword index leaves hybrid retrieval with only the vector side
+    from fastapi.concurrency import run_in_threadpool
+    from app.services.chroma_utils import backfill_document_scopes, ensure_lexical_index
+    
+    def backfill_indexes() -> None:
+        if settings.SCOPE_BACKFILL_ON_STARTUP:
+            try:
+                backfill_document_scopes()
+            except Exception as e:
+                logging.error(f"Error backfilling document scopes: {str(e)}")
+        if settings.RETRIEVAL_HYBRID:
+            ensure_lexical_index()
+    
+    app.state.index_backfill = asyncio.create_task(run_in_threadpool(backfill_indexes))
 
 @app.on_event("shutdown")
 async def shutdown_event():
     # Stop the scheduler
     from app.services.scheduler import document_scheduler
     await document_scheduler.stop()
+    # Stop the ingestion workers, requeueing any job they were running
+    from app.services.ingestion_queue import ingestion_queue
+    await ingestion_queue.stop()
+    # Stop the text extraction processes
+    from app.services.text_extraction import extraction_pool
+    extraction_pool.shutdown()
+    # Flush pending conversation writes
+    from app.services.conversation_writer import conversation_writer
+    await conversation_writer.stop()
+    # Write query embeddings still waiting for the disk cache
+    from app.services.embedding_cache import query_embedding_cache
+    query_embedding_cache.flush()
+    # Release the pooled OpenAI HTTP connections
+    from app.services.embedding_client import close_async_openai_client
+    await close_async_openai_client()
 
 @app.get("/", response_class=HTMLResponse)
 async def root(request: Request):
@@ -99,6 +137,13 @@ def health_check(db: Session = Depends(get_db)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Health check failed: {str(e)}")
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    # Prometheus scrape endpoint: per-stage chat latency histograms and counters
+    from app.services.metrics import render_metrics
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
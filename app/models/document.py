@@ -21,6 +21,10 @@ class ContentType(str, enum.Enum):
     LINK = "link"
 
 
+# embedding_status of documents left without a character when it was deleted
+UNASSIGNED_STATUS = "unassigned"
+
+
 class Document(Base):
     __tablename__ = "documents"
 
@@ -35,8 +39,11 @@ class Document(Base):
     last_refreshed = Column(DateTime, nullable=True, index=True)
     embedding_status = Column(String, default="pending")
     uploaded_by = Column(Integer, ForeignKey("users.id"))
+    # Character whose retrieval this document feeds; NULL means shared by all characters
+    character_id = Column(Integer, ForeignKey("characters.id", ondelete="SET NULL"), nullable=True, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     # Relationships
-    uploader = relationship("User")
\ No newline at end of file
+    uploader = relationship("User")
+    character = relationship("Character")
\ No newline at end of file
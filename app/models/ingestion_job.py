@@ -0,0 +1,38 @@
+from sqlalchemy import Boolean, Column, Integer, String, Text, DateTime, ForeignKey, Float
+from sqlalchemy.sql import func
+from sqlalchemy.orm import relationship
+import enum
+
+from app.db.base import Base
+
+
+class JobStatus(str, enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+class IngestionJob(Base):
+    __tablename__ = "ingestion_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), nullable=False, index=True)
+    reembed = Column(Boolean, default=False, nullable=False)
+    status = Column(String, default=JobStatus.QUEUED.value, nullable=False, index=True)
+    # Current pipeline stage (extracting, chunking, embedding) and its completion, 0-100
+    stage = Column(String, nullable=True)
+    progress = Column(Float, default=0.0, nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    max_attempts = Column(Integer, default=3, nullable=False)
+    error = Column(Text, nullable=True)
+    # Earliest time a queued job may run; pushed back between retries
+    run_after = Column(DateTime, nullable=False, index=True)
+    # A running job whose lease lapses is assumed lost with its worker and is requeued
+    lease_expires_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    # Relationships
+    document = relationship("Document")
@@ -5,4 +5,5 @@ from .character import Character, CharacterCreate, CharacterUpdate, CharacterWit
 from .document import Document,  DocumentResponse, DocumentCreate, DocumentInfo
 from .chat import ChatRequest, ChatResponse, ChatHistory, ChatMessage
 from .api_key import ApiKey, ApiKeyCreate, ApiKeyInDB
-from .conversation import Conversation, ConversationCreate, ConversationHistory
\ No newline at end of file
+from .conversation import Conversation, ConversationCreate, ConversationHistory
+from .ingestion_job import IngestionJob
\ No newline at end of file
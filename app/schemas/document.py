@@ -10,6 +10,7 @@ class DocumentBase(BaseModel):
     title: Optional[str] = None
     description: Optional[str] = None
     document_type: Optional[DocumentType] = None
+    character_id: Optional[int] = None
 
 
 # Properties to receive via API on creation
@@ -64,6 +65,7 @@ class DocumentInfo(BaseModel):
     description: Optional[str] = None
     document_type: DocumentType
     content_type: ContentType
+    character_id: Optional[int] = None
     original_filename: str
     is_embedded: bool
     embedding_status: str
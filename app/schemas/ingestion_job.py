@@ -0,0 +1,22 @@
+from typing import Optional
+from datetime import datetime
+from pydantic import BaseModel
+
+
+class IngestionJob(BaseModel):
+    id: int
+    document_id: int
+    reembed: bool
+    status: str
+    stage: Optional[str] = None
+    progress: float
+    attempts: int
+    max_attempts: int
+    error: Optional[str] = None
+    run_after: datetime
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
@@ -0,0 +1,162 @@
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is over its limits; retry_after is in seconds."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at rate tokens per second."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+
+    def try_consume(self) -> float:
+        """Take one token. Returns 0 on success, otherwise seconds until one is available."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else 60.0
+
+
+class AdmissionTicket:
+    """
+    A request's claim on one of its API key's concurrency slots.
+    Call hold() to keep the slot past the dependency scope (e.g. while a
+    streaming response is still being produced) and release() when done.
+    """
+
+    def __init__(self, controller: "AdmissionController", api_key: str):
+        self.controller = controller
+        self.api_key = api_key
+        self.held = False
+        self._released = False
+
+    def hold(self) -> "AdmissionTicket":
+        self.held = True
+        return self
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self.controller._release_key(self.api_key)
+
+
+class AdmissionController:
+    """
+    Fail-fast admission control for the chat endpoints.
+
+    Each API key gets a token bucket (request rate) and a cap on concurrent
+    requests. A global counter bounds the number of in-flight LLM calls so a
+    single worker cannot exceed its share of the OpenAI rate limit. Requests
+    over any limit are rejected immediately instead of queueing.
+    """
+
+    def __init__(
+        self,
+        rate_per_second: float,
+        burst: int,
+        max_concurrent_per_key: int,
+        max_inflight_llm: int,
+        llm_retry_after: float = 1.0,
+    ):
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self.max_concurrent_per_key = max_concurrent_per_key
+        self.max_inflight_llm = max_inflight_llm
+        self.llm_retry_after = llm_retry_after
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._in_flight: Dict[str, int] = {}
+        self._llm_in_flight = 0
+        self._lock = threading.Lock()
+        self.rejected_count = 0
+
+    def admit(self, api_key: str) -> AdmissionTicket:
+        """Admit a request for api_key or raise AdmissionRejected."""
+        with self._lock:
+            if self._in_flight.get(api_key, 0) >= self.max_concurrent_per_key:
+                self.rejected_count += 1
+                raise AdmissionRejected("Too many concurrent requests for this API key", 1.0)
+
+            bucket = self._buckets.get(api_key)
+            if bucket is None:
+                bucket = self._buckets[api_key] = TokenBucket(self.rate_per_second, self.burst)
+            wait = bucket.try_consume()
+            if wait > 0:
+                self.rejected_count += 1
+                raise AdmissionRejected("Rate limit exceeded for this API key", wait)
+
+            self._in_flight[api_key] = self._in_flight.get(api_key, 0) + 1
+        return AdmissionTicket(self, api_key)
+
+    def _release_key(self, api_key: str) -> None:
+        with self._lock:
+            remaining = self._in_flight.get(api_key, 0) - 1
+            if remaining > 0:
+                self._in_flight[api_key] = remaining
+            else:
+                self._in_flight.pop(api_key, None)
+
+    def acquire_llm_slot(self) -> None:
+        """Claim one global in-flight LLM slot or raise AdmissionRejected."""
+        with self._lock:
+            if self._llm_in_flight >= self.max_inflight_llm:
+                self.rejected_count += 1
+                raise AdmissionRejected("Too many in-flight LLM requests", self.llm_retry_after)
+            self._llm_in_flight += 1
+
+    def release_llm_slot(self) -> None:
+        with self._lock:
+            self._llm_in_flight = max(0, self._llm_in_flight - 1)
+
+    @contextmanager
+    def llm_slot(self) -> Iterator[None]:
+        """Hold a global LLM slot for the duration of the block."""
+        self.acquire_llm_slot()
+        try:
+            yield
+        finally:
+            self.release_llm_slot()
+
+    def stats(self) -> Dict[str, int]:
+        """Return current in-flight counts and the number of rejected requests."""
+        return {
+            "llm_in_flight": self._llm_in_flight,
+            "max_inflight_llm": self.max_inflight_llm,
+            "requests_in_flight": sum(self._in_flight.values()),
+            "rejected": self.rejected_count,
+        }
+
+
+# Create a global instance of the controller
+admission_controller = AdmissionController(
+    rate_per_second=settings.ADMISSION_RATE_PER_SECOND,
+    burst=settings.ADMISSION_BURST,
+    max_concurrent_per_key=settings.ADMISSION_MAX_CONCURRENT_PER_KEY,
+    max_inflight_llm=settings.MAX_INFLIGHT_LLM_REQUESTS,
+    llm_retry_after=settings.ADMISSION_LLM_RETRY_AFTER_SECONDS,
+)
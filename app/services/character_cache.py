@@ -0,0 +1,98 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.crud import characters
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CharacterSnapshot:
+    """Detached, immutable copy of the character fields used on the chat path."""
+    id: int
+    character_id: str
+    name: str
+    description: str
+    backstory: Optional[str]
+    personality: str
+    system_prompt: str
+
+    @classmethod
+    def from_model(cls, character: Any) -> "CharacterSnapshot":
+        return cls(
+            id=character.id,
+            character_id=character.character_id,
+            name=character.name,
+            description=character.description,
+            backstory=character.backstory,
+            personality=character.personality,
+            system_prompt=character.system_prompt,
+        )
+
+
+class CharacterCache:
+    """
+    Read-through cache of character snapshots keyed on the public character_id.
+
+    Admin write paths invalidate entries explicitly; the TTL only bounds how
+    long a missed invalidation (e.g. a write from another worker) can linger.
+    Missing characters are not cached, so newly created ones are visible at once.
+    """
+
+    def __init__(self, ttl_seconds: int = 300):
+        self.ttl_seconds = ttl_seconds
+        self._entries: Dict[str, Tuple[CharacterSnapshot, float]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, db: Session, character_id: Any) -> Optional[CharacterSnapshot]:
+        """Return the snapshot for character_id, loading it from the database on a miss."""
+        key = str(character_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        character = characters.get_by_character_id(db, character_id=key)
+        if not character:
+            return None
+        snapshot = CharacterSnapshot.from_model(character)
+        with self._lock:
+            self._entries[key] = (snapshot, now + self.ttl_seconds)
+        return snapshot
+
+    def invalidate(self, character_id: Any) -> None:
+        """Drop the cached snapshot for one character."""
+        with self._lock:
+            if self._entries.pop(str(character_id), None) is not None:
+                self.invalidations += 1
+                logger.info(f"Character cache invalidated for character {character_id}")
+
+    def clear(self) -> None:
+        """Drop all cached snapshots."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Return size and hit/miss/invalidation counters."""
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+
+# Create a global instance of the cache
+character_cache = CharacterCache(ttl_seconds=settings.CHARACTER_CACHE_TTL_SECONDS)
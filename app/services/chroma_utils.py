@@ -1,35 +1,156 @@
-import chromadb
-import os
-from chromadb.config import Settings
+from typing import Any, Dict, Optional
 import logging
 from app.core.config import settings
-chroma_db_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "chroma_db")
+from app.services.lexical_index import lexical_index
+from app.services.response_cache import response_cache
+from app.services.retrieval_cache import retrieval_cache
+from app.services.vector_store import vector_store
 
-def delete_from_chroma(document_id: int) -> None:
+# character_id metadata value for chunks of documents shared by every character
+SHARED_SCOPE = 0
+
+
+def document_scope(character_id: Optional[int]) -> int:
+    """Chunk metadata value for a document's character (Character.id), or the shared scope."""
+    return character_id if character_id else SHARED_SCOPE
+
+
+def scope_filter(character_id: int) -> Dict[str, Any]:
+    """Chroma where filter matching one character's chunks plus the shared ones."""
+    return {"character_id": {"$in": [SHARED_SCOPE, character_id]}}
+
+
+def invalidate_answers(character_key: Optional[str]) -> None:
     """
-    Delete a document's embeddings from ChromaDB.
+    Drop cached chat answers that may be based on a document in this scope:
+    one character's (by its public character_id), or everyone's for shared documents.
+    """
+    if character_key:
+        response_cache.invalidate_character(character_key)
+    else:
+        response_cache.invalidate_all()
+
+
+def set_document_scope(document_id: int, character_id: Optional[int]) -> int:
+    """
+    Re-tag an embedded document's chunks with its character without re-embedding.
+    Returns the number of chunks whose scope changed.
+    """
+    scope = document_scope(character_id)
+    
+    previous_scopes = set()
+    
+    def retag(collection: Any) -> int:
+        results = collection.get(where={"doc_id": document_id}, include=["metadatas"])
+        ids, metadatas = [], []
+        for chunk_id, metadata in zip(results["ids"], results["metadatas"]):
+            if (metadata or {}).get("character_id") != scope:
+                previous_scopes.add((metadata or {}).get("character_id", SHARED_SCOPE))
+                ids.append(chunk_id)
+                metadatas.append({**(metadata or {}), "character_id": scope})
+        if ids:
+            collection.update(ids=ids, metadatas=metadatas)
+        return len(ids)
+    
+    updated = vector_store.write_transaction(retag)
+    lexical_index.set_document_scope(document_id, scope)
+    if updated:
+        # The chunks left their old scopes and joined the new one
+        retrieval_cache.invalidate_scopes(previous_scopes | {scope})
+        logging.info(f"Set scope {scope} on {updated} chunks of document {document_id}")
+    return updated
+
+
+def backfill_document_scopes() -> Dict[str, int]:
+    """
+    Tag every embedded document's chunks with its character scope. Chunks
+    embedded before character scoping have no character_id and match no
+    character's filter until this has run; chunks already tagged are left
+    alone, so it is cheap to repeat. Run in the background at startup.
     """
+    # Imported here: app.crud.documents imports this module
+    from app.db.session import SessionLocal
+    from app.models.document import Document
+    
+    db = SessionLocal()
     try:
-        # Initialize ChromaDB client
-        chroma_client = chromadb.PersistentClient(
-            path=chroma_db_path
-        )
-        
-        # Get the collection
-        collection = chroma_client.get_collection(name="documents_embeddings")
+        documents = db.query(Document.id, Document.character_id).filter(Document.is_embedded.is_(True)).all()
+    finally:
+        db.close()
+    updated = 0
+    for document_id, character_id in documents:
+        try:
+            updated += set_document_scope(document_id, character_id)
+        except Exception as e:
+            logging.error(f"Error setting the scope of document {document_id}: {str(e)}")
+    if updated:
+        response_cache.invalidate_all()
+        logging.info(f"Backfilled character scope on {updated} chunks of {len(documents)} documents")
+    return {"documents": len(documents), "chunks_updated": updated}
+
+
+def rebuild_lexical_index() -> int:
+    """Rebuild the BM25 keyword index from the chunks in the vector store. Returns the chunk count."""
+    def batches(batch_size: int = 1000):
+        for offset in range(0, vector_store.count(), batch_size):
+            batch = vector_store.get(offset=offset, limit=batch_size, include=["documents", "metadatas"])
+            if not batch["ids"]:
+                break
+            yield batch["ids"], batch["documents"], batch["metadatas"]
+    
+    indexed = lexical_index.rebuild(batches())
+    response_cache.invalidate_all()
+    retrieval_cache.clear()
+    return indexed
+
+
+def ensure_lexical_index() -> int:
+    """
+    Build the keyword index if it is empty while the vector store is not,
+    as after upgrading to hybrid retrieval. Until it is built, hybrid
+    results come from the vector side only. Run in the background at startup.
+    """
+    try:
+        if lexical_index.count() or not vector_store.count():
+            return 0
+        logging.info("Keyword index is empty; rebuilding it from the vector store")
+        return rebuild_lexical_index()
+    except Exception as e:
+        logging.error(f"Error rebuilding the keyword index: {str(e)}")
+        return 0
+
+
+def delete_from_chroma(document_id: int, character_key: Optional[str] = None) -> None:
+    """
+    Delete a document's embeddings from ChromaDB.
+    character_key is the public character_id the document belongs to, if any,
+    and limits which cached answers are dropped.
+    """
+    scopes = set()
+    
+    def delete_chunks(collection: Any) -> int:
         # Query to find all chunks associated with this document
-        results = collection.get(
-            where={"doc_id": document_id}
-        )
+        results = collection.get(where={"doc_id": document_id}, include=["metadatas"])
         if results and results["ids"]:
+            scopes.update((metadata or {}).get("character_id", SHARED_SCOPE) for metadata in results["metadatas"])
             # Delete all chunks associated with this document
             collection.delete(ids=results["ids"])
-            logging.info(f"Successfully deleted {len(results['ids'])} chunks for document {document_id} from ChromaDB")
+            return len(results["ids"])
+        # Try the old way - direct ID deletion
+        # This is for backward compatibility with documents that might have been embedded
+        # before chunking was implemented
+        collection.delete(ids=[f"doc_{document_id}"])
+        return 0
+    
+    try:
+        deleted = vector_store.write_transaction(delete_chunks)
+        lexical_index.delete_document(document_id)
+        if deleted:
+            logging.info(f"Successfully deleted {deleted} chunks for document {document_id} from ChromaDB")
         else:
-            # Try the old way - direct ID deletion
-            # This is for backward compatibility with documents that might have been embedded
-            # before chunking was implemented
-            collection.delete(ids=[f"doc_{document_id}"])
             logging.info(f"Successfully deleted document {document_id} from ChromaDB using legacy ID format")
+        # Cached answers and retrievals may be based on the deleted content
+        invalidate_answers(character_key)
+        retrieval_cache.invalidate_scopes(scopes)
     except Exception as e:
         logging.error(f"Error deleting document {document_id} from ChromaDB: {str(e)}")
\ No newline at end of file
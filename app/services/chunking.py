@@ -0,0 +1,347 @@
+import logging
+import math
+import re
+import zlib
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Paragraphs are separated by blank lines
+PARAGRAPH_BREAK = re.compile(r"\n[ \t]*\n\s*")
+SENTENCE_BREAK = re.compile(r"(?<=[.!?])[\"')\]]*\s+(?=\S)")
+# A markdown heading, or a short stand-alone line without closing punctuation
+HEADING_PATTERN = re.compile(r"#{1,6}\s+\S.*|[^\s#][^\n]{0,78}[^\s.!?:;,\"')\]]")
+# Text kept waiting for a paragraph break before it is chunked regardless
+MAX_PENDING_CHARS = 64 * 1024
+# On average one paragraph in this many is an anchor that starts a new chunk
+ANCHOR_INTERVAL = 4
+
+_encoding = None
+_encoding_loaded = False
+
+
+def _get_encoding():
+    """Return the tiktoken encoding for the embedding model, or None if unavailable."""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+            try:
+                _encoding = tiktoken.encoding_for_model(settings.EMBEDDING_MODEL)
+            except KeyError:
+                _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            logger.warning(f"tiktoken unavailable, falling back to approximate token counts: {str(e)}")
+    return _encoding
+
+
+def count_embedding_tokens(text: str) -> int:
+    """Count tokens as the embedding model does; approximates 4 characters per token without tiktoken."""
+    encoding = _get_encoding()
+    if encoding is None:
+        return math.ceil(len(text) / 4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+class Chunk:
+    """
+    One chunk of a document. The display title is derived from the document
+    title when the chunk is stored, rather than copied into every chunk.
+    """
+
+    __slots__ = ("doc_id", "index", "text", "token_count", "whole")
+
+    def __init__(self, doc_id: int, index: int, text: str, token_count: Optional[int] = None, whole: bool = False):
+        self.doc_id = doc_id
+        self.index = index
+        self.text = text
+        self.token_count = token_count
+        # The document fit in this one chunk
+        self.whole = whole
+
+    @property
+    def id(self) -> str:
+        return f"doc_{self.doc_id}_chunk_{self.index}"
+
+    def title(self, document_title: str) -> str:
+        return document_title if self.whole else f"{document_title} - Part {self.index + 1}"
+
+    def __repr__(self) -> str:
+        return f"Chunk({self.id!r}, {len(self.text)} chars, {self.token_count} tokens)"
+
+
+class TextChunker:
+    """
+    Incremental form of chunk_text. Text is fed in pieces as it is extracted,
+    and each chunk is returned as soon as it is complete. Only the unfinished
+    tail is kept, which is at most chunk_size characters plus the last piece.
+    Feeding a text in any number of pieces yields the same chunks as
+    chunk_text on the whole text.
+    """
+
+    def __init__(self, doc_id: int, chunk_size: int = 1500, overlap: int = 200):
+        self.doc_id = doc_id
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.chunk_count = 0
+        self._buffer = ""
+        self._fed = 0
+
+    def feed(self, text: str) -> List[Chunk]:
+        """Add the next piece of text; returns the chunks it completed."""
+        self._buffer += text
+        self._fed += len(text)
+        return self._drain(final=False)
+
+    def finish(self) -> List[Chunk]:
+        """Flush the remaining text at the end of the document."""
+        if self.chunk_count == 0 and self._fed <= self.chunk_size:
+            # Short documents are kept whole, under the plain document title
+            self._buffer, text = "", self._buffer
+            if not text.strip():
+                return []
+            self.chunk_count = 1
+            return [Chunk(self.doc_id, 0, text, whole=True)]
+        return self._drain(final=True)
+
+    def _drain(self, final: bool) -> List[Chunk]:
+        chunks = []
+        # The buffer always starts where the next chunk starts
+        text = self._buffer
+        current_idx = 0
+        # Until the end is seen, a chunk is only cut once text beyond its window has arrived
+        while current_idx < len(text) and (final or current_idx + self.chunk_size < len(text)):
+            # Define chunk end (respect text boundaries)
+            end_idx = min(current_idx + self.chunk_size, len(text))
+
+            # Try to find a good breakpoint (newline or period)
+            if end_idx < len(text):
+                last_period = text.rfind('.', current_idx, end_idx)
+                last_newline = text.rfind('\n', current_idx, end_idx)
+
+                breakpoint = max(last_period, last_newline)
+
+                # Only use the breakpoint if it's not too far from the end
+                if breakpoint > current_idx and (end_idx - breakpoint) < 200:
+                    end_idx = breakpoint + 1  # Include the period or newline
+
+            piece = text[current_idx:end_idx].strip()
+            if piece:  # Only add non-empty chunks
+                chunks.append(Chunk(self.doc_id, self.chunk_count, piece))
+                self.chunk_count += 1
+
+            # Move to next chunk with overlap, never backwards past the chunk just cut
+            next_idx = end_idx - self.overlap if end_idx < len(text) else len(text)
+            current_idx = next_idx if next_idx > current_idx else end_idx
+
+        # Drop the text no later chunk can include
+        self._buffer = text[current_idx:]
+        return chunks
+
+
+def chunk_text(text: str, doc_id: int, chunk_size: int = 1500, overlap: int = 200) -> List[Chunk]:
+    """Split text into overlapping chunks for embedding"""
+    logger.info(f"Chunking text of length {len(text)} into chunks of size {chunk_size} with overlap {overlap}")
+    chunker = TextChunker(doc_id, chunk_size=chunk_size, overlap=overlap)
+    chunks = chunker.feed(text) + chunker.finish()
+    logger.info(f"Created {len(chunks)} chunks from document")
+    return chunks
+
+
+# (text, tokens, starts a paragraph, is a heading)
+_Segment = Tuple[str, int, bool, bool]
+
+
+class TokenChunker:
+    """
+    Streaming chunker that sizes chunks in embedding-model tokens.
+
+    Text is split into paragraphs at blank lines and paragraphs into
+    sentences, and sentences are packed into chunks of at most max_tokens.
+    A chunk never ends inside a sentence unless the sentence alone is over
+    the limit, and a heading starts a new chunk once the current one holds
+    min_tokens. So does an anchor paragraph, one picked by a hash of its
+    text: after an edit, chunk boundaries fall back into step at the next
+    anchor, and the chunks after it are unchanged and need no re-embedding.
+    Consecutive chunks in a section share up to overlap_tokens
+    of whole sentences. feed() and finish() are generators; the chunker
+    keeps only the current chunk's sentences and text that is still
+    waiting for a paragraph break.
+
+    Sentences are counted separately and each join is allowed one token,
+    so a chunk's token_count is an upper bound on the count of its text.
+    """
+
+    def __init__(
+        self,
+        doc_id: int,
+        max_tokens: int = 400,
+        overlap_tokens: int = 50,
+        min_tokens: Optional[int] = None,
+    ):
+        self.doc_id = doc_id
+        self.max_tokens = max_tokens
+        self.overlap_tokens = min(overlap_tokens, max_tokens // 2)
+        self.min_tokens = max_tokens // 4 if min_tokens is None else min_tokens
+        self.chunk_count = 0
+        self._pending = ""
+        self._segments: List[_Segment] = []
+        self._tokens = 0
+        # The last chunk is held back until the next one, so a lone chunk can be marked whole
+        self._held: Optional[Chunk] = None
+        # The next paragraph continues one cut short by MAX_PENDING_CHARS
+        self._continued = False
+
+    def feed(self, text: str) -> Iterator[Chunk]:
+        """Add the next piece of text and yield the chunks it completed."""
+        # Earlier text held no paragraph break, but one may start in its trailing whitespace
+        search_from = len(self._pending.rstrip())
+        self._pending += text
+        last_break = _last_match(PARAGRAPH_BREAK, self._pending, search_from)
+        if last_break is not None:
+            cut = last_break.end()
+        elif len(self._pending) > MAX_PENDING_CHARS:
+            # No paragraph break in sight: cut after the last sentence, or anywhere
+            last_sentence = _last_match(SENTENCE_BREAK, self._pending)
+            cut = last_sentence.end() if last_sentence is not None else len(self._pending)
+        else:
+            return
+        ready, self._pending = self._pending[:cut], self._pending[cut:]
+        continued = self._continued
+        self._continued = last_break is None
+        yield from self._chunk_paragraphs(ready, continued)
+
+    def finish(self) -> Iterator[Chunk]:
+        """Yield the remaining chunks at the end of the document."""
+        ready, self._pending = self._pending, ""
+        yield from self._chunk_paragraphs(ready, self._continued)
+        yield from self._emit(overlap=False, final=True)
+        if self._held is not None:
+            held, self._held = self._held, None
+            held.whole = self.chunk_count == 1
+            yield held
+
+    def _chunk_paragraphs(self, text: str, continued: bool) -> Iterator[Chunk]:
+        for number, paragraph in enumerate(_paragraphs(text)):
+            paragraph = paragraph.strip()
+            if not paragraph:
+                continue
+            starts_paragraph = not (continued and number == 0)
+            if starts_paragraph and HEADING_PATTERN.fullmatch(paragraph):
+                # A new section: close the current chunk unless it is still small
+                if self._tokens >= self.min_tokens:
+                    yield from self._emit(overlap=False)
+                yield from self._add((paragraph, count_embedding_tokens(paragraph), True, True))
+                continue
+            if starts_paragraph and self._tokens >= self.min_tokens and _is_anchor(paragraph):
+                yield from self._emit(overlap=False)
+            for position, sentence in enumerate(SENTENCE_BREAK.split(paragraph)):
+                first = starts_paragraph and position == 0
+                tokens = count_embedding_tokens(sentence)
+                if tokens <= self.max_tokens:
+                    yield from self._add((sentence, tokens, first, False))
+                else:
+                    for part_number, (part, part_tokens) in enumerate(self._split_sentence(sentence)):
+                        yield from self._add((part, part_tokens, first and part_number == 0, False))
+
+    def _split_sentence(self, sentence: str) -> Iterator[Tuple[str, int]]:
+        """Cut a sentence longer than max_tokens into max_tokens pieces."""
+        encoding = _get_encoding()
+        if encoding is None:
+            step = self.max_tokens * 4
+            for start in range(0, len(sentence), step):
+                yield sentence[start:start + step], count_embedding_tokens(sentence[start:start + step])
+            return
+        tokens = encoding.encode(sentence, disallowed_special=())
+        for start in range(0, len(tokens), self.max_tokens):
+            piece = tokens[start:start + self.max_tokens]
+            yield encoding.decode(piece), len(piece)
+
+    def _add(self, segment: _Segment) -> Iterator[Chunk]:
+        # Allow a token for each join, so the joined text stays within max_tokens
+        if self._segments and self._tokens + len(self._segments) + segment[1] > self.max_tokens:
+            yield from self._emit(overlap=True)
+            if self._segments and self._tokens + len(self._segments) + segment[1] > self.max_tokens:
+                # No room for the overlap alongside this segment
+                self._segments, self._tokens = [], 0
+        self._segments.append(segment)
+        self._tokens += segment[1]
+
+    def _emit(self, overlap: bool, final: bool = False) -> Iterator[Chunk]:
+        """Close the current chunk, keeping trailing headings and the overlap for the next."""
+        segments = self._segments
+        split = len(segments)
+        while split > 0 and segments[split - 1][3] and not final:
+            split -= 1
+        if split == 0:
+            # Only headings so far; they stay with the text that follows
+            return
+        body, carried = segments[:split], segments[split:]
+        if overlap and not carried:
+            kept = 0
+            while split > 1 and kept + segments[split - 1][1] <= self.overlap_tokens:
+                split -= 1
+                kept += segments[split][1]
+            carried = segments[split:]
+        self._segments = carried
+        self._tokens = sum(segment[1] for segment in carried)
+
+        parts = []
+        for position, (text, _, starts_paragraph, _) in enumerate(body):
+            if position:
+                parts.append("\n\n" if starts_paragraph else " ")
+            parts.append(text)
+        token_count = sum(segment[1] for segment in body) + len(body) - 1
+        chunk = Chunk(self.doc_id, self.chunk_count, "".join(parts), token_count)
+        self.chunk_count += 1
+        if self._held is not None:
+            yield self._held
+        self._held = chunk
+
+
+def _is_anchor(paragraph: str) -> bool:
+    return zlib.crc32(paragraph.encode("utf-8")) % ANCHOR_INTERVAL == 0
+
+
+def _last_match(pattern: "re.Pattern", text: str, start: int = 0) -> Optional["re.Match"]:
+    match = None
+    for match in pattern.finditer(text, start):
+        pass
+    return match
+
+
+def _paragraphs(text: str) -> Iterator[str]:
+    """Split text at blank lines, lazily."""
+    start = 0
+    for match in PARAGRAPH_BREAK.finditer(text):
+        yield text[start:match.start()]
+        start = match.end()
+    yield text[start:]
+
+
+def iter_token_chunks(
+    pieces: Union[str, Iterable[str]], doc_id: int, max_tokens: int = 400, overlap_tokens: int = 50
+) -> Iterator[Chunk]:
+    """Chunk a text, or an iterable of text pieces such as pages, into token-sized chunks."""
+    chunker = TokenChunker(doc_id, max_tokens=max_tokens, overlap_tokens=overlap_tokens)
+    for piece in [pieces] if isinstance(pieces, str) else pieces:
+        yield from chunker.feed(piece)
+    yield from chunker.finish()
+
+
+def new_chunker(doc_id: int) -> Union[TextChunker, TokenChunker]:
+    """The configured chunker for a document."""
+    if settings.CHUNKING_STRATEGY == "characters":
+        return TextChunker(doc_id, chunk_size=settings.CHUNK_SIZE_CHARS, overlap=settings.CHUNK_OVERLAP_CHARS)
+    return TokenChunker(doc_id, max_tokens=settings.CHUNK_MAX_TOKENS, overlap_tokens=settings.CHUNK_OVERLAP_TOKENS)
+
+
+def chunk_document(text: str, doc_id: int) -> List[Chunk]:
+    """Chunk a whole document's text with the configured chunker."""
+    chunker = new_chunker(doc_id)
+    chunks = [*chunker.feed(text), *chunker.finish()]
+    logger.info(f"Created {len(chunks)} chunks from document {doc_id} ({settings.CHUNKING_STRATEGY})")
+    return chunks
@@ -0,0 +1,137 @@
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.crud.conversation import create_conversations_bulk
+from app.db.session import SessionLocal
+from app.services.timing import StageTimings
+from app.services.metrics import conversation_write_duration, conversation_write_rows
+
+logger = logging.getLogger(__name__)
+
+# Queued by stop() to tell the drain loop to finish its current batch and exit
+_STOP = object()
+
+
+class ConversationWriter:
+    """
+    Write-behind persistence for chat turns.
+
+    Requests enqueue conversation entries and return immediately; a background
+    task drains the queue and writes each batch in one transaction, pruning
+    every affected user-character pair with a single DELETE.
+    """
+
+    def __init__(self, batch_size: int = 100, flush_interval: float = 0.5, max_queue_size: int = 10000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue_size = max_queue_size
+        self.queue: Optional[asyncio.Queue] = None
+        self.task: Optional[asyncio.Task] = None
+        self.written_count = 0
+        self.failed_count = 0
+
+    @property
+    def is_running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    async def start(self) -> None:
+        """Start the background drain task."""
+        if self.is_running:
+            return
+        self.queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self.task = asyncio.create_task(self._drain_loop())
+        logger.info(f"Conversation writer started (batch_size={self.batch_size})")
+
+    async def stop(self) -> None:
+        """Stop the drain task and flush every pending write."""
+        if not self.is_running:
+            return
+        await self.queue.put(_STOP)
+        await self.task
+        # Anything enqueued after the stop marker is written here
+        pending = []
+        while not self.queue.empty():
+            entry = self.queue.get_nowait()
+            if entry is not _STOP:
+                pending.append(entry)
+        if pending:
+            logger.info(f"Flushing {len(pending)} pending conversation writes on shutdown")
+            await self._write_batch(pending)
+        logger.info("Conversation writer stopped")
+
+    async def enqueue(self, user_id: str, character_id: Any, message: str, response: str) -> None:
+        """
+        Queue a chat turn for persistence.
+        Writes inline when the writer is not running (e.g. outside the app lifespan).
+        """
+        entry = {
+            "user_id": user_id,
+            "character_id": character_id,
+            "message": message,
+            "response": response,
+        }
+        if not self.is_running:
+            await self._write_batch([entry])
+            return
+        await self.queue.put(entry)
+
+    async def _drain_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            entry = await self.queue.get()
+            if entry is _STOP:
+                break
+            batch = [entry]
+            # Collect whatever else arrives within the flush interval, up to batch_size
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    entry = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if entry is _STOP:
+                    stopping = True
+                    break
+                batch.append(entry)
+            await self._write_batch(batch)
+
+    async def _write_batch(self, batch: List[Dict[str, Any]]) -> None:
+        timings = StageTimings()
+        with timings.stage("conversation_write"):
+            try:
+                await run_in_threadpool(self._write_batch_sync, batch)
+                self.written_count += len(batch)
+                conversation_write_rows.labels(outcome="written").inc(len(batch))
+            except Exception as e:
+                self.failed_count += len(batch)
+                conversation_write_rows.labels(outcome="failed").inc(len(batch))
+                logger.error(f"Error writing batch of {len(batch)} conversations: {str(e)}")
+        timings.log(f"conversation batch ({len(batch)} rows)")
+        conversation_write_duration.observe(timings.durations["conversation_write"] / 1000)
+
+    @staticmethod
+    def _write_batch_sync(batch: List[Dict[str, Any]]) -> None:
+        db = SessionLocal()
+        try:
+            create_conversations_bulk(db, entries=batch)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+
+# Create a global instance of the writer
+conversation_writer = ConversationWriter(
+    batch_size=settings.CONVERSATION_WRITER_BATCH_SIZE,
+    flush_interval=settings.CONVERSATION_WRITER_FLUSH_INTERVAL_SECONDS,
+    max_queue_size=settings.CONVERSATION_WRITER_MAX_QUEUE_SIZE,
+)
@@ -1,32 +1,35 @@
 import os
-import io
 import asyncio
+import hashlib
 import logging
-from typing import Optional, List, Dict, Any
+from typing import Callable, Optional, List, Dict, Any, Set
 import mimetypes
 import uuid
 from urllib.parse import urlparse
 from datetime import datetime
 
+import numpy as np
+
 # File processing libraries
-import PyPDF2
-import docx
-import pandas as pd
-import mammoth
-import csv
 from bs4 import BeautifulSoup
 import requests
 from playwright.async_api import async_playwright
 
-# Embedding
-from openai import OpenAI
-import chromadb
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 
 # Local imports
 from app.core.config import settings
 from app.models.document import Document, ContentType
 from app.crud.documents import update_document_status
+from app.services.embedding_client import embed_query, embed_texts
+from app.services.chroma_utils import SHARED_SCOPE, document_scope, invalidate_answers, scope_filter
+from app.services.chunking import Chunk, chunk_document, new_chunker
+from app.services.lexical_index import lexical_index, reciprocal_rank_fusion
+from app.services.metrics import document_chunks
+from app.services.retrieval_cache import retrieval_cache
+from app.services.text_extraction import extraction_pool
+from app.services.vector_store import vector_store
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -39,17 +42,16 @@ console_handler.setLevel(logging.INFO)
 formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 console_handler.setFormatter(formatter)
 logger.addHandler(console_handler)
-# Initialize OpenAI client
-openai_api_key = os.getenv("OPENAI_API_KEY")
-openai_client = OpenAI(api_key=openai_api_key)
 
-# Initialize ChromaDB client
-chroma_db_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "chroma_db")
-logger.info(f"Using ChromaDB path: {chroma_db_path}")
-chroma_client = chromadb.PersistentClient(path=chroma_db_path)
-collection_name = "documents_embeddings"
+# Chunks embedded per request
+EMBEDDING_BATCH_SIZE = 10
 
-async def process_document(document_id: int, db: Session,  reembed: bool = False) -> None:
+async def process_document(
+    document_id: int,
+    db: Session,
+    reembed: bool = False,
+    on_progress: Optional[Callable[[str, float], None]] = None
+) -> None:
     """
 
     Main function to process a document for embedding.
@@ -57,7 +59,10 @@ async def process_document(document_id: int, db: Session,  reembed: bool = False
     Args:
         document_id: The ID of the document to process
         db: Database session
+        reembed: Delete the document's existing embeddings first
+        on_progress: Optional callback receiving (stage, percent complete)
     """
+    report = on_progress or (lambda stage, progress: None)
     try:
         logger.info(f"Starting document processing for ID: {document_id}")
         # Get document from database
@@ -65,15 +70,23 @@ async def process_document(document_id: int, db: Session,  reembed: bool = False
         if not document:
             logger.error(f"Document with ID {document_id} not found")
             return
+        # Public id of the owning character; None for documents shared by all characters
+        character_key = document.character.character_id if document.character else None
          # If re-embedding, delete existing embeddings first
-        if reembed and document.is_embedded:
+        if reembed and document.is_embedded and not settings.INCREMENTAL_REEMBED:
             logger.info(f"Re-embedding requested for document ID {document_id}. Deleting old embeddings...")
             from app.services.chroma_utils import delete_from_chroma
-            delete_from_chroma(document_id)
+            delete_from_chroma(document_id, character_key)
             logger.info(f"Old embeddings deleted for document ID {document_id}")
+        # Otherwise keep the stored chunks: only new or changed ones are embedded,
+        # and the ones the document no longer has are deleted afterwards
+        stored = StoredChunks(document_id) if settings.INCREMENTAL_REEMBED else None
+        if stored is not None and stored.metadatas:
+            logger.info(f"Embedding document ID {document_id} against {len(stored.metadatas)} stored chunks")
         # Update document status to processing
         update_document_status(db, id=document_id, is_embedded=False, status="processing")
         logger.info(f"Processing document: {document.title} (ID: {document_id})")
+        report("extracting", 0.0)
         
         # Extract text based on content type
         text_content = None
@@ -87,23 +100,33 @@ async def process_document(document_id: int, db: Session,  reembed: bool = False
                 return
                 
             file_extension = os.path.splitext(document.original_filename)[1].lower()
-            
+
+            if file_extension == '.pdf' and settings.PDF_STREAMING_EXTRACTION:
+                # Pages go straight through the chunker to embedding, without building the whole text
+                try:
+                    report("embedding", 0.0)
+                    chunk_count = await embed_pdf_streaming(
+                        document, file_path, on_progress=lambda done: report("embedding", 100.0 * done), stored=stored
+                    )
+                except Exception as e:
+                    logger.error(f"Error streaming PDF document: {str(e)}")
+                    update_document_status(db, id=document_id, is_embedded=False, status="failed")
+                    return
+                if chunk_count == 0:
+                    logger.error(f"No text content extracted from document ID {document_id}")
+                    update_document_status(db, id=document_id, is_embedded=False, status="failed")
+                    return
+                if stored is not None:
+                    stored.remove_stale()
+                update_document_status(db, id=document_id, is_embedded=True, status="embedded")
+                if stored is None or stored.changed:
+                    invalidate_answers(character_key)
+                logger.info(f"Successfully embedded document ID {document_id}")
+                return
+
             try:
-                if file_extension in ['.pdf']:
-                    text_content = extract_text_from_pdf(file_path)
-                elif file_extension in ['.docx']:
-                    text_content = extract_text_from_docx(file_path)
-                elif file_extension in ['.doc']:
-                    text_content = extract_text_from_doc(file_path)
-                elif file_extension in ['.xlsx', '.xls']:
-                    text_content = extract_text_from_excel(file_path)
-                elif file_extension in ['.csv']:
-                    text_content = extract_text_from_csv(file_path)
-                elif file_extension in ['.txt', '.md', '.json', '.html', '.xml']:
-                    text_content = extract_text_from_text_file(file_path)
-                else:
-                    logger.warning(f"Unsupported file type: {file_extension}")
-                    text_content = extract_text_from_text_file(file_path)  # Try as text file anyway
+                # Parse in the extraction process pool; only the text comes back to the event loop
+                text_content = await extraction_pool.extract(file_path, file_extension)
             except Exception as e:
                 logger.error(f"Error extracting text from file: {str(e)}")
                 update_document_status(db, id=document_id, is_embedded=False, status="failed")
@@ -146,14 +169,23 @@ async def process_document(document_id: int, db: Session,  reembed: bool = False
         # Process the text content for embedding
         try:
             # Create chunks from the text content
-            chunks = chunk_text(text_content, document.title, document.id)
+            report("chunking", 30.0)
+            chunks = chunk_document(text_content, document.id)
             logger.info(f"Created {len(chunks)} chunks from document")
             
             # Create embeddings and store in vector database
-            await create_embeddings(chunks, document)
+            report("embedding", 40.0)
+            await create_embeddings(
+                chunks, document, on_progress=lambda done: report("embedding", 40.0 + 60.0 * done), stored=stored
+            )
+            if stored is not None:
+                stored.remove_stale()
             
             # Update document status to embedded
             update_document_status(db, id=document_id, is_embedded=True, status="embedded")
+            # Cached answers may be based on the previous document content
+            if stored is None or stored.changed:
+                invalidate_answers(character_key)
             logger.info(f"Successfully embedded document ID {document_id}")
             
         except Exception as e:
@@ -165,14 +197,21 @@ async def process_document(document_id: int, db: Session,  reembed: bool = False
         update_document_status(db, id=document_id, is_embedded=False, status="failed")
 
 # Add the missing query_documents function
-async def query_documents(query_text: str, top_k: int = 5, character_id: Optional[int] = None) -> List[Dict[str, Any]]:
+async def query_documents(
+    query_text: str,
+    top_k: int = 5,
+    character_id: Optional[int] = None,
+    query_embedding: Optional[List[float]] = None
+) -> List[Dict[str, Any]]:
     """
     Query the document embeddings to find relevant content for a given query.
     
     Args:
         query_text: The query text to search for
         top_k: Number of results to return
-        character_id: Optional character ID to filter results
+        character_id: Optional Character.id; limits results to that character's
+            documents plus the shared ones
+        query_embedding: Optional precomputed embedding of query_text
         
     Returns:
         List of relevant document chunks with metadata
@@ -180,43 +219,13 @@ async def query_documents(query_text: str, top_k: int = 5, character_id: Optiona
     logger.info(f"Querying documents with: '{query_text}'")
     
     try:
-        # Get the collection
-        collection = chroma_client.get_collection(name=collection_name)
-        
-        # Create embedding for the query
-        response = openai_client.embeddings.create(
-            input=query_text,
-            model="text-embedding-3-large"  # Use the same model as for document embeddings
-        )
-        query_embedding = response.data[0].embedding
+        # Create embedding for the query (same model as for document embeddings)
+        if query_embedding is None:
+            query_embedding = await embed_query(query_text)
         
-        # Query the collection
-        filter_dict = {}
-        if character_id is not None:
-            filter_dict["character_id"] = character_id
-            
-        results = collection.query(
-            query_embeddings=[query_embedding],
-            n_results=top_k,
-            # where=filter_dict if filter_dict else None,
-            include=["documents", "metadatas", "distances"]
-        )
-        # print(results)
-        # Format results
-        formatted_results = []
-        if results and results["documents"] and len(results["documents"][0]) > 0:
-            for i, (doc, metadata, distance) in enumerate(zip(
-                results["documents"][0], 
-                results["metadatas"][0],
-                results["distances"][0]
-            )):
-                formatted_results.append({
-                    "text": doc,
-                    "metadata": metadata,
-                    "relevance_score": 1.0 - distance,  # Convert distance to similarity score
-                    "rank": i + 1
-                })
-            
+        # Query the collection, unless the same retrieval is cached for unchanged documents
+        formatted_results = (await _cached_search(None, [query_embedding], top_k, character_id))[0]
+        if formatted_results:
             logger.info(f"Found {len(formatted_results)} relevant document chunks")
         else:
             logger.info("No relevant documents found")
@@ -227,155 +236,186 @@ async def query_documents(query_text: str, top_k: int = 5, character_id: Optiona
         logger.error(f"Error querying documents: {str(e)}")
         return []
 
-# async def hybrid_query_documents(query_text: str, top_k: int = 5, character_id: Optional[int] = None) -> List[Dict[str, Any]]:
-#     """
-#     Perform hybrid search combining vector similarity and keyword matching
-    
-#     Args:
-#         query_text: The query text to search for
-#         top_k: Number of results to return
-#         character_id: Optional character ID to filter results
-        
-#     Returns:
-#         List of relevant document chunks with metadata
-#     """
-#     logger.info(f"Performing hybrid search with: '{query_text}'")
+
+async def query_documents_batch(
+    query_embeddings: List[List[float]],
+    top_k: int = 5,
+    character_id: Optional[int] = None,
+    query_texts: Optional[List[str]] = None
+) -> List[List[Dict[str, Any]]]:
+    """
+    Query the document embeddings for several precomputed query embeddings
+    in a single collection query, scoped to one character like query_documents.
+    When query_texts are given and hybrid retrieval is enabled, each query is
+    also fused with keyword matches as in hybrid_query_documents.
     
-#     try:
-#         # Get the collection
-#         collection = chroma_client.get_collection(name=collection_name)
-        
-#         # Create embedding for the query (do this only once)
-#         response = openai_client.embeddings.create(
-#             input=query_text,
-#             model="text-embedding-3-large"
-#         )
-#         query_embedding = response.data[0].embedding
-        
-#         # Perform a single hybrid search using ChromaDB's built-in capabilities
-#         filter_dict = {}
-#         if character_id is not None:
-#             filter_dict["character_id"] = character_id
-            
-#         results = collection.query(
-#             query_embeddings=[query_embedding],
-#             query_texts=[query_text],  # Add text query for hybrid search
-#             n_results=top_k,
-#             where=filter_dict if filter_dict else None,
-#             include=["documents", "metadatas", "distances"]
-#         )
-        
-#         # Format results
-#         formatted_results = []
-#         if results and results["documents"] and len(results["documents"][0]) > 0:
-#             for i, (doc, metadata, distance) in enumerate(zip(
-#                 results["documents"][0], 
-#                 results["metadatas"][0],
-#                 results["distances"][0]
-#             )):
-#                 formatted_results.append({
-#                     "text": doc,
-#                     "metadata": metadata,
-#                     "relevance_score": 1.0 - distance,  # Convert distance to similarity score
-#                     "rank": i + 1
-#                 })
-            
-#             logger.info(f"Hybrid search found {len(formatted_results)} relevant document chunks")
-#         else:
-#             logger.info("No relevant documents found")
-            
-#         return formatted_results
-        
-#     except Exception as e:
-#         logger.error(f"Error in hybrid search: {str(e)}")
-#         # Fall back to regular vector search
-#         logger.info("Falling back to vector search")
-#         return await query_documents(query_text, top_k=top_k, character_id=character_id)
-def extract_text_from_pdf(file_path: str) -> str:
-    """Extract text from PDF files"""
-    logger.info(f"Extracting text from PDF: {file_path}")
+    Returns:
+        One list of relevant document chunks per query embedding, in input order
+    """
+    if not query_embeddings:
+        return []
+    if query_texts is not None and settings.RETRIEVAL_HYBRID:
+        try:
+            fused = await _cached_search(query_texts, query_embeddings, top_k, character_id)
+            logger.info(f"Batch hybrid query returned results for {len(fused)} queries")
+            return fused
+        except Exception as e:
+            logger.error(f"Error in batch hybrid search, falling back to vector search: {str(e)}")
     try:
-        text = ""
-        with open(file_path, "rb") as f:
-            pdf_reader = PyPDF2.PdfReader(f)
-            for page_num in range(len(pdf_reader.pages)):
-                page = pdf_reader.pages[page_num]
-                text += page.extract_text() + "\n\n"
-        return text
+        formatted = await _cached_search(None, query_embeddings, top_k, character_id)
+        logger.info(f"Batch query returned results for {len(formatted)} queries")
+        return formatted
     except Exception as e:
-        logger.error(f"Error extracting text from PDF: {str(e)}")
-        raise
+        logger.error(f"Error querying documents in batch: {str(e)}")
+        return [[] for _ in query_embeddings]
 
 
-def extract_text_from_docx(file_path: str) -> str:
-    """Extract text from DOCX files"""
-    logger.info(f"Extracting text from DOCX: {file_path}")
-    try:
-        doc = docx.Document(file_path)
-        text = "\n\n".join([paragraph.text for paragraph in doc.paragraphs if paragraph.text.strip()])
-        return text
-    except Exception as e:
-        logger.error(f"Error extracting text from DOCX: {str(e)}")
-        raise
+async def _cached_search(
+    query_texts: Optional[List[str]],
+    query_embeddings: List[List[float]],
+    top_k: int,
+    character_id: Optional[int]
+) -> List[List[Dict[str, Any]]]:
+    """
+    Serve retrievals from the retrieval cache and run one search for the rest:
+    hybrid when query_texts are given, vector-only otherwise.
+    """
+    texts = query_texts or [None] * len(query_embeddings)
+    keys = [
+        retrieval_cache.key(character_id, embedding, top_k, text)
+        for embedding, text in zip(query_embeddings, texts)
+    ]
+    # Taken before searching, so results that race a document change are stored as already stale
+    stamp = retrieval_cache.version(character_id)
+    found = [retrieval_cache.get(key) for key in keys]
+    missing = [i for i, results in enumerate(found) if results is None]
+    if missing:
+        embeddings = [query_embeddings[i] for i in missing]
+        if query_texts is not None:
+            fresh = await _hybrid_query([query_texts[i] for i in missing], embeddings, top_k, character_id)
+        else:
+            fresh = await run_in_threadpool(_vector_query, embeddings, top_k, character_id)
+        for i, results in zip(missing, fresh):
+            retrieval_cache.set(keys[i], results, stamp)
+            found[i] = results
+    return found
 
 
-def extract_text_from_doc(file_path: str) -> str:
-    """Extract text from DOC files using mammoth"""
-    logger.info(f"Extracting text from DOC: {file_path}")
-    try:
-        with open(file_path, "rb") as f:
-            result = mammoth.extract_raw_text(f)
-            return result.value
-    except Exception as e:
-        logger.error(f"Error extracting text from DOC: {str(e)}")
-        raise
+def _vector_query(
+    query_embeddings: List[List[float]], top_k: int, character_id: Optional[int]
+) -> List[List[Dict[str, Any]]]:
+    """One collection query for all embeddings, formatted per query."""
+    results = vector_store.query(
+        query_embeddings=query_embeddings,
+        n_results=top_k,
+        where=scope_filter(character_id) if character_id is not None else None,
+        include=["documents", "metadatas", "distances"]
+    )
+    return [_format_query_results(results, i) for i in range(len(query_embeddings))]
+
 
+def _format_query_results(results: Dict[str, Any], query_index: int) -> List[Dict[str, Any]]:
+    """Format the Chroma query results for one query embedding."""
+    formatted_results = []
+    if results and results["documents"] and len(results["documents"][query_index]) > 0:
+        for i, (doc, metadata, distance) in enumerate(zip(
+            results["documents"][query_index], 
+            results["metadatas"][query_index],
+            results["distances"][query_index]
+        )):
+            formatted_results.append({
+                "text": doc,
+                "metadata": metadata,
+                "relevance_score": 1.0 - distance,  # Convert distance to similarity score
+                "rank": i + 1
+            })
+    return formatted_results
 
-def extract_text_from_excel(file_path: str) -> str:
-    """Extract text from Excel files"""
-    logger.info(f"Extracting text from Excel: {file_path}")
+async def hybrid_query_documents(
+    query_text: str,
+    top_k: int = 5,
+    character_id: Optional[int] = None,
+    query_embedding: Optional[List[float]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Perform hybrid search combining vector similarity and BM25 keyword matching,
+    fused by reciprocal rank. Exact names (Daemons, moves, partners) that
+    vector search ranks poorly are still found by the keyword side.
+    
+    Args:
+        query_text: The query text to search for
+        top_k: Number of results to return
+        character_id: Optional Character.id; limits results to that character's
+            documents plus the shared ones
+        query_embedding: Optional precomputed embedding of query_text
+        
+    Returns:
+        List of relevant document chunks with metadata
+    """
+    if not settings.RETRIEVAL_HYBRID:
+        return await query_documents(query_text, top_k=top_k, character_id=character_id, query_embedding=query_embedding)
+    
     try:
-        df = pd.read_excel(file_path)
-        # Convert DataFrame to a readable string representation
-        buffer = io.StringIO()
-        df.to_csv(buffer)
-        return buffer.getvalue()
+        if query_embedding is None:
+            query_embedding = await embed_query(query_text)
+        return (await _cached_search([query_text], [query_embedding], top_k, character_id))[0]
     except Exception as e:
-        logger.error(f"Error extracting text from Excel: {str(e)}")
-        raise
+        logger.error(f"Error in hybrid search: {str(e)}")
+        # Fall back to regular vector search
+        logger.info("Falling back to vector search")
+        return await query_documents(query_text, top_k=top_k, character_id=character_id, query_embedding=query_embedding)
 
 
-def extract_text_from_csv(file_path: str) -> str:
-    """Extract text from CSV files"""
-    logger.info(f"Extracting text from CSV: {file_path}")
-    try:
-        # Use pandas for more robust CSV parsing
-        df = pd.read_csv(file_path)
-        # Convert DataFrame to a readable string representation
-        buffer = io.StringIO()
-        df.to_csv(buffer)
-        return buffer.getvalue()
-    except Exception as e:
-        # Fallback to simple CSV reading if pandas fails
-        try:
-            with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
-                reader = csv.reader(f)
-                rows = list(reader)
-                return "\n".join([",".join(row) for row in rows])
-        except Exception as inner_e:
-            logger.error(f"Error extracting text from CSV: {str(e)}, fallback also failed: {str(inner_e)}")
-            raise e
-
-
-def extract_text_from_text_file(file_path: str) -> str:
-    """Extract text from text files"""
-    logger.info(f"Extracting text from text file: {file_path}")
-    try:
-        with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
-            return f.read()
-    except Exception as e:
-        logger.error(f"Error extracting text from text file: {str(e)}")
-        raise
+async def _hybrid_query(
+    query_texts: List[str],
+    query_embeddings: List[List[float]],
+    top_k: int,
+    character_id: Optional[int]
+) -> List[List[Dict[str, Any]]]:
+    """
+    Fuse one vector query and one BM25 query per message; candidates are drawn
+    2x deep from each. Both searches run in the threadpool, concurrently.
+    """
+    depth = top_k * 2
+    scopes = [SHARED_SCOPE, character_id] if character_id is not None else None
+    
+    def lexical_queries() -> List[List[Dict[str, Any]]]:
+        return [lexical_index.query(query_text, top_k=depth, scopes=scopes) for query_text in query_texts]
+    
+    results, lexical_hits = await asyncio.gather(
+        run_in_threadpool(
+            vector_store.query,
+            query_embeddings=query_embeddings,
+            n_results=depth,
+            where=scope_filter(character_id) if character_id is not None else None,
+            include=["documents", "metadatas", "distances"]
+        ),
+        run_in_threadpool(lexical_queries),
+    )
+    fused_results = []
+    for i, query_text in enumerate(query_texts):
+        chunks = {}
+        vector_ranking = []
+        for chunk_id, doc, metadata in zip(results["ids"][i], results["documents"][i], results["metadatas"][i]):
+            chunks[chunk_id] = (doc, metadata)
+            vector_ranking.append(chunk_id)
+        lexical_ranking = []
+        for hit in lexical_hits[i]:
+            # Keyword-only matches are served from the lexical index's stored text
+            chunks.setdefault(hit["id"], (hit["text"], hit["metadata"]))
+            lexical_ranking.append(hit["id"])
+        fused = reciprocal_rank_fusion([vector_ranking, lexical_ranking], k=settings.RETRIEVAL_RRF_K)[:top_k]
+        fused_results.append([
+            {
+                "text": chunks[chunk_id][0],
+                "metadata": chunks[chunk_id][1],
+                "relevance_score": score,
+                "rank": rank
+            }
+            for rank, (chunk_id, score) in enumerate(fused, start=1)
+        ])
+    return fused_results
+
 
 def scrape_with_requests(url: str) -> str:
     """Scrape content from a URL using requests"""
@@ -694,137 +734,241 @@ async def original_extraction(page):
         logger.error(f"Error with original extraction: {str(e)}")
         return ""
 
-def chunk_text(text: str, title: str, doc_id: int, chunk_size: int = 1500, overlap: int = 200) -> List[Dict]:
-    """Split text into overlapping chunks for embedding"""
-    logger.info(f"Chunking text of length {len(text)} into chunks of size {chunk_size} with overlap {overlap}")
-    
-    chunks = []
-    
-    # If text is shorter than chunk_size, use it as a single chunk
-    if len(text) <= chunk_size:
-        chunks.append({
-            "id": f"doc_{doc_id}_chunk_0",
-            "text": text,
-            "title": title,
-            "doc_id": doc_id,
-            "chunk_index": 0
-        })
-        return chunks
-    
-    # Otherwise, split into chunks with overlap
-    current_idx = 0
-    chunk_index = 0
-    
-    while current_idx < len(text):
-        # Define chunk end (respect text boundaries)
-        end_idx = min(current_idx + chunk_size, len(text))
-        
-        # Try to find a good breakpoint (newline or period)
-        if end_idx < len(text):
-            # Look for the last period or newline in the last 200 chars of the chunk
-            last_period = text.rfind('.', current_idx, end_idx)
-            last_newline = text.rfind('\n', current_idx, end_idx)
-            
-            breakpoint = max(last_period, last_newline)
-            
-            # Only use the breakpoint if it's not too far from the end
-            if breakpoint > current_idx and (end_idx - breakpoint) < 200:
-                end_idx = breakpoint + 1  # Include the period or newline
-        
-        # Create the chunk
-        chunk_text = text[current_idx:end_idx].strip()
-        
-        if chunk_text:  # Only add non-empty chunks
-            chunks.append({
-                "id": f"doc_{doc_id}_chunk_{chunk_index}",
-                "text": chunk_text,
-                "title": f"{title} - Part {chunk_index + 1}",
-                "doc_id": doc_id,
-                "chunk_index": chunk_index
-            })
-            
-            chunk_index += 1
-        
-        # Move to next chunk with overlap
-        current_idx = end_idx - overlap if end_idx < len(text) else len(text)
-        
-        # Avoid getting stuck at the same position
-        if current_idx <= 0:
-            current_idx = end_idx
-    
-    logger.info(f"Created {len(chunks)} chunks from document")
-    return chunks
-
 # ... existing imports ...
 
 
 
-async def create_embeddings(chunks: List[Dict], document: Document) -> None:
-    """Create embeddings for text chunks and store them in ChromaDB"""
+async def create_embeddings(
+    chunks: List[Chunk],
+    document: Document,
+    on_progress: Optional[Callable[[float], None]] = None,
+    stored: Optional["StoredChunks"] = None,
+) -> None:
+    """
+    Create embeddings for text chunks and store them in ChromaDB.
+    on_progress, if given, receives the fraction of chunks stored after each batch.
+    stored, if given, holds the document's previous chunks, whose vectors are reused.
+    """
     logger.info(f"Creating embeddings for {len(chunks)} chunks")
 
     for i, chunk in enumerate(chunks):
-        preview_text = chunk["text"][:200] + "..." if len(chunk["text"]) > 200 else chunk["text"]
+        preview_text = chunk.text[:200] + "..." if len(chunk.text) > 200 else chunk.text
         logger.info(f"Chunk {i+1}/{len(chunks)} preview: {preview_text}")
-    
-    # Get or create collection
+
+    # Process chunks in batches to avoid rate limits
+    try:
+        for i in range(0, len(chunks), EMBEDDING_BATCH_SIZE):
+            await _store_chunks(chunks[i:i+EMBEDDING_BATCH_SIZE], document, stored)
+            if on_progress:
+                on_progress(min(i + EMBEDDING_BATCH_SIZE, len(chunks)) / len(chunks))
+    finally:
+        # Retrievals cached for this document's scope may now be missing its chunks
+        if stored is None or stored.changed:
+            retrieval_cache.invalidate_scopes([document_scope(document.character_id)])
+
+
+async def embed_pdf_streaming(
+    document: Document,
+    file_path: str,
+    on_progress: Optional[Callable[[float], None]] = None,
+    stored: Optional["StoredChunks"] = None,
+) -> int:
+    """
+    Extract, chunk and embed a PDF page by page. Chunks are embedded in
+    batches as soon as the pages they come from have been extracted, so
+    memory holds a few pages and one batch however long the PDF is.
+    on_progress, if given, receives the fraction of pages done, and stored
+    is used as in create_embeddings. Returns the number of chunks stored.
+    """
+    chunker = new_chunker(document.id)
+    pending: List[Chunk] = []
     try:
-        collection = chroma_client.get_or_create_collection(
-            name=collection_name,
-            metadata={"description": "Document embeddings for search"}
+        async for page_index, page_count, text in extraction_pool.iter_pdf_pages(
+            file_path, settings.PDF_PAGES_PER_EXTRACTION_JOB
+        ):
+            pending.extend(chunker.feed(text))
+            while len(pending) >= EMBEDDING_BATCH_SIZE:
+                await _store_chunks(pending[:EMBEDDING_BATCH_SIZE], document, stored)
+                del pending[:EMBEDDING_BATCH_SIZE]
+            if on_progress:
+                on_progress((page_index + 1) / page_count)
+        pending.extend(chunker.finish())
+        for i in range(0, len(pending), EMBEDDING_BATCH_SIZE):
+            await _store_chunks(pending[i:i+EMBEDDING_BATCH_SIZE], document, stored)
+    finally:
+        if chunker.chunk_count and (stored is None or stored.changed):
+            # Retrievals cached for this document's scope may now be missing its chunks
+            retrieval_cache.invalidate_scopes([document_scope(document.character_id)])
+    logger.info(f"Streamed {chunker.chunk_count} chunks from PDF document {document.id}")
+    return chunker.chunk_count
+
+
+def _content_hash(text: str) -> str:
+    """Hash of a chunk's embedding input; includes the model, so vectors from another model are never reused."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{settings.EMBEDDING_MODEL}:{settings.EMBEDDING_DIMENSIONS or 0}\n".encode("utf-8"))
+    digest.update(text.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class StoredChunks:
+    """
+    A document's chunks as they were stored before it is embedded again.
+
+    Each chunk's metadata carries the hash of its text. A chunk whose id and
+    metadata are unchanged is skipped, a chunk whose text is stored under
+    another id (because an edit shifted the chunk numbering) gets that
+    vector copied, and only the rest are sent to the embeddings API. Stored
+    chunks the new version no longer has are deleted by remove_stale().
+    """
+
+    def __init__(self, document_id: int):
+        self.document_id = document_id
+        results = vector_store.get(where={"doc_id": document_id}, include=["metadatas"])
+        self.metadatas: Dict[str, Dict[str, Any]] = {
+            chunk_id: metadata or {} for chunk_id, metadata in zip(results["ids"], results["metadatas"] or [])
+        }
+        self.ids_by_hash: Dict[str, str] = {}
+        for chunk_id, metadata in self.metadatas.items():
+            if metadata.get("content_hash"):
+                self.ids_by_hash.setdefault(metadata["content_hash"], chunk_id)
+        # Vectors of stored chunks overwritten with other text, by the hash of their old text
+        self.displaced: Dict[str, np.ndarray] = {}
+        self.seen: Set[str] = set()
+        # Whether anything was written or deleted, i.e. cached answers are now stale
+        self.changed = False
+        self.counts = {"unchanged": 0, "reused": 0, "embedded": 0, "removed": 0}
+
+    def is_current(self, chunk_id: str, metadata: Dict[str, Any]) -> bool:
+        """Whether a chunk is already stored with this text and metadata."""
+        previous = self.metadatas.get(chunk_id)
+        if previous is None:
+            return False
+        return all(previous.get(key) == value for key, value in metadata.items() if key != "timestamp")
+
+    def displace(self, ids: List[str], hashes: List[str]) -> None:
+        """
+        Keep the vectors of stored chunks about to be overwritten with other
+        text; when an edit shifts the numbering, later chunks still need them.
+        """
+        overwritten = [
+            chunk_id for chunk_id, content_hash in zip(ids, hashes)
+            if self.metadatas.get(chunk_id, {}).get("content_hash") not in (None, content_hash)
+        ]
+        if not overwritten:
+            return
+        found = vector_store.get(ids=overwritten, include=["embeddings"])
+        for chunk_id, vector in zip(found["ids"], found["embeddings"]):
+            old_hash = self.metadatas[chunk_id]["content_hash"]
+            self.displaced[old_hash] = np.asarray(vector, dtype=np.float32)
+            if self.ids_by_hash.get(old_hash) == chunk_id:
+                del self.ids_by_hash[old_hash]
+
+    def reusable_vectors(self, hashes: List[str]) -> Dict[str, List[float]]:
+        """Stored vectors for any of these text hashes, by hash."""
+        vectors = {h: self.displaced[h].tolist() for h in hashes if h in self.displaced}
+        sources = {self.ids_by_hash[h]: h for h in hashes if h not in vectors and h in self.ids_by_hash}
+        if sources:
+            found = vector_store.get(ids=list(sources), include=["embeddings"])
+            for chunk_id, vector in zip(found["ids"], found["embeddings"]):
+                vectors[sources[chunk_id]] = [float(value) for value in vector]
+        return vectors
+
+    def remove_stale(self) -> int:
+        """Delete the stored chunks the new version of the document no longer has."""
+        stale = [chunk_id for chunk_id in self.metadatas if chunk_id not in self.seen]
+        if stale:
+            vector_store.delete(ids=stale)
+            lexical_index.delete_chunks(stale)
+            self.changed = True
+            retrieval_cache.invalidate_scopes(
+                {self.metadatas[chunk_id].get("character_id", SHARED_SCOPE) for chunk_id in stale}
+            )
+        self.record("removed", len(stale))
+        logger.info(
+            f"Document {self.document_id}: {self.counts['embedded']} chunks embedded, "
+            f"{self.counts['reused']} reused, {self.counts['unchanged']} unchanged, {self.counts['removed']} removed"
+        )
+        return len(stale)
+
+    def record(self, outcome: str, count: int) -> None:
+        if count:
+            self.counts[outcome] += count
+            document_chunks.labels(outcome=outcome).inc(count)
+
+
+async def _store_chunks(batch: List[Chunk], document: Document, stored: Optional[StoredChunks] = None) -> None:
+    """
+    Embed one batch of chunks and add it to the vector store and keyword index.
+    With stored, unchanged chunks are skipped and known text reuses its vector.
+    """
+    # Extract data for embedding
+    ids = [chunk.id for chunk in batch]
+    texts = [chunk.text for chunk in batch]
+    # Create metadata with URL for link documents
+    metadatas = []
+    for chunk in batch:
+        metadata = {
+            "title": chunk.title(document.title),
+            "doc_id": chunk.doc_id,
+            "chunk_index": chunk.index,
+            "document_title": document.title,
+            "document_type": document.document_type.value,
+            "original_filename": document.original_filename,
+            "character_id": document_scope(document.character_id),
+            "content_hash": _content_hash(chunk.text),
+            "timestamp": datetime.now().isoformat()
+        }
+
+        # Add URL to metadata if it's a link document
+        if document.content_type == ContentType.LINK:
+            metadata["url"] = document.file_path
+
+        metadatas.append(metadata)
+
+    embeddings: List[Optional[List[float]]] = [None] * len(ids)
+    if stored is not None:
+        stored.seen.update(ids)
+        keep = [n for n in range(len(ids)) if not stored.is_current(ids[n], metadatas[n])]
+        stored.record("unchanged", len(ids) - len(keep))
+        if not keep:
+            return
+        ids = [ids[n] for n in keep]
+        texts = [texts[n] for n in keep]
+        metadatas = [metadatas[n] for n in keep]
+        # Text already embedded somewhere in this document keeps its vector
+        hashes = [metadata["content_hash"] for metadata in metadatas]
+        vectors = stored.reusable_vectors(hashes)
+        embeddings = [vectors.get(content_hash) for content_hash in hashes]
+        stored.displace(ids, hashes)
+        stored.changed = True
+
+    try:
+        # Create embeddings for the text not already embedded
+        missing = [n for n, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            for n, embedding in zip(missing, await embed_texts([texts[n] for n in missing])):
+                embeddings[n] = embedding
+        if stored is not None:
+            stored.record("embedded", len(missing))
+            stored.record("reused", len(ids) - len(missing))
+
+        # Upsert so a retried job overwrites chunks left by a failed attempt
+        vector_store.upsert(
+            ids=ids,
+            embeddings=embeddings,
+            metadatas=metadatas,
+            documents=texts
         )
+        # Keep the keyword index in step with the vector store
+        lexical_index.add_chunks(ids, texts, metadatas)
+
+        logger.info(f"Added batch of {len(ids)} embeddings to ChromaDB ({len(missing)} newly embedded)")
+
+        # Rate limiting
+        if missing:
+            await asyncio.sleep(0.5)
+
     except Exception as e:
-        logger.error(f"Error creating ChromaDB collection: {str(e)}")
+        logger.error(f"Error creating embeddings: {str(e)}")
         raise
-    
-    # Process chunks in batches to avoid rate limits
-    batch_size = 10
-    for i in range(0, len(chunks), batch_size):
-        batch = chunks[i:i+batch_size]
-        
-        # Extract data for embedding
-        ids = [chunk["id"] for chunk in batch]
-        texts = [chunk["text"] for chunk in batch]
-        # Create metadata with URL for link documents
-        metadatas = []
-        for chunk in batch:
-            metadata = {
-                "title": chunk["title"],
-                "doc_id": chunk["doc_id"],
-                "chunk_index": chunk["chunk_index"],
-                "document_title": document.title,
-                "document_type": document.document_type.value,
-                "original_filename": document.original_filename,
-                "timestamp": datetime.now().isoformat()
-            }
-            
-            # Add URL to metadata if it's a link document
-            if document.content_type == ContentType.LINK:
-                metadata["url"] = document.file_path
-                
-            metadatas.append(metadata)
-        
-        try:
-            # Create embeddings
-            response = openai_client.embeddings.create(
-                input=texts,
-                model="text-embedding-3-large"  # Or your preferred embedding model
-            )
-            embeddings = [embedding.embedding for embedding in response.data]
-            
-            # Add to ChromaDB
-            collection.add(
-                ids=ids,
-                embeddings=embeddings,
-                metadatas=metadatas,
-                documents=texts
-            )
-            
-            logger.info(f"Added batch of {len(batch)} embeddings to ChromaDB")
-            
-            # Rate limiting
-            await asyncio.sleep(0.5)
-            
-        except Exception as e:
-            logger.error(f"Error creating embeddings: {str(e)}")
-            raise
\ No newline at end of file
@@ -0,0 +1,228 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(text: str) -> str:
+    """Normalize query text so trivially different spellings share a cache entry."""
+    return " ".join(text.lower().split())
+
+
+class QueryEmbeddingCache:
+    """
+    Two-tier cache of query embeddings keyed on (model, normalized query text).
+
+    The first tier is a bounded in-memory LRU. The optional second tier is a
+    SQLite file that survives restarts; entries found there are promoted back
+    into memory. Disk reads run in the threadpool, and new entries are written
+    in batches rather than one commit per query. The disk tier keeps at most
+    max_disk_rows entries; the oldest are pruned when a write goes over.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 10000,
+        db_path: Optional[str] = None,
+        max_disk_rows: int = 100000,
+        write_batch_size: int = 50,
+        write_interval: float = 5.0,
+    ):
+        self.max_size = max_size
+        self.db_path = db_path
+        self.max_disk_rows = max_disk_rows
+        self.write_batch_size = write_batch_size
+        self.write_interval = write_interval
+        self._entries: "OrderedDict[Tuple[str, str], List[float]]" = OrderedDict()
+        # Entries not yet written to disk
+        self._pending: Dict[Tuple[str, str], List[float]] = {}
+        self._last_write = time.monotonic()
+        self._lock = threading.Lock()
+        # Serializes use of the SQLite connection, which runs in threadpool workers
+        self._db_lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._disk_rows = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.pruned = 0
+
+        if db_path:
+            directory = os.path.dirname(os.path.abspath(db_path))
+            os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                "model TEXT NOT NULL, query TEXT NOT NULL, embedding BLOB NOT NULL, "
+                "stored_at REAL NOT NULL DEFAULT 0, "
+                "PRIMARY KEY (model, query))"
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(query_embeddings)")}
+            if "stored_at" not in columns:
+                # Files written before pruning existed; their rows count as oldest
+                self._conn.execute("ALTER TABLE query_embeddings ADD COLUMN stored_at REAL NOT NULL DEFAULT 0")
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_query_embeddings_stored_at ON query_embeddings (stored_at)"
+            )
+            self._conn.commit()
+            self._disk_rows = self._conn.execute("SELECT COUNT(*) FROM query_embeddings").fetchone()[0]
+            self._prune()
+            logger.info(f"Query embedding cache persisted at {db_path} ({self._disk_rows} entries)")
+
+    async def get(self, text: str, model: str) -> Optional[List[float]]:
+        """Return the cached embedding for a query, or None on a miss."""
+        return (await self.get_many([text], model))[0]
+
+    async def get_many(self, texts: List[str], model: str) -> List[Optional[List[float]]]:
+        """Look up many queries; the ones not in memory are read from disk in one threadpool call."""
+        keys = [(model, normalize_query(text)) for text in texts]
+        embeddings: List[Optional[List[float]]] = []
+        with self._lock:
+            for key in keys:
+                embedding = self._entries.get(key)
+                if embedding is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                embeddings.append(embedding)
+
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing and self._conn is not None:
+            found = await run_in_threadpool(self._read, {keys[i] for i in missing})
+            with self._lock:
+                for key, embedding in found.items():
+                    self._remember(key, embedding)
+                for i in missing:
+                    embeddings[i] = found.get(keys[i])
+                    if embeddings[i] is not None:
+                        self.disk_hits += 1
+        with self._lock:
+            self.misses += sum(1 for embedding in embeddings if embedding is None)
+        return embeddings
+
+    async def set(self, text: str, model: str, embedding: List[float]) -> None:
+        """Store a query embedding in memory and queue it for the disk tier."""
+        await self.set_many([text], model, [embedding])
+
+    async def set_many(self, texts: List[str], model: str, embeddings: List[List[float]]) -> None:
+        """Store many query embeddings; disk writes are flushed in batches."""
+        with self._lock:
+            for text, embedding in zip(texts, embeddings):
+                key = (model, normalize_query(text))
+                self._remember(key, embedding)
+                if self._conn is not None:
+                    self._pending[key] = embedding
+            due = self._pending and (
+                len(self._pending) >= self.write_batch_size
+                or time.monotonic() - self._last_write >= self.write_interval
+            )
+        if due:
+            await run_in_threadpool(self.flush)
+
+    def _read(self, keys: set) -> Dict[Tuple[str, str], List[float]]:
+        found = {}
+        with self._lock:
+            # Entries waiting to be written may have been evicted from memory already
+            for key in keys:
+                if key in self._pending:
+                    found[key] = self._pending[key]
+        with self._db_lock:
+            for key in keys - found.keys():
+                row = self._conn.execute(
+                    "SELECT embedding FROM query_embeddings WHERE model = ? AND query = ?",
+                    key,
+                ).fetchone()
+                if row is not None:
+                    found[key] = array("f", row[0]).tolist()
+        return found
+
+    def flush(self) -> None:
+        """Write queued entries to the disk tier and prune it back under its row cap."""
+        if self._conn is None:
+            return
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_write = time.monotonic()
+        if not pending:
+            return
+        now = time.time()
+        try:
+            with self._db_lock:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO query_embeddings (model, query, embedding, stored_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    [(model, query, array("f", embedding).tobytes(), now) for (model, query), embedding in pending.items()],
+                )
+                self._conn.commit()
+                # Replaced rows are over-counted; _prune() recounts before deleting anything
+                self._disk_rows += len(pending)
+                self._prune()
+        except sqlite3.Error as e:
+            logger.error(f"Error writing query embedding cache: {str(e)}")
+
+    def _prune(self) -> None:
+        # Called with the connection lock held, or before the cache is shared
+        if self._disk_rows <= self.max_disk_rows:
+            return
+        self._disk_rows = self._conn.execute("SELECT COUNT(*) FROM query_embeddings").fetchone()[0]
+        if self._disk_rows <= self.max_disk_rows:
+            return
+        # Prune a tenth below the cap so the next few batches do not prune again
+        excess = self._disk_rows - self.max_disk_rows + self.max_disk_rows // 10
+        self._conn.execute(
+            "DELETE FROM query_embeddings WHERE rowid IN "
+            "(SELECT rowid FROM query_embeddings ORDER BY stored_at LIMIT ?)",
+            (excess,),
+        )
+        self._conn.commit()
+        self._disk_rows = max(self._disk_rows - excess, 0)
+        self.pruned += excess
+        logger.info(f"Pruned {excess} query embeddings from the disk cache")
+
+    def _remember(self, key: Tuple[str, str], embedding: List[float]) -> None:
+        self._entries[key] = embedding
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Drop all cached embeddings from both tiers."""
+        with self._lock:
+            self._entries.clear()
+            self._pending.clear()
+        if self._conn is not None:
+            with self._db_lock:
+                self._conn.execute("DELETE FROM query_embeddings")
+                self._conn.commit()
+                self._disk_rows = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters and the current in-memory size."""
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "disk_rows": self._disk_rows,
+            "max_disk_rows": self.max_disk_rows,
+            "pending_writes": len(self._pending),
+            "pruned": self.pruned,
+        }
+
+
+# Create a global instance of the cache
+query_embedding_cache = QueryEmbeddingCache(
+    max_size=settings.QUERY_EMBEDDING_CACHE_SIZE,
+    db_path=settings.QUERY_EMBEDDING_CACHE_PATH or None,
+    max_disk_rows=settings.QUERY_EMBEDDING_CACHE_MAX_DISK_ROWS,
+)
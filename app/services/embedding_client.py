@@ -0,0 +1,126 @@
+import logging
+from typing import List, Optional
+
+import httpx
+import numpy as np
+from openai import AsyncOpenAI
+
+from app.core.config import settings
+from app.services.embedding_cache import query_embedding_cache
+
+logger = logging.getLogger(__name__)
+
+# Shared async client, created lazily so every request on the worker reuses
+# the same pooled HTTP connections to the embeddings API.
+_http_client: Optional[httpx.AsyncClient] = None
+_openai_client: Optional[AsyncOpenAI] = None
+
+
+def get_async_openai_client() -> AsyncOpenAI:
+    """Return the process-wide AsyncOpenAI client, creating it on first use."""
+    global _http_client, _openai_client
+    if _openai_client is None:
+        _http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(
+                settings.OPENAI_TIMEOUT_SECONDS,
+                connect=settings.OPENAI_CONNECT_TIMEOUT_SECONDS,
+            ),
+            limits=httpx.Limits(
+                max_connections=settings.OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+            ),
+        )
+        _openai_client = AsyncOpenAI(
+            api_key=settings.OPENAI_API_KEY or None,
+            base_url=settings.OPENAI_BASE_URL,
+            http_client=_http_client,
+            max_retries=settings.OPENAI_MAX_RETRIES,
+        )
+        logger.info(
+            f"Initialized async OpenAI client (max_connections={settings.OPENAI_MAX_CONNECTIONS}, "
+            f"timeout={settings.OPENAI_TIMEOUT_SECONDS}s)"
+        )
+    return _openai_client
+
+
+def truncate_embedding(embedding: List[float], dimensions: int) -> List[float]:
+    """
+    Shorten an embedding to its first dimensions values and re-normalize.
+    For text-embedding-3 models this matches what the API returns when called
+    with the same dimensions parameter, so stored vectors can be shrunk
+    without re-embedding.
+    """
+    vector = np.asarray(embedding[:dimensions], dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm else vector).tolist()
+
+
+def _cache_model_key(model: str) -> str:
+    # Embeddings of different sizes must not share query cache entries
+    return f"{model}:{settings.EMBEDDING_DIMENSIONS}" if settings.EMBEDDING_DIMENSIONS else model
+
+
+async def embed_texts(texts: List[str], model: Optional[str] = None) -> List[List[float]]:
+    """
+    Create embeddings for a batch of texts without blocking the event loop.
+
+    Args:
+        texts: The texts to embed
+        model: Embedding model name, defaults to settings.EMBEDDING_MODEL
+
+    Returns:
+        One embedding vector per input text, in input order, with
+        settings.EMBEDDING_DIMENSIONS values when that is set
+    """
+    if not texts:
+        return []
+    client = get_async_openai_client()
+    extra = {"dimensions": settings.EMBEDDING_DIMENSIONS} if settings.EMBEDDING_DIMENSIONS else {}
+    response = await client.embeddings.create(
+        input=texts,
+        model=model or settings.EMBEDDING_MODEL,
+        **extra,
+    )
+    return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+
+async def embed_query(text: str, model: Optional[str] = None) -> List[float]:
+    """Create the embedding for a single query string, consulting the query cache first."""
+    model = model or settings.EMBEDDING_MODEL
+    cache_key = _cache_model_key(model)
+    cached = await query_embedding_cache.get(text, cache_key)
+    if cached is not None:
+        return cached
+    embeddings = await embed_texts([text], model=model)
+    await query_embedding_cache.set(text, cache_key, embeddings[0])
+    return embeddings[0]
+
+
+async def embed_queries(texts: List[str], model: Optional[str] = None) -> List[List[float]]:
+    """
+    Embed many query strings with at most one embeddings API call.
+    Cached queries are served from the query cache; the rest are sent together.
+    """
+    model = model or settings.EMBEDDING_MODEL
+    cache_key = _cache_model_key(model)
+    embeddings: List[Optional[List[float]]] = await query_embedding_cache.get_many(texts, cache_key)
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    if missing:
+        # Deduplicate so repeated messages in one batch are embedded once
+        unique_texts = list(dict.fromkeys(texts[i] for i in missing))
+        fresh = dict(zip(unique_texts, await embed_texts(unique_texts, model=model)))
+        await query_embedding_cache.set_many(list(fresh), cache_key, list(fresh.values()))
+        for i in missing:
+            embeddings[i] = fresh[texts[i]]
+    return embeddings
+
+
+async def close_async_openai_client() -> None:
+    """Close the shared HTTP connection pool. Called on application shutdown."""
+    global _http_client, _openai_client
+    if _openai_client is not None:
+        await _openai_client.close()
+    if _http_client is not None and not _http_client.is_closed:
+        await _http_client.aclose()
+    _openai_client = None
+    _http_client = None
@@ -0,0 +1,278 @@
+import asyncio
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.crud import ingestion_jobs
+from app.crud.documents import get as get_document
+from app.db.session import SessionLocal
+from app.models.ingestion_job import IngestionJob, JobStatus
+from app.services.embedding import process_document
+
+logger = logging.getLogger(__name__)
+
+# Longest a worker waits before retrying after a database error
+MAX_WORKER_BACKOFF_SECONDS = 60.0
+
+
+class _ProgressWriter:
+    """
+    Records a running job's progress from the threadpool. process_document
+    reports progress synchronously, so each report only notes the latest
+    value; one task at a time writes it, skipping values superseded while
+    a write was in flight.
+    """
+
+    def __init__(self, queue: "IngestionQueue", job_id: int):
+        self.queue = queue
+        self.job_id = job_id
+        self._latest: Optional[Tuple[str, float]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def report(self, stage: str, progress: float) -> None:
+        self._latest = (stage, round(progress, 1))
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._write())
+
+    async def _write(self) -> None:
+        while self._latest is not None:
+            (stage, progress), self._latest = self._latest, None
+            try:
+                await run_in_threadpool(
+                    self.queue._in_session, ingestion_jobs.update_progress,
+                    id=self.job_id, stage=stage, progress=progress, lease_seconds=self.queue.lease_seconds,
+                )
+            except Exception as e:
+                logger.warning(f"Could not record progress of ingestion job {self.job_id}: {str(e)}")
+
+    async def flush(self) -> None:
+        """Wait for the last reported progress to be written."""
+        if self._task is not None:
+            await self._task
+
+    def cancel(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+
+
+class IngestionQueue:
+    """
+    Durable background queue for document ingestion.
+
+    Jobs are rows in the ingestion_jobs table, so queued work survives a
+    restart. A bounded pool of worker tasks claims due jobs, runs
+    process_document and records the stage and progress on the job. Failed
+    attempts are retried with exponential backoff. A running job holds a
+    lease that progress updates extend; if its worker dies the lease lapses
+    and the job is queued again. Several app processes can share the table
+    because claims are atomic conditional updates.
+    """
+
+    def __init__(
+        self,
+        workers: int = 2,
+        max_attempts: int = 3,
+        retry_backoff_seconds: float = 30.0,
+        poll_interval: float = 2.0,
+        lease_seconds: int = 900,
+    ):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.tasks: List[asyncio.Task] = []
+        self._reaper: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self.succeeded_count = 0
+        self.failed_count = 0
+        self.retried_count = 0
+
+    @property
+    def is_running(self) -> bool:
+        """True while any worker task is alive; the lease reaper alone does not count."""
+        return any(not task.done() for task in self.tasks)
+
+    async def start(self) -> None:
+        """Start the worker pool and the lease reaper."""
+        if self.is_running:
+            return
+        self._wake = asyncio.Event()
+        self.tasks = [asyncio.create_task(self._worker_loop(n)) for n in range(self.workers)]
+        self._reaper = asyncio.create_task(self._reaper_loop())
+        logger.info(f"Ingestion queue started with {self.workers} workers")
+
+    async def stop(self) -> None:
+        """Stop the workers; jobs they were running go back on the queue."""
+        tasks = self.tasks + ([self._reaper] if self._reaper is not None else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.tasks = []
+        self._reaper = None
+        logger.info("Ingestion queue stopped")
+
+    def enqueue(self, db: Session, *, document_id: int, reembed: bool = False) -> IngestionJob:
+        """
+        Queue a document for embedding and return its job. A document that
+        already has a queued job gets that job back, switched to a re-embed if
+        one is requested. A re-embed requested while a plain job is running
+        gets a follow-up job, which runs once the running one finishes.
+        """
+        job = ingestion_jobs.get_active_for_document(db, document_id=document_id)
+        if job is not None and reembed and not job.reembed:
+            if job.status == JobStatus.QUEUED.value and ingestion_jobs.request_reembed(db, id=job.id):
+                db.refresh(job)
+                logger.info(f"Ingestion job {job.id} for document {document_id} will re-embed")
+            else:
+                job = None
+        if job is None:
+            job = ingestion_jobs.create(
+                db, document_id=document_id, reembed=reembed, max_attempts=self.max_attempts
+            )
+            logger.info(f"Queued ingestion job {job.id} for document {document_id}")
+        if self._wake is not None:
+            self._wake.set()
+        return job
+
+    async def _worker_loop(self, worker: int) -> None:
+        failures = 0
+        while True:
+            try:
+                job = await run_in_threadpool(self._claim)
+                failures = 0
+                if job is None:
+                    # Sleep until a job is enqueued in this process or the poll interval passes
+                    self._wake.clear()
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self._run(job, worker)
+            except Exception as e:
+                # A database error must not end the worker; back off and try again
+                failures += 1
+                delay = min(self.poll_interval * 2 ** failures, MAX_WORKER_BACKOFF_SECONDS)
+                logger.error(f"Ingestion worker {worker} error, retrying in {delay:.0f}s: {str(e)}")
+                await asyncio.sleep(delay)
+
+    async def _reaper_loop(self) -> None:
+        while True:
+            try:
+                requeued = await run_in_threadpool(self._requeue_expired)
+                if requeued:
+                    logger.warning(f"Requeued {requeued} ingestion jobs whose worker stopped")
+                    self._wake.set()
+            except Exception as e:
+                logger.error(f"Error requeueing expired ingestion jobs: {str(e)}")
+            await asyncio.sleep(max(self.lease_seconds / 4, self.poll_interval))
+
+    def _claim(self) -> Optional[IngestionJob]:
+        db = SessionLocal()
+        try:
+            job = ingestion_jobs.claim_next(db, lease_seconds=self.lease_seconds)
+            if job is not None:
+                db.expunge(job)
+            return job
+        finally:
+            db.close()
+
+    def _requeue_expired(self) -> int:
+        db = SessionLocal()
+        try:
+            return ingestion_jobs.requeue_expired(db)
+        finally:
+            db.close()
+
+    def _in_session(self, fn: Callable[..., Any], **kwargs: Any) -> Any:
+        """Call fn(db, **kwargs) with a session of its own; run in the threadpool."""
+        db = SessionLocal()
+        try:
+            return fn(db, **kwargs)
+        finally:
+            db.close()
+
+    def _document_state(self, document_id: int) -> Optional[bool]:
+        """None if the document no longer exists, otherwise whether it is embedded."""
+        db = SessionLocal()
+        try:
+            document = get_document(db, id=document_id)
+            return None if document is None else bool(document.is_embedded)
+        finally:
+            db.close()
+
+    async def _run(self, job: IngestionJob, worker: int) -> None:
+        logger.info(f"Worker {worker} running ingestion job {job.id} (document {job.document_id}, attempt {job.attempts})")
+        progress = _ProgressWriter(self, job.id)
+        try:
+            if await run_in_threadpool(self._document_state, job.document_id) is None:
+                await run_in_threadpool(
+                    self._in_session, ingestion_jobs.mark_failed,
+                    job=job, error="Document not found", retry_delay_seconds=0, retry=False,
+                )
+                self.failed_count += 1
+                return
+            db = SessionLocal()
+            try:
+                await process_document(job.document_id, db, job.reembed, on_progress=progress.report)
+            finally:
+                db.close()
+            await progress.flush()
+            if await run_in_threadpool(self._document_state, job.document_id):
+                await run_in_threadpool(self._in_session, ingestion_jobs.mark_succeeded, id=job.id)
+                self.succeeded_count += 1
+                logger.info(f"Ingestion job {job.id} succeeded")
+            else:
+                await self._record_failure(job, "Document processing failed; see the embedding logs")
+        except asyncio.CancelledError:
+            progress.cancel()
+            try:
+                await run_in_threadpool(self._in_session, ingestion_jobs.release, id=job.id)
+                logger.info(f"Ingestion job {job.id} interrupted by shutdown and requeued")
+            except Exception as e:
+                # The lease lapses and the reaper requeues the job instead
+                logger.error(f"Could not requeue interrupted ingestion job {job.id}: {str(e)}")
+            raise
+        except Exception as e:
+            logger.error(f"Ingestion job {job.id} failed: {str(e)}")
+            progress.cancel()
+            await self._record_failure(job, str(e))
+
+    async def _record_failure(self, job: IngestionJob, error: str) -> None:
+        delay = self.retry_backoff_seconds * 2 ** (job.attempts - 1)
+        if await run_in_threadpool(
+            self._in_session, ingestion_jobs.mark_failed, job=job, error=error, retry_delay_seconds=delay
+        ):
+            self.retried_count += 1
+            logger.info(f"Ingestion job {job.id} will retry in {delay:.0f}s")
+        else:
+            self.failed_count += 1
+            logger.error(f"Ingestion job {job.id} failed after {job.attempts} attempts")
+
+    def stats(self, db: Session) -> Dict[str, object]:
+        """Job counts by status, plus this process's outcome counters."""
+        counts = dict(db.query(IngestionJob.status, func.count(IngestionJob.id)).group_by(IngestionJob.status).all())
+        return {
+            "running": self.is_running,
+            "workers": self.workers,
+            "workers_alive": sum(1 for task in self.tasks if not task.done()),
+            "jobs": counts,
+            "succeeded": self.succeeded_count,
+            "retried": self.retried_count,
+            "failed": self.failed_count,
+        }
+
+
+# Create a global instance of the ingestion queue
+ingestion_queue = IngestionQueue(
+    workers=settings.INGESTION_WORKERS,
+    max_attempts=settings.INGESTION_MAX_ATTEMPTS,
+    retry_backoff_seconds=settings.INGESTION_RETRY_BACKOFF_SECONDS,
+    poll_interval=settings.INGESTION_POLL_INTERVAL_SECONDS,
+    lease_seconds=settings.INGESTION_JOB_LEASE_SECONDS,
+)
@@ -0,0 +1,262 @@
+import json
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+# Very common English words carry no ranking signal and only bloat postings
+STOPWORDS = frozenset(
+    "a an and are as at be but by do does for from has have how i if in is it its "
+    "me my of on or so than that the their them then there these they this to was "
+    "we were what when where which who why will with you your".split()
+)
+# Okapi BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens, minus stopwords; hyphenated names split into parts."""
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class LexicalIndex:
+    """
+    BM25 inverted index over chunk text, kept in SQLite.
+
+    Chunk text and metadata are stored with the postings, so keyword-only
+    matches are returned from here without a vector store lookup. Terms and
+    chunks are referenced by integer ids and postings are a WITHOUT ROWID
+    table keyed on (term, chunk), which keeps the file compact. Chunks are
+    added and removed incrementally as documents are embedded and deleted;
+    WAL mode lets every worker process read while one writes, and each
+    thread reads through its own connection. A query term scores at most
+    max_postings_per_term chunks, those where it occurs most often, so
+    common terms cost the same as rare ones.
+    """
+
+    def __init__(self, db_path: Optional[str] = None, max_postings_per_term: int = 5000):
+        self.db_path = db_path
+        self.max_postings_per_term = max_postings_per_term
+        self._lock = threading.Lock()
+        self._readers = threading.local()
+        if db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path or ":memory:", check_same_thread=False)
+        if db_path:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "id INTEGER PRIMARY KEY, chunk_id TEXT NOT NULL UNIQUE, doc_id INTEGER NOT NULL, "
+            "scope INTEGER NOT NULL, length INTEGER NOT NULL, text TEXT NOT NULL, metadata TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS ix_chunks_doc_id ON chunks (doc_id);"
+            "CREATE TABLE IF NOT EXISTS terms (id INTEGER PRIMARY KEY, term TEXT NOT NULL UNIQUE, df INTEGER NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS postings ("
+            "term INTEGER NOT NULL, chunk INTEGER NOT NULL, tf INTEGER NOT NULL, "
+            "PRIMARY KEY (term, chunk)) WITHOUT ROWID;"
+            # Lets a query read a common term's highest-tf postings without scanning the rest
+            "CREATE INDEX IF NOT EXISTS ix_postings_term_tf ON postings (term, tf DESC);"
+            # Corpus totals for BM25, maintained with each write instead of scanned per query
+            "CREATE TABLE IF NOT EXISTS corpus (id INTEGER PRIMARY KEY CHECK (id = 1), "
+            "chunks INTEGER NOT NULL, length INTEGER NOT NULL);"
+            "INSERT OR IGNORE INTO corpus (id, chunks, length) VALUES (1, 0, 0);"
+        )
+        self._conn.commit()
+
+    @contextmanager
+    def _reader(self) -> Iterator[sqlite3.Connection]:
+        """A connection for reads: this thread's own for a file, the shared one (locked) in memory."""
+        if not self.db_path:
+            with self._lock:
+                yield self._conn
+            return
+        conn = getattr(self._readers, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._readers.conn = conn
+        yield conn
+
+    # Writing
+
+    def add_chunks(self, ids: Sequence[str], texts: Sequence[str], metadatas: Sequence[Dict[str, Any]]) -> None:
+        """Index chunks, replacing any already indexed under the same ids."""
+        with self._lock, self._conn:
+            self._remove(self._conn.execute(
+                f"SELECT id, text FROM chunks WHERE chunk_id IN ({','.join('?' * len(ids))})", list(ids)
+            ).fetchall())
+            for chunk_id, text, metadata in zip(ids, texts, metadatas):
+                counts = Counter(tokenize(text))
+                row = self._conn.execute(
+                    "INSERT INTO chunks (chunk_id, doc_id, scope, length, text, metadata) VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        chunk_id,
+                        metadata.get("doc_id", 0),
+                        metadata.get("character_id", 0),
+                        sum(counts.values()),
+                        text,
+                        json.dumps(metadata),
+                    ),
+                ).lastrowid
+                self._conn.execute(
+                    "UPDATE corpus SET chunks = chunks + 1, length = length + ? WHERE id = 1", (sum(counts.values()),)
+                )
+                for term, tf in counts.items():
+                    self._conn.execute(
+                        "INSERT INTO terms (term, df) VALUES (?, 1) ON CONFLICT (term) DO UPDATE SET df = df + 1",
+                        (term,),
+                    )
+                    self._conn.execute(
+                        "INSERT INTO postings (term, chunk, tf) SELECT id, ?, ? FROM terms WHERE term = ?",
+                        (row, tf, term),
+                    )
+
+    def delete_document(self, document_id: int) -> int:
+        """Remove all of a document's chunks. Returns the number removed."""
+        with self._lock, self._conn:
+            rows = self._conn.execute("SELECT id, text FROM chunks WHERE doc_id = ?", (document_id,)).fetchall()
+            self._remove(rows)
+        return len(rows)
+
+    def delete_chunks(self, ids: Sequence[str]) -> int:
+        """Remove chunks by id. Returns the number removed."""
+        removed = 0
+        with self._lock, self._conn:
+            # Stay under SQLite's limit on bound parameters
+            for start in range(0, len(ids), 500):
+                batch = list(ids[start:start + 500])
+                rows = self._conn.execute(
+                    f"SELECT id, text FROM chunks WHERE chunk_id IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                self._remove(rows)
+                removed += len(rows)
+        return removed
+
+    def set_document_scope(self, document_id: int, scope: int) -> None:
+        """Re-tag a document's chunks with a new character scope."""
+        with self._lock, self._conn:
+            rows = self._conn.execute("SELECT id, metadata FROM chunks WHERE doc_id = ?", (document_id,)).fetchall()
+            self._conn.executemany(
+                "UPDATE chunks SET scope = ?, metadata = ? WHERE id = ?",
+                [(scope, json.dumps({**json.loads(metadata), "character_id": scope}), row) for row, metadata in rows],
+            )
+
+    def rebuild(self, chunks: Iterable[Tuple[Sequence[str], Sequence[str], Sequence[Dict[str, Any]]]]) -> int:
+        """Replace the whole index from (ids, texts, metadatas) batches. Returns the chunk count."""
+        with self._lock, self._conn:
+            for table in ("postings", "terms", "chunks"):
+                self._conn.execute(f"DELETE FROM {table}")
+            self._conn.execute("UPDATE corpus SET chunks = 0, length = 0 WHERE id = 1")
+        indexed = 0
+        for ids, texts, metadatas in chunks:
+            self.add_chunks(ids, texts, metadatas)
+            indexed += len(ids)
+        logger.info(f"Rebuilt lexical index with {indexed} chunks")
+        return indexed
+
+    def _remove(self, rows: List[Tuple[int, str]]) -> None:
+        """Drop chunks and their postings; the caller holds the lock and transaction."""
+        for row, text in rows:
+            tokens = tokenize(text)
+            terms = list(set(tokens))
+            if terms:
+                placeholders = ",".join("?" * len(terms))
+                self._conn.execute(
+                    f"DELETE FROM postings WHERE chunk = ? AND term IN (SELECT id FROM terms WHERE term IN ({placeholders}))",
+                    [row, *terms],
+                )
+                self._conn.execute(f"UPDATE terms SET df = df - 1 WHERE term IN ({placeholders})", terms)
+            self._conn.execute("DELETE FROM chunks WHERE id = ?", (row,))
+            self._conn.execute(
+                "UPDATE corpus SET chunks = chunks - 1, length = length - ? WHERE id = 1", (len(tokens),)
+            )
+        if rows:
+            self._conn.execute("DELETE FROM terms WHERE df <= 0")
+
+    # Reading
+
+    def query(self, query_text: str, top_k: int = 5, scopes: Optional[Sequence[int]] = None) -> List[Dict[str, Any]]:
+        """
+        Rank chunks against the query with BM25.
+
+        Args:
+            query_text: Free-text query
+            top_k: Number of results to return
+            scopes: Optional chunk scopes (character_id metadata values) to search
+
+        Returns:
+            Chunks as {"id", "text", "metadata", "score"}, best first
+        """
+        terms = list(dict.fromkeys(tokenize(query_text)))
+        if not terms or top_k <= 0:
+            return []
+        with self._reader() as conn:
+            total, total_length = conn.execute("SELECT chunks, length FROM corpus WHERE id = 1").fetchone()
+            if not total:
+                return []
+            average_length = total_length / total or 1
+            scope_clause = f" AND c.scope IN ({','.join('?' * len(scopes))})" if scopes else ""
+            scores: Dict[int, float] = {}
+            for term_id, df in conn.execute(
+                f"SELECT id, df FROM terms WHERE term IN ({','.join('?' * len(terms))})", terms
+            ).fetchall():
+                idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+                for row, tf, length in conn.execute(
+                    "SELECT p.chunk, p.tf, c.length FROM postings p JOIN chunks c ON c.id = p.chunk "
+                    f"WHERE p.term = ?{scope_clause} ORDER BY p.tf DESC LIMIT ?",
+                    [term_id, *(scopes or []), self.max_postings_per_term],
+                ):
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * length / average_length)
+                    scores[row] = scores.get(row, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+            best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+            if not best:
+                return []
+            rows = {
+                row: (chunk_id, text, metadata)
+                for row, chunk_id, text, metadata in conn.execute(
+                    f"SELECT id, chunk_id, text, metadata FROM chunks WHERE id IN ({','.join('?' * len(best))})",
+                    [row for row, _ in best],
+                )
+            }
+        return [
+            {"id": rows[row][0], "text": rows[row][1], "metadata": json.loads(rows[row][2]), "score": score}
+            for row, score in best
+        ]
+
+    def count(self) -> int:
+        """Number of indexed chunks."""
+        with self._reader() as conn:
+            return conn.execute("SELECT chunks FROM corpus WHERE id = 1").fetchone()[0]
+
+    def stats(self) -> Dict[str, int]:
+        """Chunk and vocabulary sizes."""
+        with self._lock:
+            chunks = self._conn.execute("SELECT chunks FROM corpus WHERE id = 1").fetchone()[0]
+            terms = self._conn.execute("SELECT COUNT(*) FROM terms").fetchone()[0]
+            postings = self._conn.execute("SELECT COUNT(*) FROM postings").fetchone()[0]
+        return {"chunks": chunks, "terms": terms, "postings": postings}
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Fuse ranked id lists: each id scores sum(1 / (k + rank)) over the lists
+    it appears in. Returns (id, score) pairs, best first.
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+# Create a global instance of the lexical index
+lexical_index = LexicalIndex(settings.LEXICAL_INDEX_PATH or None, settings.LEXICAL_MAX_POSTINGS_PER_TERM)
@@ -1,21 +1,27 @@
-from typing import Dict, List, Any
+import logging
+from typing import Dict, List, Any, AsyncIterator, Tuple
 from langchain.prompts import PromptTemplate
 from langchain_openai import ChatOpenAI
 from langchain_core.runnables import RunnablePassthrough
 from app.core.config import settings
+from app.services.prompt_budget import count_tokens, fit_context, output_token_cap
+
+logger = logging.getLogger(__name__)
 
 # Initialize the LLM
 llm = ChatOpenAI(
     openai_api_key=settings.OPENAI_API_KEY, 
-    model_name="gpt-4o",
-    temperature=0.5
+    openai_api_base=settings.OPENAI_BASE_URL,
+    model_name=settings.CHAT_MODEL,
+    temperature=0.5,
+    max_tokens=output_token_cap()
 )
 
 # Define the prompt template
 CHARACTER_PROMPT = """
 You are embodying {character_name}, a character in the blockchain game Daemons where on-chain activity transforms into interactive Daemon pets for players and the Daemon partners.
 
-**IMPORTANT:** Your entire response must be no more than 50 characters. Be extremely succinct.
+**IMPORTANT:** Your entire response must be no more than {max_response_chars} characters. Be extremely succinct.
 
 **Core Instructions:**
 - Respond as {character_name} would, maintaining their unique personality and voice throughout.
@@ -43,39 +49,22 @@ Additional Guidance: {character_prompt}
 """
 
 
-async def generate_response(
+def _build_chain(
     character: Any,
     message: str,
     user_id: str,
-    context: str,
-    conversation_history: List[Dict[str, str]]
-) -> str:
-    """Generate a character response using RAG and conversation history."""
-    
-    # # Format conversation history
-    # formatted_history = ""
-    # if conversation_history:
-    #     for entry in conversation_history:
-    #         if entry["role"] == "user":
-    #             formatted_history += f"User: {entry['content']}\n"
-    #         else:
-    #             formatted_history += f"{character.name}: {entry['content']}\n"
-    
-    # If no context, provide a fallback message
-    if not context:
-        context = "I don't have specific information on this topic, but I'll respond based on my character."
-    
-    # Print debug information about context
-    print(f"\n--- CONTEXT SENT TO LLM ---")
-    print(f"Context length: {len(context)} characters")
-    print(f"User message: {message}")
-    print("--- END OF CONTEXT ---\n")
-    print(f"context body>>\n: {context} <<END.")
+    context_chunks: List[str]
+) -> Tuple[Any, Dict[str, Any]]:
+    """
+    Build the prompt | llm chain and its input dictionary for a chat turn.
+    Context chunks are added in relevance order until the input token budget
+    (LLM_MAX_INPUT_TOKENS) left over by the rest of the prompt is used up.
+    """
     
     # Create prompt template
     prompt = PromptTemplate(
         template=CHARACTER_PROMPT,
-        input_variables=["character_name", "character_description", "context", "user_message", "character_prompt", "character_backstory", "character_personality", "user_id"]
+        input_variables=["character_name", "character_description", "context", "user_message", "character_prompt", "character_backstory", "character_personality", "user_id", "max_response_chars"]
     )
     
     # Create input dictionary
@@ -85,17 +74,75 @@ async def generate_response(
         "character_description": getattr(character, 'description', 'No description available.'),
         "character_backstory": getattr(character, 'backstory', 'No backstory available.'),
         "character_personality": getattr(character, 'personality', 'No specific personality defined.'),
-        "context": context,
+        "context": "",
         # "conversation_history": formatted_history,
         "user_message": message,
-        "user_id": user_id
+        "user_id": user_id,
+        "max_response_chars": settings.RESPONSE_MAX_CHARACTERS
     }
     
+    # Fit the retrieved context into what is left of the input budget
+    base_tokens = count_tokens(prompt.format(**input_dict))
+    context_budget = settings.LLM_MAX_INPUT_TOKENS - base_tokens
+    if context_budget <= 0:
+        logger.warning(f"Prompt without context already uses {base_tokens} tokens; dropping context")
+    context = fit_context(context_chunks, context_budget) if context_budget > 0 else ""
+    
+    # If no context, provide a fallback message
+    if not context:
+        context = "I don't have specific information on this topic, but I'll respond based on my character."
+    input_dict["context"] = context
+    
+    # Log debug information about context
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            f"Context sent to LLM: {len(context)} characters, prompt budget "
+            f"{settings.LLM_MAX_INPUT_TOKENS} tokens, user message: {message}"
+        )
+        logger.debug(f"Context body:\n{context}")
+    
     # Create the chain using the modern approach
     chain = prompt | llm
+    return chain, input_dict
+
+
+async def generate_response(
+    character: Any,
+    message: str,
+    user_id: str,
+    context: List[str],
+    conversation_history: List[Dict[str, str]]
+) -> str:
+    """Generate a character response using RAG and conversation history."""
+    
+    # # Format conversation history
+    # formatted_history = ""
+    # if conversation_history:
+    #     for entry in conversation_history:
+    #         if entry["role"] == "user":
+    #             formatted_history += f"User: {entry['content']}\n"
+    #         else:
+    #             formatted_history += f"{character.name}: {entry['content']}\n"
+    
+    chain, input_dict = _build_chain(character, message, user_id, context)
     
     # Run the chain
     response = await chain.ainvoke(input_dict)
     
     # Extract the content from the response
-    return response.content
\ No newline at end of file
+    return response.content
+
+
+async def stream_response(
+    character: Any,
+    message: str,
+    user_id: str,
+    context: List[str],
+    conversation_history: List[Dict[str, str]]
+) -> AsyncIterator[str]:
+    """Generate a character response, yielding text chunks as the LLM produces them."""
+    chain, input_dict = _build_chain(character, message, user_id, context)
+    
+    async for chunk in chain.astream(input_dict):
+        if chunk.content:
+            yield chunk.content
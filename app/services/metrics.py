@@ -0,0 +1,86 @@
+import logging
+from typing import Any, Iterable, Optional, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+
+from app.core.config import settings
+from app.services.timing import StageTimings
+
+logger = logging.getLogger(__name__)
+
+# Buckets span sub-millisecond cache lookups up to slow LLM completions
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Label used when one measurement covers several characters (e.g. a batch)
+MIXED_CHARACTERS = "mixed"
+
+chat_stage_duration = Histogram(
+    "chat_stage_duration_seconds",
+    "Duration of each stage of the chat pipeline",
+    ["stage", "character", "model"],
+    buckets=STAGE_BUCKETS,
+)
+
+chat_requests = Counter(
+    "chat_requests_total",
+    "Chat messages answered, by endpoint and where the answer came from",
+    ["endpoint", "character", "model", "source"],
+)
+
+conversation_write_duration = Histogram(
+    "conversation_write_batch_duration_seconds",
+    "Duration of one write-behind conversation batch insert",
+    buckets=STAGE_BUCKETS,
+)
+
+conversation_write_rows = Counter(
+    "conversation_write_rows_total",
+    "Conversation rows handled by the write-behind writer",
+    ["outcome"],
+)
+
+retrieval_cache_lookups = Counter(
+    "retrieval_cache_lookups_total",
+    "Retrieval cache lookups by result: hit, miss, or stale (a document in scope changed)",
+    ["result"],
+)
+
+retrieval_cache_invalidations = Counter(
+    "retrieval_cache_invalidations_total",
+    "Retrieval cache scope invalidations, by shared, character or all scopes",
+    ["scope"],
+)
+
+document_chunks = Counter(
+    "document_chunks_total",
+    "Document chunks by outcome when (re)embedding: embedded, reused (vector copied), unchanged, or removed",
+    ["outcome"],
+)
+
+
+def character_label(character_ids: Iterable[Any]) -> str:
+    """Label value for one or more character ids."""
+    distinct = {str(character_id) for character_id in character_ids}
+    return distinct.pop() if len(distinct) == 1 else MIXED_CHARACTERS
+
+
+def observe_stages(timings: StageTimings, character_id: Any, model: Optional[str] = None) -> None:
+    """Record every stage duration of one request in the stage histogram."""
+    model = model or settings.CHAT_MODEL
+    for stage, ms in timings.durations.items():
+        chat_stage_duration.labels(stage=stage, character=str(character_id), model=model).observe(ms / 1000)
+
+
+def count_request(endpoint: str, character_id: Any, source: str, model: Optional[str] = None) -> None:
+    """Count one answered chat message; source is llm, cache or shared."""
+    chat_requests.labels(
+        endpoint=endpoint,
+        character=str(character_id),
+        model=model or settings.CHAT_MODEL,
+        source=source,
+    ).inc()
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Return the default registry in Prometheus text format and its content type."""
+    return generate_latest(), CONTENT_TYPE_LATEST
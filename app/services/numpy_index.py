@@ -0,0 +1,667 @@
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: writes are only serialized within one process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+EMBEDDINGS_FILE = "embeddings.npy"
+QUANTIZED_FILE = "quantized.npy"
+SCALES_FILE = "scales.npy"
+METADATA_FILE = "metadata.json"
+METADATA_LOG_FILE = "metadata.log"
+LOCK_FILE = ".lock"
+# Matrix files by role; rewritten matrices get a generation suffix (see _generation_file)
+DEFAULT_FILES = {"embeddings": EMBEDDINGS_FILE, "quantized": QUANTIZED_FILE, "scales": SCALES_FILE}
+# The metadata log is folded into the base file once it is larger than both this and the base
+LOG_CHECKPOINT_MIN_BYTES = 1024 * 1024
+# Reads retried when a writer swaps files between reading the metadata and the matrices
+LOAD_ATTEMPTS = 3
+# Rewrite the matrix without deleted rows once they make up this share of it
+COMPACT_TOMBSTONE_RATIO = 0.5
+# Rows converted from int8 per step of the coarse scan, bounding its scratch memory
+COARSE_BLOCK_ROWS = 4096
+
+
+def quantize_rows(rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-row int8 quantization; returns (int8 rows, float32 scales of shape (n, 1))."""
+    scales = np.abs(rows).max(axis=1, keepdims=True) / 127
+    scales[scales == 0] = 1
+    quantized = np.clip(np.rint(rows / scales), -127, 127).astype(np.int8)
+    return quantized, scales.astype(np.float32)
+
+
+def _generation_file(name: str, version: int) -> str:
+    """File name for a matrix rewritten at a metadata version."""
+    return f"{name}.{version}.npy"
+
+
+def _matches(metadata: Dict[str, Any], where: Dict[str, Any]) -> bool:
+    """Evaluate the subset of Chroma's where syntax used by the app."""
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(_matches(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(_matches(metadata, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            for op, operand in condition.items():
+                if op == "$eq" and value != operand:
+                    return False
+                if op == "$ne" and value == operand:
+                    return False
+                if op == "$in" and value not in operand:
+                    return False
+                if op == "$nin" and value in operand:
+                    return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+
+class _StaleRead(Exception):
+    """The metadata log was checkpointed between reading the base file and the log."""
+
+
+def _stat(path: str) -> Optional[tuple]:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+
+class _Snapshot:
+    """One consistent, read-only view of the index as of a metadata version."""
+
+    __slots__ = (
+        "version", "signature", "log_offset", "files", "is_quantized", "matrix", "quantized", "scales",
+        "ids", "documents", "metadatas", "alive", "rows", "masks",
+    )
+
+    def __init__(
+        self, version, signature, log_offset, files, is_quantized, matrix, ids, documents, metadatas, alive,
+        quantized=None, scales=None,
+    ):
+        self.version = version
+        # (base file stat, log file stat) this snapshot was read from
+        self.signature = signature
+        # Bytes of the log already applied
+        self.log_offset = log_offset
+        self.files = files
+        self.is_quantized = is_quantized
+        self.matrix = matrix
+        self.quantized = quantized
+        self.scales = scales
+        self.ids = ids
+        self.documents = documents
+        self.metadatas = metadatas
+        self.alive = alive
+        self.rows = {chunk_id: row for row, chunk_id in enumerate(ids) if alive[row]}
+        self.masks: Dict[str, np.ndarray] = {}
+
+    def mask(self, where: Optional[Dict[str, Any]]) -> np.ndarray:
+        """Boolean mask of live rows matching where, cached per filter."""
+        if not where:
+            return self.alive
+        key = json.dumps(where, sort_keys=True)
+        mask = self.masks.get(key)
+        if mask is None:
+            matched = np.fromiter(
+                (_matches(metadata, where) for metadata in self.metadatas), dtype=bool, count=len(self.metadatas)
+            )
+            mask = matched & self.alive
+            self.masks[key] = mask
+        return mask
+
+
+class NumpyVectorIndex:
+    """
+    Exact-search vector index backed by a memory-mapped float32 .npy matrix.
+
+    Rows are L2-normalized on ingest, so a query is one matrix product over
+    the live rows followed by an argpartition top-k. Ids, documents and
+    metadata are kept in a JSON base file plus an append-only log with one
+    line per write, so a write costs the size of its change rather than of
+    the index; the base is rewritten once the log outgrows it. Appends write
+    rows past the committed size before the log line that commits them, and
+    deletes only tombstone rows until enough accumulate to compact.
+    Compaction and int8 rebuilds write matrices under new file names that
+    the metadata then switches to, so a reader never pairs metadata with a
+    row layout it does not describe. Because the matrix is opened with
+    mmap, workers on one host share the same page cache.
+
+    With quantize=True an int8 copy of the matrix (plus per-row scales) is
+    kept alongside it. Queries scan the int8 copy, a quarter of the bytes,
+    and rescore the best rescore_factor * n_results candidates against the
+    float32 rows, so only those rows of the full matrix are paged in.
+
+    Implements the subset of the Chroma collection API the app uses
+    (add, upsert, update, delete, get, query, count) so it can stand in for
+    a collection; distances are squared L2, like Chroma's default space.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        initial_capacity: int = 1024,
+        quantize: bool = False,
+        rescore_factor: int = 4,
+    ):
+        self.directory = directory
+        self.initial_capacity = initial_capacity
+        self.quantize = quantize
+        self.rescore_factor = max(1, rescore_factor)
+        self.metadata_path = os.path.join(directory, METADATA_FILE)
+        self.log_path = os.path.join(directory, METADATA_LOG_FILE)
+        self.lock_path = os.path.join(directory, LOCK_FILE)
+        self._lock = threading.Lock()
+        self._snapshot: Optional[_Snapshot] = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, filename: str) -> str:
+        return os.path.join(self.directory, filename)
+
+    # Loading
+
+    def _signature(self) -> tuple:
+        return (_stat(self.metadata_path), _stat(self.log_path))
+
+    def _read_log(self, base_version: int, offset: int) -> Tuple[List[Dict[str, Any]], int]:
+        """Complete log entries after offset, and the offset past them."""
+        try:
+            f = open(self.log_path, "rb")
+        except FileNotFoundError:
+            return [], offset
+        with f:
+            if offset == 0:
+                header = f.readline()
+                if not header.endswith(b"\n"):
+                    return [], 0
+                if json.loads(header)["base"] > base_version:
+                    # The log already extends a newer base than the one just read
+                    raise _StaleRead()
+                offset = len(header)
+            f.seek(offset)
+            data = f.read()
+        # A line still being appended has no newline yet and is left for the next read
+        complete = data[:data.rfind(b"\n") + 1]
+        entries = [json.loads(line) for line in complete.splitlines() if line]
+        return entries, offset + len(complete)
+
+    @staticmethod
+    def _apply(state: Dict[str, Any], entry: Dict[str, Any]) -> None:
+        """Apply one log entry to a mutable state."""
+        if entry["version"] <= state["version"]:
+            # Already part of the base (the log predates the last checkpoint)
+            return
+        if entry["ids"]:
+            state["ids"].extend(entry["ids"])
+            state["documents"].extend(entry["documents"])
+            state["metadatas"].extend(entry["metadatas"])
+            state["alive"] = np.concatenate([state["alive"], np.ones(len(entry["ids"]), dtype=bool)])
+        if entry["tombstones"]:
+            state["alive"][entry["tombstones"]] = False
+        for row, metadata in entry["updates"].items():
+            state["metadatas"][int(row)] = metadata
+        state["quantized"] = entry["quantized"]
+        state["files"] = entry["files"]
+        state["version"] = entry["version"]
+
+    def _load(self, signature: tuple) -> _Snapshot:
+        base_signature, log_signature = signature
+        if base_signature is None:
+            return _Snapshot(0, signature, 0, dict(DEFAULT_FILES), False, None, [], [], [], np.zeros(0, dtype=bool))
+        with open(self.metadata_path, "r", encoding="utf-8") as f:
+            base = json.load(f)
+        alive = np.ones(len(base["ids"]), dtype=bool)
+        alive[base["tombstones"]] = False
+        state = {
+            "version": base["version"],
+            "ids": base["ids"],
+            "documents": base["documents"],
+            "metadatas": base["metadatas"],
+            "alive": alive,
+            "quantized": base.get("quantized", False),
+            # Indexes written before file generations use the fixed names
+            "files": base.get("files", dict(DEFAULT_FILES)),
+        }
+        entries, offset = self._read_log(state["version"], 0)
+        for entry in entries:
+            self._apply(state, entry)
+        return self._build(state, signature, offset)
+
+    def _advance(self, snapshot: _Snapshot, signature: tuple) -> _Snapshot:
+        """Apply only the log lines appended since the snapshot was read."""
+        entries, offset = self._read_log(snapshot.version, snapshot.log_offset)
+        if not entries:
+            return snapshot
+        state = {
+            "version": snapshot.version,
+            "ids": list(snapshot.ids),
+            "documents": list(snapshot.documents),
+            "metadatas": list(snapshot.metadatas),
+            "alive": snapshot.alive.copy(),
+            "quantized": snapshot.is_quantized,
+            "files": snapshot.files,
+        }
+        for entry in entries:
+            self._apply(state, entry)
+        return self._build(state, signature, offset)
+
+    def _build(self, state: Dict[str, Any], signature: tuple, log_offset: int) -> _Snapshot:
+        size = len(state["ids"])
+        files = state["files"]
+        matrix = np.load(self._path(files["embeddings"]), mmap_mode="r")[:size] if size else None
+        quantized = scales = None
+        if size and self.quantize and state["quantized"]:
+            quantized = np.load(self._path(files["quantized"]), mmap_mode="r")[:size]
+            scales = np.load(self._path(files["scales"]), mmap_mode="r")[:size]
+        return _Snapshot(
+            state["version"], signature, log_offset, files, state["quantized"], matrix,
+            state["ids"], state["documents"], state["metadatas"], state["alive"], quantized, scales,
+        )
+
+    def _refresh(self) -> _Snapshot:
+        """Return the latest snapshot, catching up if another process committed a write."""
+        for attempt in range(LOAD_ATTEMPTS):
+            signature = self._signature()
+            snapshot = self._snapshot
+            if snapshot is not None and snapshot.signature == signature:
+                return snapshot
+            try:
+                if (
+                    snapshot is not None
+                    and snapshot.signature[0] == signature[0]
+                    and snapshot.signature[1] is not None
+                    and signature[1] is not None
+                    and snapshot.signature[1][2] == signature[1][2]
+                ):
+                    # Same base and same log file: only lines were appended
+                    snapshot = self._advance(snapshot, signature)
+                else:
+                    snapshot = self._load(signature)
+            except (_StaleRead, FileNotFoundError):
+                # A writer checkpointed or compacted while this was reading; read again
+                if attempt == LOAD_ATTEMPTS - 1:
+                    raise
+                continue
+            snapshot.signature = signature
+            self._snapshot = snapshot
+            return snapshot
+
+    def _current(self) -> _Snapshot:
+        """Latest snapshot for reads, building the int8 copy first if it is missing."""
+        snapshot = self._refresh()
+        if self.quantize and snapshot.matrix is not None and snapshot.quantized is None:
+            # Quantization was just enabled, or another writer ran without it
+            self._write(lambda change: None)
+            snapshot = self._snapshot
+        return snapshot
+
+    # Writing
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        with open(self.lock_path, "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _write(self, mutate: Callable[[Dict[str, Any]], None]) -> None:
+        """Let mutate describe a change against the latest snapshot, then commit it."""
+        with self._lock, self._file_lock():
+            snapshot = self._refresh()
+            change = {
+                "ids": [],
+                "documents": [],
+                "metadatas": [],
+                "tombstones": [],
+                # Replacement metadata by row
+                "updates": {},
+                "new_rows": None,
+            }
+            mutate(change)
+            self._commit(snapshot, change)
+            self._refresh()
+
+    def _derive(self, rows: np.ndarray) -> Dict[str, np.ndarray]:
+        """Per-file arrays for a block of normalized float32 rows."""
+        arrays = {"embeddings": rows}
+        if self.quantize:
+            arrays["quantized"], arrays["scales"] = quantize_rows(rows)
+        return arrays
+
+    def _commit(self, snapshot: _Snapshot, change: Dict[str, Any]) -> None:
+        new_rows = change.pop("new_rows")
+        version = snapshot.version + 1
+        size = len(snapshot.ids) + len(change["ids"])
+        dead = int(size - snapshot.alive.sum() - len(change["ids"])) + len(set(change["tombstones"]))
+        files = dict(snapshot.files)
+        quantized = snapshot.is_quantized
+        if dead and dead >= size * COMPACT_TOMBSTONE_RATIO:
+            state = self._state_with(snapshot, change, version)
+            self._compact(state, new_rows, len(snapshot.ids))
+            self._checkpoint(state)
+            self._remove_unused(state["files"])
+            return
+
+        if new_rows is not None:
+            start = size - len(new_rows)
+            for name, rows in self._derive(new_rows).items():
+                if name == "embeddings" or quantized:
+                    self._append_rows(files, name, start, rows)
+        rebuilt = self.quantize and not quantized and size > 0
+        if rebuilt:
+            files.update(self._rebuild_quantized(files["embeddings"], size, version))
+        entry = {
+            "version": version,
+            "ids": change["ids"],
+            "documents": change["documents"],
+            "metadatas": change["metadatas"],
+            "tombstones": sorted(set(change["tombstones"])),
+            "updates": {str(row): metadata for row, metadata in change["updates"].items()},
+            "quantized": self.quantize and size > 0,
+            "files": files,
+        }
+        line = (json.dumps(entry) + "\n").encode("utf-8")
+        base_signature, log_signature = snapshot.signature
+        if (
+            base_signature is None
+            or log_signature is None
+            or log_signature[1] + len(line) > max(base_signature[1], LOG_CHECKPOINT_MIN_BYTES)
+        ):
+            # Fold the log into a new base once it outgrows it, keeping loads bounded
+            state = self._state_with(snapshot, change, version)
+            state["quantized"], state["files"] = entry["quantized"], files
+            self._checkpoint(state)
+        else:
+            with open(self.log_path, "ab") as f:
+                f.write(line)
+        if rebuilt:
+            self._remove_unused(files)
+
+    def _state_with(self, snapshot: _Snapshot, change: Dict[str, Any], version: int) -> Dict[str, Any]:
+        """Full state of the snapshot with a change applied."""
+        alive = np.concatenate([snapshot.alive, np.ones(len(change["ids"]), dtype=bool)])
+        alive[change["tombstones"]] = False
+        metadatas = snapshot.metadatas + change["metadatas"]
+        for row, metadata in change["updates"].items():
+            metadatas[row] = metadata
+        return {
+            "version": version,
+            "ids": snapshot.ids + change["ids"],
+            "documents": snapshot.documents + change["documents"],
+            "metadatas": metadatas,
+            "alive": alive,
+            "quantized": snapshot.is_quantized,
+            "files": dict(snapshot.files),
+        }
+
+    def _checkpoint(self, state: Dict[str, Any]) -> None:
+        """Write the full state as the new base, then start an empty log on top of it."""
+        base = {
+            "version": state["version"],
+            "ids": state["ids"],
+            "documents": state["documents"],
+            "metadatas": state["metadatas"],
+            "tombstones": [int(row) for row in np.flatnonzero(~state["alive"])],
+            "quantized": state["quantized"],
+            "files": state["files"],
+        }
+        tmp_path = f"{self.metadata_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(base, f)
+        os.replace(tmp_path, self.metadata_path)
+        # Readers that pair the new base with the old log skip its entries by version,
+        # and readers that pair the old base with this log see its header and retry
+        tmp_path = f"{self.log_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"base": state["version"]}) + "\n")
+        os.replace(tmp_path, self.log_path)
+
+    def _append_rows(self, files: Dict[str, str], name: str, start: int, rows: np.ndarray) -> None:
+        """Write rows at start of one file, growing it by doubling when it is full."""
+        path = self._path(files[name])
+        end = start + len(rows)
+        if os.path.exists(path):
+            matrix = np.load(path, mmap_mode="r+")
+            if matrix.shape[1] == rows.shape[1] and matrix.shape[0] >= end:
+                matrix[start:end] = rows
+                matrix.flush()
+                return
+            existing = matrix[:start]
+        else:
+            existing = np.zeros((0, rows.shape[1]), dtype=rows.dtype)
+        # The grown copy keeps every committed row in place, so it can replace the file
+        self._write_matrix(files[name], existing, rows, capacity=max(self.initial_capacity, end * 2))
+
+    def _write_matrix(self, filename: str, existing: np.ndarray, rows: Optional[np.ndarray], capacity: int) -> None:
+        path = self._path(filename)
+        dim = existing.shape[1] if existing.size or rows is None else rows.shape[1]
+        tmp_path = f"{path}.tmp.npy"
+        matrix = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=existing.dtype, shape=(capacity, dim))
+        matrix[:len(existing)] = existing
+        if rows is not None:
+            matrix[len(existing):len(existing) + len(rows)] = rows
+        matrix.flush()
+        del matrix
+        os.replace(tmp_path, path)
+
+    def _rebuild_quantized(self, embeddings_file: str, size: int, version: int) -> Dict[str, str]:
+        """Build the int8 copy from the float32 matrix in one pass, under new file names."""
+        matrix = np.load(self._path(embeddings_file), mmap_mode="r")
+        quantized, scales = quantize_rows(np.asarray(matrix[:size]))
+        files = {name: _generation_file(name, version) for name in ("quantized", "scales")}
+        self._write_matrix(files["quantized"], quantized, None, capacity=matrix.shape[0])
+        self._write_matrix(files["scales"], scales, None, capacity=matrix.shape[0])
+        logger.info(f"Built int8 index for {self.directory} ({size} rows)")
+        return files
+
+    def _compact(self, state: Dict[str, Any], new_rows: Optional[np.ndarray], old_size: int) -> None:
+        """Drop tombstoned rows, writing the matrices under new file names."""
+        size = len(state["ids"])
+        keep = np.flatnonzero(state["alive"])
+        if old_size:
+            old = np.load(self._path(state["files"]["embeddings"]), mmap_mode="r")[:old_size]
+            parts = [old] + ([new_rows] if new_rows is not None else [])
+            matrix = np.concatenate(parts)[keep] if len(keep) else np.zeros((0, old.shape[1]), dtype=np.float32)
+        else:
+            matrix = new_rows[keep]
+        capacity = max(self.initial_capacity, len(keep) * 2)
+        files = {}
+        for name, rows in self._derive(matrix).items():
+            files[name] = _generation_file(name, state["version"])
+            self._write_matrix(files[name], rows, None, capacity=capacity)
+        for field in ("ids", "documents", "metadatas"):
+            state[field] = [state[field][row] for row in keep]
+        state["alive"] = np.ones(len(keep), dtype=bool)
+        state["files"] = files
+        # The int8 copy was rewritten from the compacted rows when quantizing
+        state["quantized"] = self.quantize
+        logger.info(f"Compacted vector index {self.directory}: {size} rows -> {len(keep)}")
+
+    def _remove_unused(self, files: Dict[str, str]) -> None:
+        """Delete matrix files the committed metadata no longer refers to."""
+        in_use = set(files.values())
+        for filename in os.listdir(self.directory):
+            if (
+                filename.endswith(".npy")
+                and not filename.endswith(".tmp.npy")
+                and filename.split(".")[0] in DEFAULT_FILES
+                and filename not in in_use
+            ):
+                try:
+                    # Readers that mapped the file keep their view of it
+                    os.remove(self._path(filename))
+                except OSError as e:
+                    logger.warning(f"Could not remove unused index file {filename}: {str(e)}")
+
+    # Chroma collection API subset
+
+    def upsert(
+        self,
+        ids: Sequence[str],
+        embeddings: Sequence[Sequence[float]],
+        metadatas: Optional[Sequence[Dict[str, Any]]] = None,
+        documents: Optional[Sequence[str]] = None,
+    ) -> None:
+        """Append rows; an existing id is tombstoned and re-appended."""
+        if not ids:
+            return
+        rows = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(rows, axis=1, keepdims=True)
+        rows = rows / np.where(norms == 0, 1, norms)
+
+        def mutate(change: Dict[str, Any]) -> None:
+            snapshot = self._snapshot
+            if snapshot.matrix is not None and snapshot.matrix.shape[1] != rows.shape[1]:
+                raise ValueError(
+                    f"Embedding dimension {rows.shape[1]} does not match index dimension {snapshot.matrix.shape[1]}"
+                )
+            replaced = [snapshot.rows[chunk_id] for chunk_id in ids if chunk_id in snapshot.rows]
+            change["tombstones"].extend(replaced)
+            change["ids"].extend(ids)
+            change["documents"].extend(documents or [""] * len(ids))
+            change["metadatas"].extend(metadatas or [{} for _ in ids])
+            change["new_rows"] = rows
+
+        self._write(mutate)
+
+    add = upsert
+
+    def update(self, ids: Sequence[str], metadatas: Sequence[Dict[str, Any]]) -> None:
+        """Merge new metadata into existing rows."""
+        def mutate(change: Dict[str, Any]) -> None:
+            snapshot = self._snapshot
+            for chunk_id, metadata in zip(ids, metadatas):
+                row = snapshot.rows.get(chunk_id)
+                if row is not None:
+                    current = change["updates"].get(row, snapshot.metadatas[row])
+                    change["updates"][row] = {**current, **metadata}
+
+        self._write(mutate)
+
+    def delete(self, ids: Optional[Sequence[str]] = None, where: Optional[Dict[str, Any]] = None) -> None:
+        """Tombstone rows by id or filter."""
+        def mutate(change: Dict[str, Any]) -> None:
+            snapshot = self._snapshot
+            targets = set()
+            if ids:
+                targets.update(snapshot.rows[chunk_id] for chunk_id in ids if chunk_id in snapshot.rows)
+            if where:
+                targets.update(int(row) for row in np.flatnonzero(snapshot.mask(where)))
+            change["tombstones"].extend(sorted(targets))
+
+        self._write(mutate)
+
+    def count(self) -> int:
+        return int(self._refresh().alive.sum())
+
+    def get(
+        self,
+        ids: Optional[Sequence[str]] = None,
+        where: Optional[Dict[str, Any]] = None,
+        include: Sequence[str] = ("metadatas", "documents"),
+        offset: int = 0,
+        limit: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        snapshot = self._refresh()
+        if ids is not None:
+            selected = [snapshot.rows[chunk_id] for chunk_id in ids if chunk_id in snapshot.rows]
+            if where:
+                mask = snapshot.mask(where)
+                selected = [row for row in selected if mask[row]]
+        else:
+            selected = [int(row) for row in np.flatnonzero(snapshot.mask(where))]
+        selected = selected[offset:offset + limit] if limit is not None else selected[offset:]
+        return {
+            "ids": [snapshot.ids[row] for row in selected],
+            "metadatas": [snapshot.metadatas[row] for row in selected] if "metadatas" in include else None,
+            "documents": [snapshot.documents[row] for row in selected] if "documents" in include else None,
+            "embeddings": (
+                np.asarray(snapshot.matrix[selected]) if "embeddings" in include and selected else
+                [] if "embeddings" in include else None
+            ),
+        }
+
+    def query(
+        self,
+        query_embeddings: Sequence[Sequence[float]],
+        n_results: int = 10,
+        where: Optional[Dict[str, Any]] = None,
+        include: Sequence[str] = ("metadatas", "documents", "distances"),
+    ) -> Dict[str, List[List[Any]]]:
+        """Exact top-k by cosine similarity over the live rows matching where."""
+        snapshot = self._current()
+        results: Dict[str, List[List[Any]]] = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if snapshot.matrix is None or not len(queries):
+            for key in results:
+                results[key] = [[] for _ in range(len(queries))]
+            return results
+
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        mask = snapshot.mask(where)
+        live = int(mask.sum())
+        k = min(n_results, live)
+        if snapshot.quantized is not None:
+            # Coarse int8 scan, then exact rescoring of a candidate pool
+            pool = min(live, k * self.rescore_factor)
+            scores = self._coarse_scores(snapshot, queries)
+        else:
+            # One (queries x rows) product over the mapped matrix; rows are unit
+            # length, so these are cosine similarities
+            pool = k
+            scores = queries @ snapshot.matrix.T
+        scores[:, ~mask] = -np.inf
+        for q in range(len(queries)):
+            top = np.argpartition(-scores[q], pool - 1)[:pool] if pool else np.empty(0, dtype=np.int64)
+            if snapshot.quantized is not None:
+                # Sorted row order keeps the reads from the float32 mmap sequential
+                top = np.sort(top)
+                exact = snapshot.matrix[top] @ queries[q]
+                best = np.argsort(-exact)[:k]
+                top, similarities = top[best], exact[best]
+            else:
+                top = top[np.argsort(-scores[q][top])]
+                similarities = scores[q][top]
+            results["ids"].append([snapshot.ids[row] for row in top])
+            results["documents"].append([snapshot.documents[row] for row in top])
+            results["metadatas"].append([snapshot.metadatas[row] for row in top])
+            results["distances"].append([float(2 - 2 * similarity) for similarity in similarities])
+        return results
+
+    @staticmethod
+    def _coarse_scores(snapshot: _Snapshot, queries: np.ndarray) -> np.ndarray:
+        """Approximate similarities from the int8 rows, converted block by block."""
+        size = len(snapshot.quantized)
+        scores = np.empty((len(queries), size), dtype=np.float32)
+        for start in range(0, size, COARSE_BLOCK_ROWS):
+            end = min(start + COARSE_BLOCK_ROWS, size)
+            block = snapshot.quantized[start:end].astype(np.float32)
+            scores[:, start:end] = (queries @ block.T) * snapshot.scales[start:end, 0]
+        return scores
+
+    def memory_bytes(self) -> Dict[str, int]:
+        """Bytes of the live matrices that a full scan touches, per file."""
+        snapshot = self._refresh()
+        sizes = {"embeddings": snapshot.matrix.nbytes if snapshot.matrix is not None else 0}
+        if snapshot.quantized is not None:
+            sizes["quantized"] = snapshot.quantized.nbytes + snapshot.scales.nbytes
+        return sizes
@@ -0,0 +1,82 @@
+import logging
+import math
+from typing import List, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_SEPARATOR = "\n\n---\n\n"
+# Below this many spare tokens a partially included chunk is not worth sending
+MIN_PARTIAL_CHUNK_TOKENS = 64
+
+_encoding = None
+_encoding_loaded = False
+
+
+def _get_encoding():
+    """Return the tiktoken encoding for the chat model, or None if unavailable."""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+            try:
+                _encoding = tiktoken.encoding_for_model(settings.CHAT_MODEL)
+            except KeyError:
+                _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            logger.warning(f"tiktoken unavailable, falling back to approximate token counts: {str(e)}")
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens locally; approximates 4 characters per token without tiktoken."""
+    encoding = _get_encoding()
+    if encoding is None:
+        return math.ceil(len(text) / 4)
+    return len(encoding.encode(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text down to at most max_tokens tokens."""
+    encoding = _get_encoding()
+    if encoding is None:
+        return text[:max_tokens * 4]
+    return encoding.decode(encoding.encode(text)[:max_tokens])
+
+
+def fit_context(chunks: List[str], budget_tokens: int) -> str:
+    """
+    Join context chunks, already in relevance order, into at most budget_tokens.
+    Chunks are taken whole while they fit; the first one that does not fit is
+    truncated if enough budget remains, and everything after it is dropped.
+    """
+    selected = []
+    remaining = budget_tokens
+    separator_tokens = count_tokens(CONTEXT_SEPARATOR)
+    for index, chunk in enumerate(chunks):
+        cost = count_tokens(chunk) + (separator_tokens if selected else 0)
+        if cost <= remaining:
+            selected.append(chunk)
+            remaining -= cost
+            continue
+        partial_budget = remaining - (separator_tokens if selected else 0)
+        if partial_budget >= MIN_PARTIAL_CHUNK_TOKENS:
+            selected.append(truncate_to_tokens(chunk, partial_budget))
+        logger.info(f"Context budget reached: kept {len(selected)} of {len(chunks)} chunks")
+        break
+    return CONTEXT_SEPARATOR.join(selected)
+
+
+def output_token_cap(max_response_chars: Optional[int] = None) -> int:
+    """
+    Derive the completion token cap from the persona's character limit.
+    English averages about 4 characters per token; the cap allows twice that
+    so replies are not cut mid-word. The floor leaves room for the fixed
+    deflection lines in the character prompt, which run longer than the limit.
+    """
+    if settings.LLM_MAX_OUTPUT_TOKENS > 0:
+        return settings.LLM_MAX_OUTPUT_TOKENS
+    chars = max_response_chars or settings.RESPONSE_MAX_CHARACTERS
+    return max(64, math.ceil(chars / 4) * 2)
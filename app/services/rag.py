@@ -13,6 +13,7 @@ from app.schemas.chat import ChatRequest
 # Initialize the LLM
 llm = ChatOpenAI(
     openai_api_key=settings.OPENAI_API_KEY, 
+    openai_api_base=settings.OPENAI_BASE_URL,
     model_name="gpt-3.5-turbo",
     temperature=0.7
 )
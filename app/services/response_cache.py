@@ -0,0 +1,207 @@
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+USER_ID_PLACEHOLDER = "{user_id}"
+# Shorter ids, and numeric ones, cannot be told apart from ordinary words and numbers
+MIN_TEMPLATED_USER_ID_LENGTH = 3
+
+
+def to_template(response: str, user_id: str) -> Optional[str]:
+    """
+    Replace the user's id in a response with the placeholder, matching whole
+    tokens only. Returns None when the response mentions an id too short or
+    numeric to replace safely; such a response must not be shared.
+    """
+    if not user_id:
+        return response
+    pattern = re.compile(rf"(?<!\w){re.escape(user_id)}(?!\w)")
+    if not pattern.search(response):
+        return response
+    if len(user_id) < MIN_TEMPLATED_USER_ID_LENGTH or user_id.isdigit():
+        return None
+    return pattern.sub(lambda match: USER_ID_PLACEHOLDER, response)
+
+
+def personalize(template: str, user_id: str) -> str:
+    """Fill the user id placeholder in a response template."""
+    return template.replace(USER_ID_PLACEHOLDER, user_id)
+
+
+class _CharacterEntries:
+    """Cached responses for one character, with a lazily rebuilt similarity matrix."""
+
+    def __init__(self):
+        self.vectors: "OrderedDict[int, np.ndarray]" = OrderedDict()
+        self.responses: Dict[int, str] = {}
+        self.created_at: Dict[int, float] = {}
+        self.matrix: Optional[np.ndarray] = None
+        self.matrix_keys: List[int] = []
+
+    def rebuild(self) -> None:
+        self.matrix_keys = list(self.vectors.keys())
+        self.matrix = np.vstack([self.vectors[k] for k in self.matrix_keys]) if self.matrix_keys else None
+
+    def remove(self, key: int) -> None:
+        self.vectors.pop(key, None)
+        self.responses.pop(key, None)
+        self.created_at.pop(key, None)
+        self.matrix = None
+
+
+class SemanticResponseCache:
+    """
+    Per-character cache of (query embedding -> response) pairs.
+
+    A lookup returns a stored response when the cosine similarity between the
+    new query embedding and a cached one meets the configured threshold.
+    Responses are stored with the requesting user's id replaced by a
+    placeholder so they can be personalised for whoever asks next.
+    """
+
+    def __init__(
+        self,
+        similarity_threshold: float = 0.95,
+        max_entries_per_character: int = 500,
+        ttl_seconds: int = 3600,
+        enabled: bool = True,
+    ):
+        self.similarity_threshold = similarity_threshold
+        self.max_entries_per_character = max_entries_per_character
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self._characters: Dict[str, _CharacterEntries] = {}
+        self._lock = threading.Lock()
+        self._next_key = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        # Responses not cached because the user id in them could not be templated
+        self.skipped = 0
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, character_id: str, query_embedding: List[float], user_id: str) -> Optional[str]:
+        """Return a cached response personalised for user_id, or None on a miss."""
+        template = self.lookup_template(character_id, query_embedding)
+        return personalize(template, user_id) if template is not None else None
+
+    def lookup_template(self, character_id: str, query_embedding: List[float]) -> Optional[str]:
+        """Return the cached response template (with the user id placeholder), or None."""
+        if not self.enabled:
+            return None
+        query = self._normalize(query_embedding)
+        with self._lock:
+            entries = self._characters.get(str(character_id))
+            if entries is None or not entries.vectors:
+                self.misses += 1
+                return None
+
+            self._expire(entries)
+            if not entries.vectors:
+                self.misses += 1
+                return None
+            if entries.matrix is None:
+                entries.rebuild()
+
+            similarities = entries.matrix @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.similarity_threshold:
+                self.misses += 1
+                return None
+
+            key = entries.matrix_keys[best]
+            entries.vectors.move_to_end(key)
+            self.hits += 1
+            template = entries.responses[key]
+
+        logger.info(f"Response cache hit for character {character_id} (similarity {similarities[best]:.3f})")
+        return template
+
+    def store(self, character_id: str, query_embedding: List[float], user_id: str, response: str) -> None:
+        """Cache a generated response for a character, unless it cannot be made user-neutral."""
+        template = to_template(response, user_id)
+        if template is None:
+            with self._lock:
+                self.skipped += 1
+            return
+        self.store_template(character_id, query_embedding, template)
+
+    def store_template(self, character_id: str, query_embedding: List[float], template: str) -> None:
+        """Cache a response template that already uses the user id placeholder."""
+        if not self.enabled:
+            return
+        with self._lock:
+            entries = self._characters.setdefault(str(character_id), _CharacterEntries())
+            key = self._next_key
+            self._next_key += 1
+            entries.vectors[key] = self._normalize(query_embedding)
+            entries.responses[key] = template
+            entries.created_at[key] = time.monotonic()
+            entries.matrix = None
+            while len(entries.vectors) > self.max_entries_per_character:
+                oldest = next(iter(entries.vectors))
+                entries.remove(oldest)
+                self.evictions += 1
+
+    def _expire(self, entries: _CharacterEntries) -> None:
+        cutoff = time.monotonic() - self.ttl_seconds
+        expired = [key for key, created in entries.created_at.items() if created < cutoff]
+        for key in expired:
+            entries.remove(key)
+        self.expirations += len(expired)
+
+    def invalidate_character(self, character_id: str) -> None:
+        """Drop every cached response for one character."""
+        with self._lock:
+            if self._characters.pop(str(character_id), None) is not None:
+                self.invalidations += 1
+                logger.info(f"Response cache invalidated for character {character_id}")
+
+    def invalidate_all(self) -> None:
+        """Drop every cached response, e.g. after shared documents change."""
+        with self._lock:
+            if self._characters:
+                self.invalidations += len(self._characters)
+                self._characters.clear()
+                logger.info("Response cache invalidated for all characters")
+
+    def stats(self) -> Dict[str, float]:
+        """Return size, hit rate and eviction/invalidation counters."""
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "characters": len(self._characters),
+            "size": sum(len(entries.vectors) for entries in self._characters.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "skipped": self.skipped,
+        }
+
+
+# Create a global instance of the cache
+response_cache = SemanticResponseCache(
+    similarity_threshold=settings.RESPONSE_CACHE_SIMILARITY_THRESHOLD,
+    max_entries_per_character=settings.RESPONSE_CACHE_MAX_ENTRIES_PER_CHARACTER,
+    ttl_seconds=settings.RESPONSE_CACHE_TTL_SECONDS,
+    enabled=settings.RESPONSE_CACHE_ENABLED,
+)
@@ -0,0 +1,144 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.embedding_cache import normalize_query
+from app.services.metrics import retrieval_cache_invalidations, retrieval_cache_lookups
+
+logger = logging.getLogger(__name__)
+
+# Must match chroma_utils.SHARED_SCOPE; kept here to avoid an import cycle
+SHARED_SCOPE = 0
+
+
+class RetrievalCache:
+    """
+    LRU cache of retrieval results keyed on (character, query embedding, top_k).
+
+    Each chunk scope (a Character.id, or the shared scope) has a version
+    counter that is bumped whenever a document in that scope is embedded,
+    re-embedded, re-scoped or deleted. Entries remember the versions of the
+    scopes they were retrieved from, the shared scope and the character's
+    own, and are discarded on lookup once either has moved on, so a change
+    to one character's documents leaves every other character's entries valid.
+    """
+
+    def __init__(self, max_entries: int = 5000, ttl_seconds: int = 600, enabled: bool = True):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self._entries: "OrderedDict[Tuple, Tuple[Tuple[int, ...], float, Any]]" = OrderedDict()
+        self._versions: Dict[int, int] = {}
+        # Bumped with every scope; stamps unscoped queries, which read all scopes
+        self._global_version = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def key(
+        character_id: Optional[int], query_embedding: List[float], top_k: int, query_text: Optional[str] = None
+    ) -> Tuple:
+        """
+        Cache key for one retrieval. Pass query_text for hybrid retrieval,
+        whose keyword side depends on the text and not only the embedding.
+        """
+        digest = hashlib.blake2b(np.asarray(query_embedding, dtype=np.float32).tobytes(), digest_size=16)
+        if query_text is not None:
+            digest.update(normalize_query(query_text).encode("utf-8"))
+        return (character_id, top_k, query_text is not None, digest.digest())
+
+    def _stamp(self, character_id: Optional[int]) -> Tuple[int, ...]:
+        if character_id is None:
+            return (self._global_version,)
+        return (self._versions.get(SHARED_SCOPE, 0), self._versions.get(character_id, 0))
+
+    def get(self, key: Tuple) -> Optional[Any]:
+        """Return cached results for a key, or None on a miss."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                result = "miss"
+            elif entry[0] != self._stamp(key[0]) or entry[1] < time.monotonic() - self.ttl_seconds:
+                del self._entries[key]
+                self.stale += 1
+                result = "stale"
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                result = "hit"
+        retrieval_cache_lookups.labels(result=result).inc()
+        return entry[2] if result == "hit" else None
+
+    def set(self, key: Tuple, results: Any, stamp: Optional[Tuple[int, ...]] = None) -> None:
+        """
+        Cache results for a key. Pass the stamp from version() taken before
+        the query ran, so results that raced a document change are never
+        stored as current.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = (stamp if stamp is not None else self._stamp(key[0]), time.monotonic(), results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def version(self, character_id: Optional[int]) -> Tuple[int, ...]:
+        """Current version stamp of the scopes a query for this character reads."""
+        with self._lock:
+            return self._stamp(character_id)
+
+    def invalidate_scopes(self, scopes: Iterable[int]) -> None:
+        """Mark every entry that read from these scopes as stale."""
+        scopes = set(scopes)
+        if not scopes:
+            return
+        with self._lock:
+            for scope in scopes:
+                self._versions[scope] = self._versions.get(scope, 0) + 1
+            self._global_version += 1
+            self.invalidations += len(scopes)
+        for scope in scopes:
+            retrieval_cache_invalidations.labels(scope="shared" if scope == SHARED_SCOPE else "character").inc()
+        logger.info(f"Retrieval cache invalidated for scopes {sorted(scopes)}")
+
+    def clear(self) -> None:
+        """Drop every entry, e.g. after the whole index is rebuilt."""
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+        retrieval_cache_invalidations.labels(scope="all").inc()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return size, hit rate and invalidation counters."""
+        lookups = self.hits + self.misses + self.stale
+        return {
+            "enabled": self.enabled,
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+        }
+
+
+# Create a global instance of the cache
+retrieval_cache = RetrievalCache(
+    max_entries=settings.RETRIEVAL_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.RETRIEVAL_CACHE_TTL_SECONDS,
+    enabled=settings.RETRIEVAL_CACHE_ENABLED,
+)
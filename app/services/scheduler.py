@@ -5,7 +5,7 @@ from typing import List, Optional
 from sqlalchemy.orm import Session
 from app.models.document import Document, ContentType
 from app.crud.documents import get_url_documents_for_refresh
-from app.services.embedding import process_document
+from app.services.ingestion_queue import ingestion_queue
 from app.core.config import settings
 from app.db.session import SessionLocal
 
@@ -82,35 +82,23 @@ class DocumentRefreshScheduler:
             self.total_count = total_docs
             self.is_running = True
             
-            # Process in batches of 5
-            batch_size = 5
-            for i in range(0, total_docs, batch_size):
-                batch = documents[i:i+batch_size]
-                logger.info(f"Processing batch {i//batch_size + 1} ({len(batch)} documents)")
-                
-                # Process each document in the batch
-                for doc in batch:
-                    try:
-                        logger.info(f"Re-scraping and embedding document ID: {doc.id}, Title: {doc.title}")
-                        await process_document(doc.id, db, reembed=True)
-                        # Update last_refreshed timestamp
-                        doc.last_refreshed = datetime.utcnow()
-                        db.add(doc)
-                        db.commit()
-                        # Increment processed count after successful processing
-                        self.processed_count += 1
-                        logger.info(f"Progress: {self.processed_count}/{total_docs}")
-                    except Exception as e:
-                        logger.error(f"Error refreshing document ID {doc.id}: {str(e)}")
-                        db.rollback()
-                        # Still increment the count even if there was an error
-                        self.processed_count += 1
-                        logger.info(f"Progress (after error): {self.processed_count}/{total_docs}")
-                
-                # Small delay between batches to avoid overloading the system
-                await asyncio.sleep(2)
+            # Queue each document rather than processing it inline, so a refresh
+            # never runs alongside an upload or manual re-embed of the same document
+            for doc in documents:
+                try:
+                    logger.info(f"Queueing re-scrape and embedding of document ID: {doc.id}, Title: {doc.title}")
+                    ingestion_queue.enqueue(db, document_id=doc.id, reembed=True)
+                    # Update last_refreshed so the next run does not queue it again
+                    doc.last_refreshed = datetime.utcnow()
+                    db.add(doc)
+                    db.commit()
+                except Exception as e:
+                    logger.error(f"Error queueing refresh of document ID {doc.id}: {str(e)}")
+                    db.rollback()
+                # Count queued documents; the ingestion jobs report their own progress
+                self.processed_count += 1
             
-            logger.info(f"Completed refreshing {total_docs} documents")
+            logger.info(f"Queued {total_docs} documents for refresh")
             self.is_running = False
             self.last_refresh_time = datetime.utcnow()
 
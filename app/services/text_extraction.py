@@ -0,0 +1,274 @@
+import asyncio
+import csv
+import io
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+
+# File processing libraries
+import PyPDF2
+import docx
+import pandas as pd
+import mammoth
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.config import settings
+
+try:
+    import resource
+except ImportError:  # Windows: the memory limit is not enforced
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+
+def extract_text_from_pdf(file_path: str) -> str:
+    """Extract text from PDF files"""
+    logger.info(f"Extracting text from PDF: {file_path}")
+    try:
+        with open(file_path, "rb") as f:
+            pdf_reader = PyPDF2.PdfReader(f)
+            return "".join([page.extract_text() + "\n\n" for page in pdf_reader.pages])
+    except Exception as e:
+        logger.error(f"Error extracting text from PDF: {str(e)}")
+        raise
+
+
+def count_pdf_pages(file_path: str) -> int:
+    """Count the pages of a PDF"""
+    with open(file_path, "rb") as f:
+        return len(PyPDF2.PdfReader(f).pages)
+
+
+def extract_pdf_pages(file_path: str, start: int, stop: int) -> List[str]:
+    """Extract the text of pages start to stop - 1 of a PDF, one string per page"""
+    try:
+        with open(file_path, "rb") as f:
+            pdf_reader = PyPDF2.PdfReader(f)
+            stop = min(stop, len(pdf_reader.pages))
+            return [pdf_reader.pages[page_num].extract_text() + "\n\n" for page_num in range(start, stop)]
+    except Exception as e:
+        logger.error(f"Error extracting text from PDF pages {start}-{stop - 1}: {str(e)}")
+        raise
+
+
+def extract_text_from_docx(file_path: str) -> str:
+    """Extract text from DOCX files"""
+    logger.info(f"Extracting text from DOCX: {file_path}")
+    try:
+        doc = docx.Document(file_path)
+        text = "\n\n".join([paragraph.text for paragraph in doc.paragraphs if paragraph.text.strip()])
+        return text
+    except Exception as e:
+        logger.error(f"Error extracting text from DOCX: {str(e)}")
+        raise
+
+
+def extract_text_from_doc(file_path: str) -> str:
+    """Extract text from DOC files using mammoth"""
+    logger.info(f"Extracting text from DOC: {file_path}")
+    try:
+        with open(file_path, "rb") as f:
+            result = mammoth.extract_raw_text(f)
+            return result.value
+    except Exception as e:
+        logger.error(f"Error extracting text from DOC: {str(e)}")
+        raise
+
+
+def extract_text_from_excel(file_path: str) -> str:
+    """Extract text from Excel files"""
+    logger.info(f"Extracting text from Excel: {file_path}")
+    try:
+        df = pd.read_excel(file_path)
+        # Convert DataFrame to a readable string representation
+        buffer = io.StringIO()
+        df.to_csv(buffer)
+        return buffer.getvalue()
+    except Exception as e:
+        logger.error(f"Error extracting text from Excel: {str(e)}")
+        raise
+
+
+def extract_text_from_csv(file_path: str) -> str:
+    """Extract text from CSV files"""
+    logger.info(f"Extracting text from CSV: {file_path}")
+    try:
+        # Use pandas for more robust CSV parsing
+        df = pd.read_csv(file_path)
+        # Convert DataFrame to a readable string representation
+        buffer = io.StringIO()
+        df.to_csv(buffer)
+        return buffer.getvalue()
+    except Exception as e:
+        # Fallback to simple CSV reading if pandas fails
+        try:
+            with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+                reader = csv.reader(f)
+                rows = list(reader)
+                return "\n".join([",".join(row) for row in rows])
+        except Exception as inner_e:
+            logger.error(f"Error extracting text from CSV: {str(e)}, fallback also failed: {str(inner_e)}")
+            raise e
+
+
+def extract_text_from_text_file(file_path: str) -> str:
+    """Extract text from text files"""
+    logger.info(f"Extracting text from text file: {file_path}")
+    try:
+        with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+            return f.read()
+    except Exception as e:
+        logger.error(f"Error extracting text from text file: {str(e)}")
+        raise
+
+
+def extract_file_text(file_path: str, file_extension: str) -> str:
+    """Extract the text of an uploaded file, choosing the extractor by extension."""
+    if file_extension in ['.pdf']:
+        return extract_text_from_pdf(file_path)
+    elif file_extension in ['.docx']:
+        return extract_text_from_docx(file_path)
+    elif file_extension in ['.doc']:
+        return extract_text_from_doc(file_path)
+    elif file_extension in ['.xlsx', '.xls']:
+        return extract_text_from_excel(file_path)
+    elif file_extension in ['.csv']:
+        return extract_text_from_csv(file_path)
+    elif file_extension in ['.txt', '.md', '.json', '.html', '.xml']:
+        return extract_text_from_text_file(file_path)
+    else:
+        logger.warning(f"Unsupported file type: {file_extension}")
+        return extract_text_from_text_file(file_path)  # Try as text file anyway
+
+
+def _init_worker(memory_limit_mb: int) -> None:
+    """Runs once in each pool process: cap its address space so one huge file cannot exhaust the host."""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if memory_limit_mb and resource is not None:
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+class ExtractionPool:
+    """
+    Runs the CPU-bound file extractors (PyPDF2, python-docx, pandas) in
+    worker processes, so parsing a large PDF or spreadsheet never stalls
+    the event loop. Only the extracted text comes back to the app process.
+
+    Each job has a timeout. ProcessPoolExecutor cannot cancel a running
+    task, so a job that overruns, or a worker that dies, causes the pool's
+    processes to be killed and a new pool to be started for the next job;
+    other jobs running at that moment fail too and are retried by the
+    ingestion queue. Workers are replaced after max_tasks_per_worker jobs
+    to bound memory the parsers leak.
+    """
+
+    def __init__(
+        self,
+        workers: int = 2,
+        timeout_seconds: float = 300.0,
+        memory_limit_mb: int = 2048,
+        max_tasks_per_worker: int = 50,
+    ):
+        self.workers = workers
+        self.timeout_seconds = timeout_seconds
+        self.memory_limit_mb = memory_limit_mb
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.completed_count = 0
+        self.timeout_count = 0
+        self.crash_count = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # forkserver/spawn start clean processes instead of forking the app with its threads and sockets
+                method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context(method),
+                    initializer=_init_worker,
+                    initargs=(self.memory_limit_mb,),
+                    max_tasks_per_child=self.max_tasks_per_worker or None,
+                )
+                logger.info(f"Started text extraction pool with {self.workers} processes")
+            return self._executor
+
+    def _discard(self, executor: ProcessPoolExecutor) -> None:
+        """Kill a pool's processes and make the next job start a fresh pool."""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        for process in list((executor._processes or {}).values()):
+            process.kill()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    async def extract(self, file_path: str, file_extension: str) -> str:
+        """Extract a file's text in the pool, or in a thread when the pool is disabled (workers=0)."""
+        return await self._call(extract_file_text, file_path, file_extension)
+
+    async def iter_pdf_pages(self, file_path: str, pages_per_job: int = 4) -> AsyncIterator[Tuple[int, int, str]]:
+        """
+        Yield a PDF's pages as (page index, page count, text). Each pool job
+        extracts pages_per_job pages, so at most that many pages of text are
+        held at once however long the document is.
+        """
+        page_count = await self._call(count_pdf_pages, file_path)
+        for start in range(0, page_count, max(pages_per_job, 1)):
+            pages = await self._call(extract_pdf_pages, file_path, start, start + pages_per_job)
+            for offset, text in enumerate(pages):
+                yield start + offset, page_count, text
+
+    async def _call(self, func: Callable, file_path: str, *args):
+        """Run func(file_path, *args) in the pool under the job timeout."""
+        if self.workers <= 0:
+            return await run_in_threadpool(func, file_path, *args)
+        executor = self._get_executor()
+        loop = asyncio.get_running_loop()
+        try:
+            result = await asyncio.wait_for(
+                loop.run_in_executor(executor, func, file_path, *args),
+                self.timeout_seconds,
+            )
+        except asyncio.TimeoutError:
+            self.timeout_count += 1
+            self._discard(executor)
+            raise TimeoutError(f"Text extraction timed out after {self.timeout_seconds:.0f}s: {file_path}")
+        except BrokenProcessPool:
+            self.crash_count += 1
+            self._discard(executor)
+            raise RuntimeError(
+                f"Text extraction worker died (memory limit {self.memory_limit_mb} MB): {file_path}"
+            )
+        self.completed_count += 1
+        return result
+
+    def shutdown(self) -> None:
+        """Stop the worker processes."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "running": self._executor is not None,
+            "completed": self.completed_count,
+            "timeouts": self.timeout_count,
+            "crashes": self.crash_count,
+        }
+
+
+# Create a global instance of the extraction pool
+extraction_pool = ExtractionPool(
+    workers=settings.EXTRACTION_WORKERS,
+    timeout_seconds=settings.EXTRACTION_TIMEOUT_SECONDS,
+    memory_limit_mb=settings.EXTRACTION_MEMORY_LIMIT_MB,
+    max_tasks_per_worker=settings.EXTRACTION_MAX_TASKS_PER_WORKER,
+)
@@ -0,0 +1,35 @@
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+logger = logging.getLogger(__name__)
+
+
+class StageTimings:
+    """Wall-clock durations, in milliseconds, of the named stages of one request."""
+
+    def __init__(self):
+        self.durations: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time the enclosed block and record it under name."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.durations[name] = (time.perf_counter() - start) * 1000
+
+    def record(self, name: str, ms: float) -> None:
+        """Record a duration measured elsewhere, e.g. time to first token."""
+        self.durations[name] = ms
+
+    def server_timing(self) -> str:
+        """Format the recorded durations as a Server-Timing header value."""
+        return ", ".join(f"{name};dur={ms:.1f}" for name, ms in self.durations.items())
+
+    def log(self, label: str) -> None:
+        """Log all recorded stage durations on one line."""
+        summary = ", ".join(f"{name}={ms:.1f}ms" for name, ms in self.durations.items())
+        logger.info(f"{label} stage timings: {summary}")
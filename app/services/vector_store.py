@@ -0,0 +1,192 @@
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, Optional
+
+import chromadb
+from chromadb.errors import NotFoundError
+
+from app.core.config import settings
+from app.services.embedding_client import truncate_embedding
+from app.services.numpy_index import NumpyVectorIndex
+
+logger = logging.getLogger(__name__)
+
+CHROMA_DB_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "chroma_db"
+)
+DOCUMENTS_COLLECTION = "documents_embeddings"
+
+
+def collection_name_for(dimensions: Optional[int]) -> str:
+    """Collection holding embeddings of a given size; vectors of different sizes cannot share one."""
+    return f"{DOCUMENTS_COLLECTION}_{dimensions}d" if dimensions else DOCUMENTS_COLLECTION
+
+
+class VectorStore:
+    """
+    Process-wide access to the Chroma index.
+
+    Owns the single PersistentClient for the process and caches collection
+    handles, so queries do not look the collection up on every call. Writes
+    (add, update, delete) are serialized with a lock; reads run concurrently.
+
+    With backend="numpy" the handles are NumpyVectorIndex instances stored
+    under numpy_path, which expose the same collection methods.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        collection_name: str = DOCUMENTS_COLLECTION,
+        backend: str = "chroma",
+        numpy_path: Optional[str] = None,
+        dimensions: Optional[int] = None,
+        quantize: bool = False,
+        rescore_factor: int = 4,
+    ):
+        if backend not in ("chroma", "numpy"):
+            raise ValueError(f"Unknown retrieval backend: {backend}")
+        self.path = path
+        self.collection_name = collection_name
+        self.backend = backend
+        self.numpy_path = numpy_path
+        self.dimensions = dimensions
+        self.quantize = quantize
+        self.rescore_factor = rescore_factor
+        self._client = None
+        self._collections: Dict[str, Any] = {}
+        self._setup_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    @property
+    def client(self) -> Any:
+        """The shared PersistentClient, created on first use."""
+        if self._client is None:
+            with self._setup_lock:
+                if self._client is None:
+                    logger.info(f"Using ChromaDB path: {self.path}")
+                    self._client = chromadb.PersistentClient(path=self.path)
+        return self._client
+
+    def collection(self, name: Optional[str] = None) -> Any:
+        """Return the cached handle for a collection, creating the collection if needed."""
+        name = name or self.collection_name
+        handle = self._collections.get(name)
+        if handle is None and self.backend == "numpy":
+            with self._setup_lock:
+                handle = self._collections.get(name) or NumpyVectorIndex(
+                    os.path.join(self.numpy_path, name),
+                    quantize=self.quantize,
+                    rescore_factor=self.rescore_factor,
+                )
+                self._collections[name] = handle
+        elif handle is None:
+            client = self.client
+            with self._setup_lock:
+                handle = self._collections.get(name)
+                if handle is None:
+                    handle = client.get_or_create_collection(
+                        name=name,
+                        metadata={"description": "Document embeddings for search"}
+                    )
+                    self._collections[name] = handle
+        return handle
+
+    def _call(self, method: str, name: Optional[str], **kwargs: Any) -> Any:
+        """Call a collection method, refreshing the handle once if the collection was recreated."""
+        try:
+            return getattr(self.collection(name), method)(**kwargs)
+        except NotFoundError:
+            self._collections.pop(name or self.collection_name, None)
+            return getattr(self.collection(name), method)(**kwargs)
+
+    def _write(self, method: str, name: Optional[str], **kwargs: Any) -> Any:
+        with self._write_lock:
+            return self._call(method, name, **kwargs)
+
+    def query(self, name: Optional[str] = None, **kwargs: Any) -> Dict[str, Any]:
+        return self._call("query", name, **kwargs)
+
+    def get(self, name: Optional[str] = None, **kwargs: Any) -> Dict[str, Any]:
+        return self._call("get", name, **kwargs)
+
+    def count(self, name: Optional[str] = None) -> int:
+        return self._call("count", name)
+
+    def add(self, name: Optional[str] = None, **kwargs: Any) -> None:
+        self._write("add", name, **kwargs)
+
+    def upsert(self, name: Optional[str] = None, **kwargs: Any) -> None:
+        self._write("upsert", name, **kwargs)
+
+    def update(self, name: Optional[str] = None, **kwargs: Any) -> None:
+        self._write("update", name, **kwargs)
+
+    def delete(self, name: Optional[str] = None, **kwargs: Any) -> None:
+        self._write("delete", name, **kwargs)
+
+    def migrate(self, source_backend: str = "chroma", source_name: str = DOCUMENTS_COLLECTION, batch_size: int = 1000) -> int:
+        """
+        Copy every chunk from a source collection into the current one.
+
+        Covers switching RETRIEVAL_BACKEND (chroma -> numpy) and moving to a
+        smaller EMBEDDING_DIMENSIONS: stored vectors are truncated and
+        re-normalized on the way, so nothing is re-embedded. Returns the
+        number of chunks copied.
+        """
+        if source_backend == self.backend and source_name == self.collection_name:
+            raise ValueError("Source and target collections are the same")
+        if source_backend == "chroma":
+            source = self.client.get_collection(name=source_name)
+        elif source_backend == "numpy":
+            source = NumpyVectorIndex(os.path.join(self.numpy_path, source_name))
+        else:
+            raise ValueError(f"Unknown retrieval backend: {source_backend}")
+
+        copied = 0
+        total = source.count()
+        for offset in range(0, total, batch_size):
+            batch = source.get(
+                offset=offset, limit=batch_size, include=["embeddings", "metadatas", "documents"]
+            )
+            if not len(batch["ids"]):
+                break
+            embeddings = batch["embeddings"]
+            if self.dimensions:
+                if len(embeddings[0]) < self.dimensions:
+                    raise ValueError(
+                        f"Source vectors have {len(embeddings[0])} dimensions, fewer than {self.dimensions}"
+                    )
+                embeddings = [truncate_embedding(embedding, self.dimensions) for embedding in embeddings]
+            self.upsert(
+                ids=batch["ids"],
+                embeddings=embeddings,
+                metadatas=batch["metadatas"],
+                documents=batch["documents"],
+            )
+            copied += len(batch["ids"])
+        logger.info(
+            f"Migrated {copied} chunks from {source_backend}:{source_name} into {self.backend}:{self.collection_name}"
+        )
+        return copied
+
+    def write_transaction(self, fn: Callable[[Any], Any], name: Optional[str] = None) -> Any:
+        """
+        Run a read-modify-write sequence against a collection under the write
+        lock, e.g. fetching chunk ids and then deleting them.
+        """
+        with self._write_lock:
+            return fn(self.collection(name))
+
+
+# Create a global instance of the vector store
+vector_store = VectorStore(
+    CHROMA_DB_PATH,
+    collection_name=collection_name_for(settings.EMBEDDING_DIMENSIONS),
+    backend=settings.RETRIEVAL_BACKEND,
+    numpy_path=settings.NUMPY_INDEX_PATH,
+    dimensions=settings.EMBEDDING_DIMENSIONS,
+    quantize=settings.VECTOR_INDEX_QUANTIZE,
+    rescore_factor=settings.VECTOR_INDEX_RESCORE_FACTOR,
+)
@@ -0,0 +1,199 @@
+"""
+Open-loop load test for the public /chat endpoint.
+
+Requests are started at a fixed arrival rate regardless of how long earlier
+ones take, so a slow server shows up as growing latency rather than a
+quietly lower request rate. Per-stage latencies come from the Server-Timing
+header the endpoint returns.
+
+    python -m loadtest.chat_load --base-url http://127.0.0.1:8000 \\
+        --api-key "$PUBLIC_API_KEY" --character-ids daemon_1,daemon_2 --rps 50 --duration 60
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import httpx
+
+DEFAULT_MESSAGES = [
+    "What is a Daemon?",
+    "How do I level up my Daemon?",
+    "Tell me about yourself.",
+    "Which partners are in the game?",
+    "How does on-chain activity change my pet?",
+    "What should I do first?",
+    "Do you have any advice for new players?",
+    "What are relics used for?",
+]
+
+
+@dataclass
+class RunResults:
+    latencies_ms: List[float] = field(default_factory=list)
+    stages_ms: Dict[str, List[float]] = field(default_factory=lambda: defaultdict(list))
+    statuses: Counter = field(default_factory=Counter)
+    errors: Counter = field(default_factory=Counter)
+    dropped: int = 0
+    wall_seconds: float = 0.0
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def parse_server_timing(header: Optional[str]) -> Dict[str, float]:
+    """Parse 'name;dur=1.2, other;dur=3.4' into {name: ms}."""
+    timings = {}
+    for metric in (header or "").split(","):
+        name, _, params = metric.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur" and name:
+                timings[name] = float(value)
+    return timings
+
+
+def build_messages(args: argparse.Namespace) -> List[str]:
+    if args.messages_file:
+        with open(args.messages_file) as f:
+            return [line.strip() for line in f if line.strip()]
+    return DEFAULT_MESSAGES
+
+
+async def send_one(client: httpx.AsyncClient, payload: Dict[str, str], results: RunResults) -> None:
+    start = time.perf_counter()
+    try:
+        response = await client.post("/chat", json=payload)
+    except httpx.HTTPError as e:
+        results.errors[type(e).__name__] += 1
+        return
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    results.statuses[response.status_code] += 1
+    if response.status_code != 200:
+        return
+    results.latencies_ms.append(elapsed_ms)
+    for stage, ms in parse_server_timing(response.headers.get("server-timing")).items():
+        results.stages_ms[stage].append(ms)
+
+
+async def run(args: argparse.Namespace) -> RunResults:
+    rng = random.Random(args.seed)
+    messages = build_messages(args)
+    character_ids = [c.strip() for c in args.character_ids.split(",") if c.strip()]
+    results = RunResults()
+    limits = httpx.Limits(max_connections=args.max_connections, max_keepalive_connections=args.max_connections)
+    in_flight = set()
+
+    async with httpx.AsyncClient(
+        base_url=args.base_url,
+        headers={"X-API-Key": args.api_key},
+        timeout=args.timeout,
+        limits=limits,
+    ) as client:
+        total = int(args.rps * args.duration)
+        interval = 1 / args.rps
+        started = time.perf_counter()
+        for i in range(total):
+            # Keep to the schedule even if the loop falls behind
+            delay = started + i * interval - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if len(in_flight) >= args.max_in_flight:
+                results.dropped += 1
+                continue
+            message = rng.choice(messages)
+            if rng.random() < args.unique_ratio:
+                # Unique text defeats the embedding and response caches
+                message = f"{message} (#{i})"
+            payload = {
+                "user_id": f"loadtest-user-{rng.randrange(args.users)}",
+                "character_id": rng.choice(character_ids),
+                "message": message,
+            }
+            task = asyncio.create_task(send_one(client, payload, results))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+        if in_flight:
+            await asyncio.gather(*in_flight)
+        results.wall_seconds = time.perf_counter() - started
+    return results
+
+
+def report(args: argparse.Namespace, results: RunResults) -> Dict[str, object]:
+    completed = len(results.latencies_ms)
+    summary = {
+        "target_rps": args.rps,
+        "duration_s": round(results.wall_seconds, 2),
+        "completed": completed,
+        "throughput_rps": round(completed / results.wall_seconds, 2) if results.wall_seconds else 0.0,
+        "statuses": dict(results.statuses),
+        "errors": dict(results.errors),
+        "dropped": results.dropped,
+        "latency_ms": {},
+    }
+    rows = [("total", results.latencies_ms)] + sorted(results.stages_ms.items())
+    for name, values in rows:
+        summary["latency_ms"][name] = {
+            "count": len(values),
+            "p50": round(percentile(values, 50), 1),
+            "p95": round(percentile(values, 95), 1),
+            "p99": round(percentile(values, 99), 1),
+            # Stage throughput: how many requests per second reached this stage
+            "rps": round(len(values) / results.wall_seconds, 2) if results.wall_seconds else 0.0,
+        }
+    return summary
+
+
+def print_report(summary: Dict[str, object]) -> None:
+    print(
+        f"target {summary['target_rps']} rps for {summary['duration_s']}s: "
+        f"{summary['completed']} ok, {summary['throughput_rps']} rps achieved, "
+        f"statuses {summary['statuses']}, errors {summary['errors']}, dropped {summary['dropped']}"
+    )
+    print(f"{'stage':<20}{'count':>8}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, row in summary["latency_ms"].items():
+        print(f"{name:<20}{row['count']:>8}{row['rps']:>9}{row['p50']:>10}{row['p95']:>10}{row['p99']:>10}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Drive /chat at a target request rate")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--api-key", required=True)
+    parser.add_argument("--character-ids", required=True, help="Comma-separated character ids to spread load across")
+    parser.add_argument("--rps", type=float, default=10.0, help="Target arrival rate")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to generate load for")
+    parser.add_argument("--users", type=int, default=100, help="Number of distinct user ids")
+    parser.add_argument("--unique-ratio", type=float, default=0.5, help="Fraction of messages made unique")
+    parser.add_argument("--messages-file", help="One message per line; defaults to a built-in set")
+    parser.add_argument("--max-connections", type=int, default=200)
+    parser.add_argument("--max-in-flight", type=int, default=1000, help="Skip arrivals beyond this many open requests")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+    if args.rps <= 0:
+        parser.error("--rps must be positive")
+
+    results = asyncio.run(run(args))
+    summary = report(args, results)
+    if args.json:
+        json.dump(summary, sys.stdout, indent=2)
+        print()
+    else:
+        print_report(summary)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Throughput and memory report for the character and token chunkers.
+
+Chunks one large text with chunk_text (fixed-width characters, returns a
+list) and with the token chunker, both materialised as a list and streamed
+one chunk at a time, and reports time, peak traced memory and chunk sizes
+in embedding tokens:
+
+    python -m loadtest.chunking_report --size-mb 20
+    python -m loadtest.chunking_report --file ./storage/documents/big.txt
+
+Peak memory is measured with tracemalloc, which slows every run alike;
+throughput is measured in a separate untraced run.
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, Iterable
+
+from app.services.chunking import Chunk, chunk_text, count_embedding_tokens, iter_token_chunks
+
+WORDS = (
+    "the castle stood above river where dragons once slept and knights kept watch through long "
+    "winter a village of millers traded grain for salt with merchants who crossed mountain pass"
+).split()
+
+
+def synthetic_text(size_mb: float, seed: int) -> str:
+    """Markdown-ish prose: headed sections of paragraphs of sentences."""
+    rng = random.Random(seed)
+    parts, length, section = [], 0, 0
+    while length < size_mb * 2**20:
+        if rng.random() < 0.15:
+            section += 1
+            part = f"## Section {section}"
+        else:
+            part = " ".join(
+                " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 28))).capitalize() + "."
+                for _ in range(rng.randint(1, 8))
+            )
+        parts.append(part)
+        length += len(part) + 2
+    return "\n\n".join(parts)
+
+
+def pages(text: str, page_chars: int = 3000) -> Iterable[str]:
+    for start in range(0, len(text), page_chars):
+        yield text[start:start + page_chars]
+
+
+def run(name: str, chunker: Callable[[], Iterable[Chunk]], text: str, max_tokens: int) -> Dict[str, object]:
+    start = time.perf_counter()
+    count = sum(1 for _ in chunker())
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    kept = chunker()
+    if isinstance(kept, list):
+        chunks = kept
+    else:
+        # Streamed: look at each chunk once and let it go, as the embedding pipeline does
+        chunks = None
+        for _ in kept:
+            pass
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    sample = chunks if chunks is not None else list(chunker())
+    tokens = [count_embedding_tokens(chunk.text) for chunk in sample]
+    return {
+        "chunker": name,
+        "chunks": count,
+        "seconds": round(elapsed, 2),
+        "mb_per_s": round(len(text) / 2**20 / elapsed, 1),
+        "peak_mb": round(peak / 2**20, 2),
+        "mean_tokens": round(statistics.mean(tokens), 1) if tokens else 0,
+        "max_tokens": max(tokens, default=0),
+        "over_limit": sum(count > max_tokens for count in tokens),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare the character and token chunkers")
+    parser.add_argument("--file", help="Text file to chunk instead of synthetic text")
+    parser.add_argument("--size-mb", type=float, default=10.0, help="Synthetic text size")
+    parser.add_argument("--max-tokens", type=int, default=400)
+    parser.add_argument("--overlap-tokens", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, "r", encoding="utf-8") as f:
+            text = f.read()
+    else:
+        text = synthetic_text(args.size_mb, args.seed)
+    # The text itself is allocated before tracing starts, so peaks are the chunkers' own
+    rows = [
+        run("chunk_text (characters)", lambda: chunk_text(text, 1), text, args.max_tokens),
+        run(
+            "token chunks, list",
+            lambda: list(iter_token_chunks(text, 1, args.max_tokens, args.overlap_tokens)),
+            text,
+            args.max_tokens,
+        ),
+        run(
+            "token chunks, streamed pages",
+            lambda: iter_token_chunks(pages(text), 1, args.max_tokens, args.overlap_tokens),
+            text,
+            args.max_tokens,
+        ),
+    ]
+
+    if args.json:
+        json.dump({"chars": len(text), "max_tokens": args.max_tokens, "results": rows}, sys.stdout, indent=2)
+        print()
+        return
+    print(f"{len(text) / 2**20:.1f} MB of text, token limit {args.max_tokens}")
+    print(f"{'chunker':<30}{'chunks':>8}{'s':>7}{'MB/s':>7}{'peak MB':>9}{'mean tok':>10}{'max tok':>9}{'over':>6}")
+    for row in rows:
+        print(
+            f"{row['chunker']:<30}{row['chunks']:>8}{row['seconds']:>7}{row['mb_per_s']:>7}{row['peak_mb']:>9}"
+            f"{row['mean_tokens']:>10}{row['max_tokens']:>9}{row['over_limit']:>6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
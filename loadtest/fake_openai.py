@@ -0,0 +1,211 @@
+"""
+Local stand-in for the OpenAI embeddings and chat-completions endpoints.
+
+Lets the chat path be load-tested offline. Embeddings are deterministic
+unit vectors seeded from the input text, so the query cache, response
+cache and vector search behave the same from run to run. Chat completions
+return deterministic text, with optional streaming and configurable
+latency.
+
+Run it, then point the app at it:
+
+    python -m loadtest.fake_openai --port 8100 --chat-ttft-ms 400 --chat-token-ms 20
+    OPENAI_BASE_URL=http://127.0.0.1:8100/v1 OPENAI_API_KEY=fake uvicorn app.main:app
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional, Union
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# Native dimensions of the embedding models the app may request
+EMBEDDING_DIMENSIONS = {
+    "text-embedding-3-large": 3072,
+    "text-embedding-3-small": 1536,
+    "text-embedding-ada-002": 1536,
+}
+DEFAULT_EMBEDDING_DIMENSIONS = 1536
+
+WORDS = (
+    "daemon spirit chain token quest ember shadow relic vault oracle "
+    "forge rune echo pulse wander bond ledger spark guardian realm"
+).split()
+
+
+@dataclass
+class LatencyModel:
+    """
+    Log-normal latency around a median, in milliseconds.
+    A sigma of 0 gives a fixed latency.
+    """
+    median_ms: float = 0.0
+    sigma: float = 0.0
+
+    def sample(self) -> float:
+        if self.median_ms <= 0:
+            return 0.0
+        if self.sigma <= 0:
+            return self.median_ms
+        return random.lognormvariate(np.log(self.median_ms), self.sigma)
+
+    async def wait(self) -> None:
+        delay = self.sample()
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+
+
+@dataclass
+class FakeOpenAIConfig:
+    embedding_latency: LatencyModel
+    chat_ttft: LatencyModel
+    chat_token_latency: LatencyModel
+    response_tokens: int = 24
+
+
+def deterministic_embedding(text: str, dimensions: int) -> np.ndarray:
+    """Unit-length float32 vector seeded from the text."""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dimensions).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def deterministic_tokens(prompt: str, count: int) -> List[str]:
+    """Reply tokens chosen from a fixed vocabulary, seeded from the prompt."""
+    rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).hexdigest())
+    return [(" " if i else "") + rng.choice(WORDS) for i in range(count)]
+
+
+def _as_texts(value: Union[str, List[Any]]) -> List[str]:
+    if isinstance(value, str):
+        return [value]
+    # Token-id inputs are hashed by their string form
+    return [item if isinstance(item, str) else json.dumps(item) for item in value]
+
+
+def create_app(config: FakeOpenAIConfig) -> FastAPI:
+    app = FastAPI(title="Fake OpenAI")
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request) -> Any:
+        body = await request.json()
+        model = body.get("model", "text-embedding-3-large")
+        dimensions = body.get("dimensions") or EMBEDDING_DIMENSIONS.get(model, DEFAULT_EMBEDDING_DIMENSIONS)
+        as_base64 = body.get("encoding_format") == "base64"
+        texts = _as_texts(body.get("input", []))
+
+        await config.embedding_latency.wait()
+        data = []
+        for index, text in enumerate(texts):
+            vector = deterministic_embedding(text, dimensions)
+            embedding = base64.b64encode(vector.tobytes()).decode("ascii") if as_base64 else vector.tolist()
+            data.append({"object": "embedding", "index": index, "embedding": embedding})
+        prompt_tokens = sum(len(text.split()) for text in texts)
+        return {
+            "object": "list",
+            "data": data,
+            "model": model,
+            "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens},
+        }
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request) -> Any:
+        body = await request.json()
+        model = body.get("model", "gpt-4o")
+        messages = body.get("messages", [])
+        prompt = "\n".join(str(message.get("content", "")) for message in messages)
+        max_tokens: Optional[int] = body.get("max_tokens") or body.get("max_completion_tokens")
+        count = min(config.response_tokens, max_tokens) if max_tokens else config.response_tokens
+        tokens = deterministic_tokens(prompt, count)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+        usage = {
+            "prompt_tokens": len(prompt.split()),
+            "completion_tokens": len(tokens),
+            "total_tokens": len(prompt.split()) + len(tokens),
+        }
+
+        if not body.get("stream"):
+            await config.chat_ttft.wait()
+            for _ in tokens[1:]:
+                await config.chat_token_latency.wait()
+            return JSONResponse({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(tokens)},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            })
+
+        def chunk(choices: List[Dict[str, Any]], **extra: Any) -> str:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": choices,
+                **extra,
+            }
+            return f"data: {json.dumps(payload)}\n\n"
+
+        def delta(content: Dict[str, Any], finish_reason: Optional[str] = None) -> str:
+            return chunk([{"index": 0, "delta": content, "finish_reason": finish_reason}])
+
+        async def stream() -> AsyncIterator[str]:
+            await config.chat_ttft.wait()
+            yield delta({"role": "assistant", "content": ""})
+            for i, token in enumerate(tokens):
+                if i:
+                    await config.chat_token_latency.wait()
+                yield delta({"content": token})
+            yield delta({}, finish_reason="stop")
+            if (body.get("stream_options") or {}).get("include_usage"):
+                yield chunk([], usage=usage)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fake OpenAI server for offline load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--embedding-ms", type=float, default=50.0, help="Median embeddings latency")
+    parser.add_argument("--embedding-sigma", type=float, default=0.3, help="Log-normal spread of embeddings latency")
+    parser.add_argument("--chat-ttft-ms", type=float, default=400.0, help="Median time to first token")
+    parser.add_argument("--chat-ttft-sigma", type=float, default=0.4, help="Log-normal spread of time to first token")
+    parser.add_argument("--chat-token-ms", type=float, default=20.0, help="Median delay between tokens")
+    parser.add_argument("--chat-token-sigma", type=float, default=0.2, help="Log-normal spread of the token delay")
+    parser.add_argument("--response-tokens", type=int, default=24, help="Tokens per completion before max_tokens")
+    parser.add_argument("--seed", type=int, default=None, help="Seed the latency sampler for repeatable runs")
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    config = FakeOpenAIConfig(
+        embedding_latency=LatencyModel(args.embedding_ms, args.embedding_sigma),
+        chat_ttft=LatencyModel(args.chat_ttft_ms, args.chat_ttft_sigma),
+        chat_token_latency=LatencyModel(args.chat_token_ms, args.chat_token_sigma),
+        response_tokens=args.response_tokens,
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
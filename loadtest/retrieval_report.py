@@ -0,0 +1,169 @@
+"""
+Recall-vs-latency report for reduced embedding sizes and the int8 index.
+
+Builds throwaway numpy indexes from one set of full-size vectors, truncated
+to each requested size with and without quantization, and compares their
+top-k results against exact search at full size. Vectors come from an
+existing full-size collection, or are generated:
+
+    python -m loadtest.retrieval_report --source chroma --dimensions 1024,512,256
+    python -m loadtest.retrieval_report --source synthetic --synthetic 20000 --native-dimensions 3072
+
+Synthetic vectors are random, so they have none of the Matryoshka structure
+of real text-embedding-3 vectors and understate recall after truncation;
+use them for latency and memory, and a real collection for recall.
+"""
+import argparse
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.services.numpy_index import NumpyVectorIndex
+from app.services.vector_store import CHROMA_DB_PATH, DOCUMENTS_COLLECTION
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def normalize(rows: np.ndarray) -> np.ndarray:
+    return rows / np.maximum(np.linalg.norm(rows, axis=1, keepdims=True), 1e-12)
+
+
+def load_vectors(args: argparse.Namespace) -> np.ndarray:
+    """Full-size corpus vectors as a float32 matrix."""
+    if args.source == "synthetic":
+        rng = np.random.default_rng(args.seed)
+        return rng.standard_normal((args.synthetic, args.native_dimensions)).astype(np.float32)
+    if args.source == "chroma":
+        import chromadb
+
+        source = chromadb.PersistentClient(path=args.chroma_path).get_collection(name=args.collection)
+    else:
+        source = NumpyVectorIndex(os.path.join(args.numpy_path, args.collection))
+    batches = []
+    for offset in range(0, source.count(), 1000):
+        batch = source.get(offset=offset, limit=1000, include=["embeddings"])
+        if not len(batch["ids"]):
+            break
+        batches.append(np.asarray(batch["embeddings"], dtype=np.float32))
+    if not batches:
+        sys.exit(f"Collection {args.collection} is empty")
+    return np.concatenate(batches)
+
+
+def make_queries(vectors: np.ndarray, count: int, seed: int) -> np.ndarray:
+    """
+    Perturbed copies of count corpus vectors, so each query is near, but
+    not identical to, real content.
+    """
+    rng = np.random.default_rng(seed)
+    picked = rng.choice(len(vectors), size=min(count, len(vectors)), replace=False)
+    noise = rng.standard_normal((len(picked), vectors.shape[1])).astype(np.float32)
+    queries = normalize(vectors[picked]) + 0.5 * noise / math.sqrt(vectors.shape[1])
+    return queries.astype(np.float32)
+
+
+def exact_top_k(corpus: np.ndarray, queries: np.ndarray, k: int) -> List[set]:
+    scores = normalize(queries) @ normalize(corpus).T
+    return [set(np.argpartition(-row, k - 1)[:k].tolist()) for row in scores]
+
+
+def measure(
+    corpus: np.ndarray,
+    queries: np.ndarray,
+    truth: List[set],
+    k: int,
+    dimensions: Optional[int],
+    quantize: bool,
+    rescore_factor: int,
+) -> Dict[str, object]:
+    size = dimensions or corpus.shape[1]
+    directory = tempfile.mkdtemp(prefix="retrieval-report-")
+    try:
+        index = NumpyVectorIndex(directory, quantize=quantize, rescore_factor=rescore_factor)
+        ids = [str(row) for row in range(len(corpus))]
+        index.upsert(
+            ids=ids,
+            embeddings=normalize(corpus[:, :size]),
+            metadatas=[{"character_id": 0}] * len(ids),
+            documents=[""] * len(ids),
+        )
+        # Warm the mapping and the int8 copy before timing
+        index.query(query_embeddings=queries[:1, :size], n_results=k)
+        latencies, recalls = [], []
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            result = index.query(query_embeddings=[query[:size]], n_results=k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            found = {int(chunk_id) for chunk_id in result["ids"][0]}
+            recalls.append(len(found & expected) / k)
+        memory = index.memory_bytes()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return {
+        "dimensions": size,
+        "quantize": quantize,
+        "recall": round(float(np.mean(recalls)), 4),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        # What a full scan reads: the int8 copy when quantized, else the float32 matrix
+        "scan_mb": round(memory.get("quantized", memory["embeddings"]) / 2**20, 1),
+        "total_mb": round(sum(memory.values()) / 2**20, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare recall and latency across embedding sizes")
+    parser.add_argument("--source", choices=["chroma", "numpy", "synthetic"], default="chroma")
+    parser.add_argument("--collection", default=DOCUMENTS_COLLECTION, help="Full-size collection to sample")
+    parser.add_argument("--chroma-path", default=CHROMA_DB_PATH)
+    parser.add_argument("--numpy-path", default="./storage/vector_index")
+    parser.add_argument("--synthetic", type=int, default=20000, help="Synthetic corpus size")
+    parser.add_argument("--native-dimensions", type=int, default=3072, help="Synthetic vector size")
+    parser.add_argument("--dimensions", default="1024,512,256", help="Comma-separated reduced sizes to test")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--rescore-factor", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    corpus = load_vectors(args)
+    queries = make_queries(corpus, args.queries, args.seed)
+    truth = exact_top_k(corpus, queries, args.top_k)
+    sizes = [None] + [int(d) for d in args.dimensions.split(",") if d.strip() and int(d) < corpus.shape[1]]
+    rows = [
+        measure(corpus, queries, truth, args.top_k, size, quantize, args.rescore_factor)
+        for size in sizes
+        for quantize in (False, True)
+    ]
+
+    if args.json:
+        json.dump({"corpus": len(corpus), "queries": len(queries), "top_k": args.top_k, "results": rows},
+                  sys.stdout, indent=2)
+        print()
+        return
+    print(f"{len(corpus)} vectors, {len(queries)} queries, recall@{args.top_k} vs exact full-size search")
+    print(f"{'dims':>6}{'int8':>6}{'recall':>9}{'p50 ms':>9}{'p95 ms':>9}{'scan MB':>10}{'total MB':>10}")
+    for row in rows:
+        print(
+            f"{row['dimensions']:>6}{'yes' if row['quantize'] else 'no':>6}{row['recall']:>9}"
+            f"{row['p50_ms']:>9}{row['p95_ms']:>9}{row['scan_mb']:>10}{row['total_mb']:>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+import os
+import tempfile
+
+# Point the app at throwaway storage before app.core.config reads the environment
+_storage = tempfile.mkdtemp(prefix="app-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_storage, 'app.db')}")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+os.environ.setdefault("QUERY_EMBEDDING_CACHE_PATH", "")
+os.environ.setdefault("RETRIEVAL_BACKEND", "numpy")
+os.environ.setdefault("NUMPY_INDEX_PATH", os.path.join(_storage, "vector_index"))
+os.environ.setdefault("LEXICAL_INDEX_PATH", os.path.join(_storage, "lexical_index.sqlite3"))
@@ -0,0 +1,25 @@
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.dependencies import get_current_admin_user
+from app.main import app
+from app.services.vector_store import vector_store
+
+
+def test_rebuild_lexical_index_endpoint():
+    vector_store.upsert(
+        ids=["1_0", "1_1"],
+        embeddings=[[1.0, 0.0], [0.0, 1.0]],
+        documents=["daemon pets evolve", "partners reveal rewards"],
+        metadatas=[{"document_id": 1, "chunk_index": 0}, {"document_id": 1, "chunk_index": 1}],
+    )
+    app.dependency_overrides[get_current_admin_user] = lambda: None
+    try:
+        response = TestClient(app).post(f"{settings.API_V1_STR}/lexical-index/rebuild")
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["indexed"] == 2
+    assert body["chunks"] == 2